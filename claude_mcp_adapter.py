@@ -1,12 +1,42 @@
 # claude_mcp_adapter.py
-import urequests
 import json
 from mcp_base import MCPAdapter
+from mcp_codec import codificar, EncodedBody, fragmentos_lista, fragmentos_objeto, TEXTO_ESTANDAR, ToolSchemaCache
+from mcp_json import compilar_rutas
+from mcp_resilience import ESTADOS_REINTENTABLES, error_estructurado
+from mcp_transport import EncodedHeaders
+
+# Marca de caché de prompt de Anthropic (el prefijo hasta aquí se reutiliza durante unos minutos)
+_EFIMERO = {"type": "ephemeral"}
+
+# Código HTTP equivalente a cada tipo de error que Anthropic envía dentro del stream
+_ESTADOS_ERROR_STREAM = {
+    "invalid_request_error": 400,
+    "authentication_error": 401,
+    "permission_error": 403,
+    "not_found_error": 404,
+    "request_too_large": 413,
+    "rate_limit_error": 429,
+    "api_error": 500,
+    "overloaded_error": 529
+}
 
 class ClaudeMCPAdapter(MCPAdapter):
     """Adaptador MCP para la API de Anthropic Claude"""
     
-    def __init__(self, api_key, modelo="claude-3-sonnet-20240229", max_tokens=50, temperatura=0.7):
+    nombre_proveedor = "Claude"
+    familia_tokens = "claude"
+    _cache_herramientas = ToolSchemaCache()
+    # Herramientas con la marca de caché de prompt en la última definición
+    _cache_herramientas_efimeras = ToolSchemaCache()
+    
+    # Partes de la respuesta que se extraen del JSON recibido; el resto se descarta al leer
+    _arbol_respuesta = compilar_rutas([
+        ("content", "*"),
+        ("usage",),
+    ])
+    
+    def __init__(self, api_key, modelo="claude-3-sonnet-20240229", max_tokens=50, temperatura=0.7, transporte=None):
         """
         Inicializa el adaptador para Claude.
         
@@ -15,62 +45,242 @@ class ClaudeMCPAdapter(MCPAdapter):
             modelo (str): Modelo a utilizar (por defecto 'claude-3-sonnet-20240229')
             max_tokens (int): Número máximo de tokens en la respuesta
             temperatura (float): Nivel de aleatoriedad (0.0-1.0)
+            transporte (Transport): Transporte HTTP (por defecto el pool keep-alive compartido)
         """
-        super().__init__(api_key, modelo, max_tokens, temperatura)
+        super().__init__(api_key, modelo, max_tokens, temperatura, transporte)
         self.url = "https://api.anthropic.com/v1/messages"
+        # Caché de prompt: system, herramientas y prefijo del historial se marcan como reutilizables
+        self._cache_prompt = True
     
-    def _realizar_peticion(self, functions, function_call):
+    @property
+    def cache_prompt(self):
+        """Si se añaden marcas cache_control a system, herramientas y último mensaje."""
+        return self._cache_prompt
+    
+    @cache_prompt.setter
+    def cache_prompt(self, activo):
+        self._cache_prompt = activo
+        self._cache_system = None
+    
+    def _preparar_peticion(self, functions, function_call, stream=False):
         """
-        Realiza la petición a la API de Claude.
+        Construye la petición a la API de Claude.
         
         Args:
             functions (list): Funciones disponibles en formato OpenAI (estándar)
-            function_call (str): Modo de llamada a funciones (ignorado por Claude)
+            function_call (str): Modo de llamada a funciones ("auto", "none", "required" o nombre)
+            stream (bool): Si se solicita la respuesta en streaming
             
         Returns:
-            dict: Respuesta cruda de Claude o None si hay error
+            tuple: (url, headers, cuerpo) de la petición
         """
-        headers = {
-            "x-api-key": self.api_key,
-            "anthropic-version": "2023-06-01",
-            "content-type": "application/json"
-        }
+        plantilla = self._plantilla_peticion()
         
-        # Construir la estructura de datos para Claude
-        data = {
-            "model": self.modelo,
-            "messages": self.historial.copy(),
-            "max_tokens": self.max_tokens
-        }
+        # Mensajes ya codificados; el último se vuelve a codificar con la marca de caché para que
+        # todo el prefijo de la conversación se reutilice en la siguiente petición
+        messages = self._mensajes_codificados()
+        if self._cache_prompt and messages:
+            ultimo = self._codificar_con_cache(self.historial[-1])
+            if ultimo is not None:
+                messages = messages[:-1] + [ultimo]
         
-        # Añadir temperatura si está especificada
-        if self.temperatura is not None:
-            data["temperature"] = self.temperatura
+        # Construir la estructura de datos para Claude a partir de los mensajes ya codificados
+        campos = plantilla["inicio"] + [("messages", fragmentos_lista(messages))] + plantilla["fin"]
         
         # Añadir mensaje de sistema si existe
         if self.system:
-            data["system"] = self.system
+            campos.append(("system", self._system_codificado()))
         
-        # Convertir y añadir herramientas si existen
+        # Añadir herramientas si existen (convertidas y codificadas una sola vez)
         if functions is not None:
-            claude_tools = self._convertir_funciones(functions)
-            data["tools"] = claude_tools
-        
-        try:
-            print("Enviando consulta a Claude...")
-            response = urequests.post(self.url, headers=headers, data=json.dumps(data).encode("utf-8"))
-            
-            if response.status_code == 200:
-                result = response.json()
-                response.close()
-                return result
-            else:
-                print(f"Error: {response.status_code} - {response.text}")
-                response.close()
+            campos.append(("tools", self._herramientas_codificadas(functions)))
+            
+            # Claude elige herramienta por defecto; el resto de modos van en tool_choice
+            if function_call != "auto":
+                campos.append(("tool_choice", codificar(self._convertir_function_call(function_call))))
+        
+        # Solicitar la respuesta como eventos SSE
+        if stream:
+            campos.append(("stream", b"true"))
+        
+        return self.url, plantilla["headers"], EncodedBody(fragmentos_objeto(campos))
+    
+    def _compilar_plantilla(self):
+        """
+        Codifica las cabeceras y los campos fijos de la petición a Claude.
+        
+        Returns:
+            dict: headers, e "inicio"/"fin" con los campos antes y después de messages
+        """
+        fin = [("max_tokens", codificar(self.max_tokens))]
+        
+        # Añadir temperatura si está especificada
+        if self.temperatura is not None:
+            fin.append(("temperature", codificar(self.temperatura)))
+        
+        return {
+            "headers": EncodedHeaders({
+                "x-api-key": self.api_key,
+                "anthropic-version": "2023-06-01",
+                "content-type": "application/json"
+            }),
+            "inicio": [("model", codificar(self.modelo))],
+            "fin": fin
+        }
+    
+    def _convertir_function_call(self, function_call):
+        """
+        Convierte el modo de llamada a funciones al campo tool_choice de Claude.
+        
+        Args:
+            function_call (str/dict): "none", "required", nombre de función o {"name": ...}
+            
+        Returns:
+            dict: Valor de tool_choice
+        """
+        if function_call == "none":
+            return {"type": "none"}
+        if function_call == "required":
+            return {"type": "any"}
+        if isinstance(function_call, dict):
+            function_call = function_call["name"]
+        return {"type": "tool", "name": function_call}
+    
+    def _mensaje_nativo(self, mensaje):
+        """
+        Convierte un mensaje del historial a la estructura de Claude, incluidas
+        las llamadas a herramientas y sus resultados.
+        
+        Args:
+            mensaje (Message): Mensaje del historial
+            
+        Returns:
+            dict: Mensaje {"role", "content"} en formato Claude
+        """
+        if "tool_calls" in mensaje:
+            return {
+                "role": "assistant",
+                "content": [{
+                    "type": "tool_use",
+                    "id": llamada["id"],
+                    "name": llamada["name"],
+                    "input": json.loads(llamada["arguments"])
+                } for llamada in mensaje["tool_calls"]]
+            }
+        
+        # Todos los resultados van en un único mensaje de usuario
+        if "tool_results" in mensaje:
+            return {
+                "role": "user",
+                "content": [{
+                    "type": "tool_result",
+                    "tool_use_id": resultado["id"],
+                    "content": resultado["content"]
+                } for resultado in mensaje["tool_results"]]
+            }
+        
+        return {"role": mensaje["role"], "content": mensaje["content"]}
+    
+    def _codificar_mensaje(self, mensaje):
+        """
+        Codifica un mensaje del historial con la estructura de Claude.
+        
+        Args:
+            mensaje (Message): Mensaje del historial
+            
+        Returns:
+            bytes: Mensaje en formato Claude
+        """
+        if "tool_calls" in mensaje or "tool_results" in mensaje:
+            return codificar(self._mensaje_nativo(mensaje))
+        # Los mensajes de texto tienen la misma forma {"role", "content"} que el estándar
+        return TEXTO_ESTANDAR.codificar(mensaje)
+    
+    def _codificar_con_cache(self, mensaje):
+        """
+        Codifica un mensaje marcando su último bloque con cache_control.
+        
+        Args:
+            mensaje (Message): Mensaje del historial
+            
+        Returns:
+            bytes: Mensaje codificado, o None si no tiene contenido que marcar
+        """
+        nativo = self._mensaje_nativo(mensaje)
+        contenido = nativo["content"]
+        if isinstance(contenido, str):
+            # Claude rechaza bloques de texto vacíos
+            if not contenido:
                 return None
-        except Exception as e:
-            print(f"Excepción: {e}")
-            return None
+            contenido = [{"type": "text", "text": contenido}]
+        else:
+            contenido = contenido[:-1] + [dict(contenido[-1])]
+        contenido[-1]["cache_control"] = _EFIMERO
+        return codificar({"role": nativo["role"], "content": contenido})
+    
+    def _codificar_system(self, system):
+        """
+        Codifica el mensaje de sistema, como bloque con cache_control si la caché de prompt está activa.
+        
+        Args:
+            system (str): Mensaje de sistema
+            
+        Returns:
+            bytes: Campo system codificado
+        """
+        if self._cache_prompt:
+            return codificar([{"type": "text", "text": system, "cache_control": _EFIMERO}])
+        return codificar(system)
+    
+    def _herramientas_codificadas(self, functions):
+        """
+        Devuelve las herramientas de Claude codificadas, con la marca de caché en la
+        última definición si la caché de prompt está activa.
+        
+        Args:
+            functions (list): Funciones en formato OpenAI (estándar)
+            
+        Returns:
+            bytes: Herramientas codificadas
+        """
+        cache = self._cache_herramientas_efimeras if self._cache_prompt else self._cache_herramientas
+        return cache.obtener(functions, self._herramientas_nativas)[1]
+    
+    def _herramientas_nativas(self, functions):
+        """
+        Convierte las funciones al formato de Claude y marca la última con cache_control
+        si la caché de prompt está activa (la marca cubre todas las definiciones anteriores).
+        
+        Args:
+            functions (list): Funciones en formato OpenAI (estándar)
+            
+        Returns:
+            list: Herramientas en formato Claude
+        """
+        herramientas = self._convertir_funciones(functions)
+        if self._cache_prompt and herramientas:
+            herramientas[-1] = dict(herramientas[-1])
+            herramientas[-1]["cache_control"] = _EFIMERO
+        return herramientas
+    
+    def consultar_lote(self, conversaciones, functions=None, function_call="auto", concurrencia=4, intervalo=10):
+        """
+        Procesa muchas conversaciones independientes con la Message Batches API de Anthropic
+        (mitad de precio, resultados en minutos u horas).
+        
+        Args:
+            conversaciones (dict/list): {custom_id: mensajes} o lista de listas de mensajes
+            functions (list): Lista opcional de funciones disponibles para el modelo
+            function_call (str): Modo de llamada a funciones
+            concurrencia (int): No se usa, el proveedor procesa el lote
+            intervalo (float): Espera inicial entre consultas del estado del lote, en segundos
+            
+        Yields:
+            tuple: (custom_id, respuesta) con la respuesta en formato estandarizado o un error
+                   estructurado si esa conversación falló
+        """
+        from mcp_batch import lote_claude
+        return lote_claude(self, conversaciones, functions, function_call, intervalo)
     
     def _procesar_respuesta(self, response):
         """
@@ -84,15 +294,14 @@ class ClaudeMCPAdapter(MCPAdapter):
         """
         content_blocks = response["content"]
         
-        # Buscar si hay tool_use (function call) en la respuesta
-        for block in content_blocks:
-            if block.get("type") == "tool_use":
-                tool_use = block["tool_use"]
-                return {
-                    "type": "function_call",
-                    "name": tool_use["name"],
-                    "arguments": json.dumps(tool_use["input"])
-                }
+        # Recoger todos los bloques tool_use (el modelo puede pedir varias herramientas a la vez)
+        llamadas = [{
+            "id": block["id"],
+            "name": block["name"],
+            "arguments": json.dumps(block["input"])
+        } for block in content_blocks if block.get("type") == "tool_use"]
+        if llamadas:
+            return self._respuesta_llamadas(llamadas)
         
         # Si no hay tool_use, es una respuesta de texto normal
         respuesta_assistant = ""
@@ -108,6 +317,107 @@ class ClaudeMCPAdapter(MCPAdapter):
             "content": respuesta_assistant
         }
     
+    def _extraer_uso(self, response):
+        """
+        Extrae el consumo de tokens del campo usage de la respuesta de Claude.
+        
+        Args:
+            response (dict): Respuesta cruda de Claude
+            
+        Returns:
+            dict: {"input_tokens": int, "output_tokens": int} o None si no se informa
+        """
+        uso = response.get("usage")
+        if not uso:
+            return None
+        return self._convertir_uso(uso)
+    
+    def _convertir_uso(self, uso):
+        """
+        Convierte el campo usage de Claude al formato estándar, con los tokens
+        leídos y escritos en la caché de prompt.
+        
+        Args:
+            uso (dict): Campo usage de Claude
+            
+        Returns:
+            dict: {"input_tokens", "output_tokens", "cache_read_tokens", "cache_write_tokens"}
+        """
+        return {
+            "input_tokens": uso.get("input_tokens") or 0,
+            "output_tokens": uso.get("output_tokens") or 0,
+            "cache_read_tokens": uso.get("cache_read_input_tokens") or 0,
+            "cache_write_tokens": uso.get("cache_creation_input_tokens") or 0
+        }
+    
+    def _procesar_evento_stream(self, evento, datos, estado):
+        """
+        Procesa un evento del stream de Claude (message_start, content_block_delta, etc.).
+        
+        Args:
+            evento (str): Nombre del evento SSE
+            datos (str): JSON del evento
+            estado (dict): Estado acumulado del stream
+            
+        Returns:
+            list: Fragmentos estandarizados
+        """
+        evento_obj = json.loads(datos)
+        tipo = evento_obj.get("type", evento)
+        
+        # Inicio de un bloque tool_use: el nombre llega aquí y los argumentos en los deltas
+        if tipo == "content_block_start":
+            block = evento_obj["content_block"]
+            if block.get("type") == "tool_use":
+                estado["llamadas"].append({"id": block["id"], "name": block["name"], "arguments": ""})
+                return [{
+                    "type": "function_call_delta",
+                    "index": len(estado["llamadas"]) - 1,
+                    "name": block["name"],
+                    "arguments": ""
+                }]
+        
+        elif tipo == "content_block_delta":
+            delta = evento_obj["delta"]
+            
+            if delta.get("type") == "text_delta":
+                estado["texto"] += delta["text"]
+                return [{
+                    "type": "text_delta",
+                    "content": delta["text"]
+                }]
+            
+            # Los argumentos llegan en orden para el último bloque tool_use abierto
+            if delta.get("type") == "input_json_delta" and estado["llamadas"]:
+                estado["llamadas"][-1]["arguments"] += delta["partial_json"]
+                return [{
+                    "type": "function_call_delta",
+                    "index": len(estado["llamadas"]) - 1,
+                    "name": None,
+                    "arguments": delta["partial_json"]
+                }]
+        
+        # Consumo: la entrada y la caché llegan al inicio, la salida acumulada en message_delta
+        elif tipo == "message_start":
+            uso = evento_obj.get("message", {}).get("usage")
+            if uso:
+                estado["usage"] = self._convertir_uso(uso)
+        
+        elif tipo == "message_delta":
+            uso = evento_obj.get("usage")
+            if uso and "usage" in estado:
+                estado["usage"]["output_tokens"] = uso.get("output_tokens") or 0
+        
+        # Error a mitad del stream: se guarda para que la respuesta final sea el error
+        elif tipo == "error":
+            error = evento_obj.get("error") or {}
+            status = _ESTADOS_ERROR_STREAM.get(error.get("type"))
+            estado["error"] = error_estructurado(status, error.get("message") or str(error),
+                                                 status in ESTADOS_REINTENTABLES)
+        
+        # message_start, content_block_stop, message_delta, message_stop y ping no generan fragmentos
+        return []
+    
     def _convertir_funciones(self, functions):
         """
         Convierte las funciones del formato OpenAI al formato de Claude.
@@ -1,11 +1,36 @@
-import urequests
 import json
 from mcp_base import MCPAdapter
+from mcp_codec import codificar, EncodedBody, fragmentos_lista, fragmentos_objeto, TextMessageEncoder, ToolSchemaCache
+from mcp_json import compilar_rutas
+from mcp_resilience import error_estructurado
+from mcp_transport import EncodedHeaders
+
+# Motivos de fin con los que el candidato trae una respuesta utilizable; el resto
+# (SAFETY, RECITATION, BLOCKLIST...) indica que Gemini la bloqueó o la cortó
+_FINES_NORMALES = ("STOP", "MAX_TOKENS", "FINISH_REASON_UNSPECIFIED")
+
+# Mensajes de texto {"role", "parts": [{"text"}]}; Gemini usa "model" en lugar de "assistant"
+_TEXTO_GEMINI = TextMessageEncoder('{"role": {rol}, "parts": [{"text": ', b"}]}", {"assistant": "model"})
 
 class GeminiMCPAdapter(MCPAdapter):
     """Adaptador MCP para la API de Google Gemini"""
     
-    def __init__(self, api_key, modelo="gemini-2.0-flash", max_tokens=50, temperatura=0.7):
+    nombre_proveedor = "Gemini"
+    familia_tokens = "gemini"
+    _cache_herramientas = ToolSchemaCache()
+    
+    # Partes de la respuesta que se extraen del JSON recibido; el resto se descarta al leer
+    _arbol_respuesta = compilar_rutas([
+        ("candidates", 0, "content"),
+        ("candidates", 0, "text"),
+        ("candidates", 0, "functionCall"),
+        ("candidates", 0, "functionCalls"),
+        ("candidates", 0, "finishReason"),
+        ("promptFeedback",),
+        ("usageMetadata",),
+    ])
+    
+    def __init__(self, api_key, modelo="gemini-2.0-flash", max_tokens=50, temperatura=0.7, transporte=None):
         """
         Inicializa el adaptador para Gemini.
         
@@ -14,109 +39,164 @@ class GeminiMCPAdapter(MCPAdapter):
             modelo (str): Modelo a utilizar (por defecto 'gemini-2.0-flash')
             max_tokens (int): Número máximo de tokens en la respuesta
             temperatura (float): Nivel de aleatoriedad (0.0-1.0)
+            transporte (Transport): Transporte HTTP (por defecto el pool keep-alive compartido)
         """
-        super().__init__(api_key, modelo, max_tokens, temperatura)
+        super().__init__(api_key, modelo, max_tokens, temperatura, transporte)
         self.base_url = "https://generativelanguage.googleapis.com/v1beta"
         # Almacenar la última respuesta recibida para depuración
         self.ultima_respuesta = None
     
-    def agregar_mensaje(self, rol, contenido):
-        """
-        Sobrescribe el método para manejar la conversión de roles específica de Gemini.
-        
-        Args:
-            rol (str): Rol del mensaje ('system', 'user', 'assistant')
-            contenido (str): Contenido del mensaje
-        """
-        if rol == "system":
-            self.system = contenido
-        else:
-            # Gemini usa "model" en lugar de "assistant"
-            rol_gemini = "model" if rol == "assistant" else rol
-            self.historial.append({"role": rol_gemini, "content": contenido})
+    @property
+    def base_url(self):
+        """URL base de la API; forma parte de la plantilla de la petición."""
+        return self._base_url
     
-    def _realizar_peticion(self, functions, function_call):
+    @base_url.setter
+    def base_url(self, url):
+        self._base_url = url
+        self._plantilla = None
+    
+    def _preparar_peticion(self, functions, function_call, stream=False):
         """
-        Realiza la petición a la API de Gemini.
+        Construye la petición a la API de Gemini.
         
         Args:
             functions (list): Funciones disponibles en formato OpenAI (estándar)
             function_call (str): Modo de llamada a funciones
+            stream (bool): Si se solicita la respuesta en streaming
             
         Returns:
-            dict: Respuesta cruda de Gemini o None si hay error
+            tuple: (url, headers, cuerpo) de la petición
         """
-        # URL con la API key
-        url = f"{self.base_url}/models/{self.modelo}:generateContent?key={self.api_key}"
+        plantilla = self._plantilla_peticion()
         
-        # Transformar historial para el formato Gemini
-        contents = []
+        # Historial ya codificado en formato Gemini
+        contents = self._mensajes_codificados()
         
         # Agregar mensaje del sistema si existe
         if self.system:
-            contents.append({
-                "role": "user",
-                "parts": [{"text": f"system: {self.system}"}]
-            })
-        
-        # Agregar el resto de mensajes
-        for msg in self.historial:
-            contents.append({
-                "role": msg["role"],
-                "parts": [{"text": msg["content"]}]
-            })
+            contents = [self._system_codificado()] + contents
         
         # Imprimir el historial para depuración
-        #print(f"Historial a enviar: {json.dumps(contents)}")
+        #print(f"Historial a enviar: {contents}")
         
-        data = {
-            "contents": contents,
-            "generationConfig": {
-                "temperature": self.temperatura,
-                "maxOutputTokens": self.max_tokens,
-                "topP": 0.95,
-                "topK": 40
-            }
-        }
+        campos = [("contents", fragmentos_lista(contents))] + plantilla["fin"]
         
         # Agregar funciones si existen
         if functions is not None:
-            # Convertir el formato de OpenAI a Gemini
-            gemini_functions = self._convertir_funciones(functions)
-            data["tools"] = [{
-                "functionDeclarations": gemini_functions
-            }]
+            # Herramientas en formato Gemini, convertidas y codificadas una sola vez
+            campos.append(("tools", self._herramientas_codificadas(functions)))
             
             # En Gemini 2.0+, el modo auto es predeterminado
             if function_call != "auto":
-                data["toolConfig"] = {
-                    "functionCallingConfig": {
-                        "mode": function_call
-                    }
-                }
+                campos.append(("toolConfig", codificar({
+                    "functionCallingConfig": self._convertir_function_call(function_call)
+                })))
         
-        headers = {
-            "Content-Type": "application/json"
+        # URL con la API key (streamGenerateContent con alt=sse entrega eventos SSE)
+        url = plantilla["url_stream"] if stream else plantilla["url"]
+        
+        return url, plantilla["headers"], EncodedBody(fragmentos_objeto(campos))
+    
+    def _compilar_plantilla(self):
+        """
+        Codifica las URL, las cabeceras y la configuración de generación de la petición a Gemini.
+        
+        Returns:
+            dict: url, url_stream, headers y "fin" con los campos tras contents
+        """
+        return {
+            "url": f"{self.base_url}/models/{self.modelo}:generateContent?key={self.api_key}",
+            "url_stream": f"{self.base_url}/models/{self.modelo}:streamGenerateContent?alt=sse&key={self.api_key}",
+            "headers": EncodedHeaders({
+                "Content-Type": "application/json"
+            }),
+            "inicio": [],
+            "fin": [("generationConfig", codificar({
+                "temperature": self.temperatura,
+                "maxOutputTokens": self.max_tokens,
+                "topP": 0.95,
+                "topK": 40
+            }))]
         }
+    
+    def _convertir_function_call(self, function_call):
+        """
+        Convierte el modo de llamada a funciones a functionCallingConfig de Gemini.
         
-        try:
-            print("Enviando consulta a Gemini...")
-            response = urequests.post(url, headers=headers, data=json.dumps(data).encode("utf-8"))
+        Args:
+            function_call (str/dict): "none", "required", modo de Gemini, nombre de función o {"name": ...}
             
-            if response.status_code == 200:
-                result = response.json()
-                # Guardar la respuesta para depuración
-                self.ultima_respuesta = result
-                #print(f"Respuesta de Gemini: {json.dumps(result)}")
-                response.close()
-                return result
-            else:
-                print(f"Error: {response.status_code} - {response.text}")
-                response.close()
-                return None
-        except Exception as e:
-            print(f"Excepción: {e}")
-            return None
+        Returns:
+            dict: Valor de functionCallingConfig
+        """
+        if function_call == "none":
+            return {"mode": "NONE"}
+        if function_call == "required":
+            return {"mode": "ANY"}
+        if function_call in ("AUTO", "ANY", "NONE"):
+            return {"mode": function_call}
+        if isinstance(function_call, dict):
+            function_call = function_call["name"]
+        return {"mode": "ANY", "allowedFunctionNames": [function_call]}
+    
+    def _herramientas_nativas(self, functions):
+        """
+        Construye el campo tools de Gemini a partir de las funciones convertidas.
+        
+        Args:
+            functions (list): Funciones en formato OpenAI (estándar)
+            
+        Returns:
+            list: Lista con un objeto functionDeclarations
+        """
+        return [{
+            "functionDeclarations": self._convertir_funciones(functions)
+        }]
+    
+    def _codificar_mensaje(self, mensaje):
+        """
+        Codifica un mensaje del historial con la estructura de Gemini.
+        
+        Args:
+            mensaje (Message): Mensaje del historial
+            
+        Returns:
+            bytes: Contenido {"role", "parts"} codificado
+        """
+        # Llamadas a funciones del modelo y sus resultados como partes functionCall/functionResponse
+        if "tool_calls" in mensaje:
+            return codificar({
+                "role": "model",
+                "parts": [{
+                    "functionCall": {"name": llamada["name"], "args": json.loads(llamada["arguments"])}
+                } for llamada in mensaje["tool_calls"]]
+            })
+        
+        if "tool_results" in mensaje:
+            return codificar({
+                "role": "user",
+                "parts": [{
+                    "functionResponse": {"name": resultado["name"], "response": {"result": resultado["content"]}}
+                } for resultado in mensaje["tool_results"]]
+            })
+        
+        return _TEXTO_GEMINI.codificar(mensaje)
+    
+    def _codificar_system(self, system):
+        """
+        Codifica el mensaje de sistema como un mensaje de usuario inicial.
+        
+        Args:
+            system (str): Mensaje de sistema
+            
+        Returns:
+            bytes: Contenido {"role", "parts"} codificado
+        """
+        return codificar({
+            "role": "user",
+            "parts": [{"text": f"system: {system}"}]
+        })
     
     def _procesar_respuesta(self, response):
         """
@@ -128,18 +208,22 @@ class GeminiMCPAdapter(MCPAdapter):
         Returns:
             dict: Respuesta procesada en formato estándar
         """
+        # Guardar la respuesta para depuración
+        self.ultima_respuesta = response
+        #print(f"Respuesta de Gemini: {json.dumps(response)}")
+        
         # Verificar si hay candidatos en la respuesta
         if "candidates" in response and response["candidates"]:
             candidate = response["candidates"][0]
             
-            # Extraer llamada a función si existe
-            function_call_data = self._extraer_function_call(candidate)
-            if function_call_data:
-                return {
-                    "type": "function_call",
-                    "name": function_call_data["name"],
-                    "arguments": function_call_data["arguments"]
-                }
+            # Extraer las llamadas a funciones si existen (puede haber varias)
+            llamadas = self._extraer_function_calls(candidate)
+            if llamadas:
+                return self._respuesta_llamadas(llamadas)
+            
+            error = self._error_fin(candidate)
+            if error is not None:
+                return error
             
             # Es una respuesta de texto normal
             respuesta_text = None
@@ -184,7 +268,7 @@ class GeminiMCPAdapter(MCPAdapter):
                 respuesta_text = "Recibido mensaje vacío del modelo tras procesar la operación."
             
             # Guardar en el historial (convertir de "model" a "assistant" para el estándar MCP)
-            self.historial.append({"role": "assistant", "content": respuesta_text})
+            self.agregar_mensaje("assistant", respuesta_text)
             
             return {
                 "type": "text",
@@ -202,53 +286,130 @@ class GeminiMCPAdapter(MCPAdapter):
             except:
                 return None
     
-    def _extraer_function_call(self, candidate):
+    def _extraer_function_calls(self, candidate, inicio=0):
         """
-        Extrae la información de llamada a función de la respuesta de Gemini.
+        Extrae todas las llamadas a funciones de la respuesta de Gemini.
+        Gemini no siempre asigna id a las llamadas, así que se genera uno por posición.
         
         Args:
             candidate (dict): Candidato de respuesta de Gemini
+            inicio (int): Posición de la primera llamada (para numerar los ids en streaming)
             
         Returns:
-            dict: Información de la llamada a función o None
+            list: Llamadas {"id", "name", "arguments"} (vacía si no hay)
         """
+        function_calls = []
         try:
+            content = candidate.get("content", {})
+            
             # Buscar en parts[].functionCall (formato en Gemini 2.0)
-            if "content" in candidate and "parts" in candidate["content"]:
-                for part in candidate["content"]["parts"]:
-                    if "functionCall" in part:
-                        return {
-                            "name": part["functionCall"]["name"],
-                            "arguments": json.dumps(part["functionCall"]["args"])
-                        }
+            for part in content.get("parts", []):
+                if "functionCall" in part:
+                    function_calls.append(part["functionCall"])
             
             # Buscar en functionCalls[] (formato alternativo)
-            if "content" in candidate and "functionCalls" in candidate["content"]:
-                function_call = candidate["content"]["functionCalls"][0]
-                return {
-                    "name": function_call["name"],
-                    "arguments": json.dumps(function_call["args"])
-                }
+            if not function_calls:
+                function_calls = content.get("functionCalls", [])
                 
             # Buscar directamente en el candidato por si la estructura es diferente
-            if "functionCall" in candidate:
-                return {
-                    "name": candidate["functionCall"]["name"],
-                    "arguments": json.dumps(candidate["functionCall"]["args"])
-                }
+            if not function_calls and "functionCall" in candidate:
+                function_calls = [candidate["functionCall"]]
                 
             # Otra estructura alternativa
-            if "functionCalls" in candidate:
-                function_call = candidate["functionCalls"][0]
-                return {
-                    "name": function_call["name"],
-                    "arguments": json.dumps(function_call["args"])
-                }
+            if not function_calls:
+                function_calls = candidate.get("functionCalls", [])
+            
+            return [{
+                "id": function_call.get("id") or f"call_{inicio + i}",
+                "name": function_call["name"],
+                "arguments": json.dumps(function_call.get("args", {}))
+            } for i, function_call in enumerate(function_calls)]
         except Exception as e:
             print(f"Error al extraer function call: {e}")
+            return []
+    
+    def _extraer_uso(self, response):
+        """
+        Extrae el consumo de tokens del campo usageMetadata de la respuesta de Gemini.
+        
+        Args:
+            response (dict): Respuesta cruda de Gemini
+            
+        Returns:
+            dict: {"input_tokens": int, "output_tokens": int} o None si no se informa
+        """
+        uso = response.get("usageMetadata")
+        if not uso:
             return None
+        return {
+            "input_tokens": uso.get("promptTokenCount", 0),
+            "output_tokens": uso.get("candidatesTokenCount", 0)
+        }
+    
+    def _procesar_evento_stream(self, evento, datos, estado):
+        """
+        Procesa un evento del stream de Gemini (streamGenerateContent con alt=sse).
+        Cada evento es una respuesta parcial con la misma estructura que generateContent.
+        
+        Args:
+            evento (str): Nombre del evento SSE (Gemini no lo utiliza)
+            datos (str): JSON de la respuesta parcial
+            estado (dict): Estado acumulado del stream
             
-        return None
+        Returns:
+            list: Fragmentos estandarizados
+        """
+        chunk = json.loads(datos)
+        if not chunk.get("candidates"):
+            return []
+        
+        candidate = chunk["candidates"][0]
+        fragmentos = []
+        
+        # Gemini entrega cada llamada a función completa en un único evento
+        llamadas = self._extraer_function_calls(candidate, len(estado["llamadas"]))
+        if llamadas:
+            for llamada in llamadas:
+                estado["llamadas"].append(llamada)
+                fragmentos.append({
+                    "type": "function_call_delta",
+                    "index": len(estado["llamadas"]) - 1,
+                    "name": llamada["name"],
+                    "arguments": llamada["arguments"]
+                })
+            return fragmentos
+        
+        # El error se entrega al terminar el stream, en lugar de la respuesta
+        error = self._error_fin(candidate)
+        if error is not None:
+            estado["error"] = error
+        
+        for part in candidate.get("content", {}).get("parts", []):
+            if "text" in part and part["text"]:
+                estado["texto"] += part["text"]
+                fragmentos.append({
+                    "type": "text_delta",
+                    "content": part["text"]
+                })
+        
+        return fragmentos
+    
+    def _error_fin(self, candidate):
+        """
+        Comprueba si Gemini bloqueó o cortó el candidato (finishReason SAFETY, RECITATION...).
+        
+        Args:
+            candidate (dict): Candidato de respuesta de Gemini
+            
+        Returns:
+            dict: Error estructurado con la clave "finish_reason", o None si terminó con normalidad
+        """
+        motivo = candidate.get("finishReason")
+        if motivo is None or motivo in _FINES_NORMALES:
+            return None
+        error = error_estructurado(None, f"Gemini detuvo la respuesta: {motivo}", False)
+        error["finish_reason"] = motivo
+        return error
     
     def _convertir_funciones(self, functions):
         """
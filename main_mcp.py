@@ -3,6 +3,11 @@ import json
 
 import json, time, sys, gc
 
+try:
+    import asyncio
+except ImportError:
+    import uasyncio as asyncio
+
 def clear_memory():
     gc.collect()
 
@@ -11,7 +16,7 @@ if "/my_modules" not in sys.path:
 
 from network_iot import Network
 from mcp_factory import MCPFactory
-from tools import suma, resta, multiplicacion, functions_list_data
+from tools import registry
 
 # Configuración de la red
 ssid = "SSID"
@@ -28,60 +33,26 @@ OPENAI_API_KEY = "OPENAI_API_KEY"
 CLAUDE_API_KEY = "CLAUDE_API_KEY"
 GEMINI_API_KEY = "GEMINI_API_KEY"
 
-def procesar_resultado(respuesta, modelo_nombre, adapter):
+def mostrar_resultado_agente(respuesta, proveedor):
     """
-    Procesa el resultado de una consulta a un LLM.
+    Muestra la respuesta final de run_agent() y el resumen del bucle.
     
     Args:
-        respuesta (dict): Respuesta estandarizada del adaptador MCP
-        modelo_nombre (str): Nombre del modelo para los mensajes
-        adapter: Instancia del adaptador MCP usado
-    
-    Returns:
-        Resultado de la operación si es llamada a función, o la respuesta de texto
+        respuesta (dict): Respuesta devuelta por run_agent()
+        proveedor (str): Nombre del proveedor para los mensajes
     """
-    if respuesta and respuesta.get("type") == "function_call":
-        # Parsear la llamada a la función
-        fn_name = respuesta["name"]
-        try:
-            args = json.loads(respuesta["arguments"])
-        except:
-            # Si ya es un diccionario
-            if isinstance(respuesta["arguments"], dict):
-                args = respuesta["arguments"]
-            else:
-                args = {}
-        
-        print(f"El modelo {modelo_nombre} ha solicitado la función: {fn_name}")
-        print(f"Con los argumentos: {args}")
-        
-        # Ejecutar la función solicitada
-        result = None
-        if fn_name == "suma":
-            result = suma(args["a"], args["b"])
-        elif fn_name == "resta":
-            result = resta(args["a"], args["b"])
-        elif fn_name == "multiplicacion":
-            result = multiplicacion(args["a"], args["b"])
-        else:
-            result = "Función no reconocida."
-            
-        print("Resultado de la operación: ", result)
-        
-        # Agregar el resultado al historial
-        mensaje_asistente = f"El resultado de la operación es: {result}"
-        adapter.agregar_mensaje("assistant", mensaje_asistente)
-        
-        return result
+    agente = respuesta["agente"]
+    print(f"{proveedor}: {agente['iteraciones']} peticiones, {agente['tokens']} tokens, motivo: {agente['motivo']}")
     
-    elif respuesta and respuesta.get("type") == "text":
-        print(f"Respuesta de texto de {modelo_nombre}:")
+    if respuesta.get("type") == "text":
+        print(f"\nRespuesta final de {proveedor}:")
         print(respuesta["content"])
-        return respuesta["content"]
-    
+    elif respuesta.get("type") == "error":
+        print(f"Error de {proveedor}: {respuesta['status']} - {respuesta['message']}")
+        if respuesta["retryable"]:
+            print(f"Error transitorio, se puede reintentar en {respuesta['retry_after'] or 'unos'} s")
     else:
         print("No se pudo obtener una respuesta adecuada.")
-        return None
 
 def ejecutar_consulta(proveedor, api_key, consulta, modelo=None):
     """
@@ -112,18 +83,49 @@ def ejecutar_consulta(proveedor, api_key, consulta, modelo=None):
     adapter.agregar_mensaje("system", "Eres un asistente que ayuda con operaciones matemáticas básicas.")
     adapter.agregar_mensaje("user", consulta)
     
-    # Realizar la consulta con functions
-    respuesta = adapter.consultar(functions=functions_list_data, function_call="auto")
+    # Bucle de agente: ejecuta las funciones pedidas y devuelve los resultados al modelo
+    respuesta = adapter.run_agent(registry, max_iteraciones=4, max_segundos=60, max_tokens_totales=2000)
+    mostrar_resultado_agente(respuesta, proveedor)
+
+async def ejecutar_consulta_async(proveedor, api_key, consulta, modelo=None):
+    """
+    Versión asíncrona de ejecutar_consulta(): la espera de la red no bloquea
+    el resto de tareas del bucle de eventos.
     
-    if respuesta:
-        result = procesar_resultado(respuesta, proveedor, adapter)
-        
-        # Si fue una function_call, obtener una respuesta final
-        if respuesta.get("type") == "function_call":
-            respuesta_final = adapter.consultar()
-            if respuesta_final and respuesta_final.get("type") == "text":
-                print(f"\nRespuesta final de {proveedor}:")
-                print(respuesta_final["content"])
+    Args:
+        proveedor (str): Nombre del proveedor ("openai", "claude", "gemini")
+        api_key (str): Clave API del proveedor
+        consulta (str): Consulta del usuario
+        modelo (str): Modelo específico a usar (opcional)
+    """
+    try:
+        adapter = MCPFactory.create_adapter(
+            provider=proveedor,
+            api_key=api_key,
+            modelo=modelo,
+            max_tokens=100,
+            temperatura=0.7
+        )
+    except ValueError as e:
+        print(f"Error: {e}")
+        return
+    
+    # Configurar mensajes
+    adapter.agregar_mensaje("system", "Eres un asistente que ayuda con operaciones matemáticas básicas.")
+    adapter.agregar_mensaje("user", consulta)
+    
+    # Bucle de agente sin bloquear el resto de consultas
+    respuesta = await adapter.run_agent_async(registry, max_iteraciones=4, max_segundos=60, max_tokens_totales=2000)
+    print(f"\n--- RESULTADO DE {proveedor.upper()} ---")
+    mostrar_resultado_agente(respuesta, proveedor)
+
+async def main_async(consulta):
+    """Consulta a OpenAI, Claude y Gemini a la vez en el mismo bucle de eventos"""
+    await asyncio.gather(
+        ejecutar_consulta_async("openai", OPENAI_API_KEY, consulta),
+        ejecutar_consulta_async("claude", CLAUDE_API_KEY, consulta),
+        ejecutar_consulta_async("gemini", GEMINI_API_KEY, consulta)
+    )
 
 def main():
     """Función principal para probar los adaptadores MCP"""
@@ -133,14 +135,13 @@ def main():
     
     print(f"consulta: {consulta}")
     
-    # Probar con OpenAI
-    ejecutar_consulta("openai", OPENAI_API_KEY, consulta)
-    
-    # Descomenta para probar con Claude
-    ejecutar_consulta("claude", CLAUDE_API_KEY, consulta)
+    # Probar los tres proveedores a la vez (uasyncio / asyncio)
+    asyncio.run(main_async(consulta))
     
-    # Descomenta para probar con Gemini
-    ejecutar_consulta("gemini", GEMINI_API_KEY, consulta)
+    # O uno detrás de otro con la API síncrona:
+    # ejecutar_consulta("openai", OPENAI_API_KEY, consulta)
+    # ejecutar_consulta("claude", CLAUDE_API_KEY, consulta)
+    # ejecutar_consulta("gemini", GEMINI_API_KEY, consulta)
     
     # También puedes especificar modelos específicos:
     # ejecutar_consulta("claude", CLAUDE_API_KEY, consulta, "claude-3-7-sonnet-20250219")
@@ -1,5 +1,12 @@
 # mcp_base.py
 import json
+import time
+from mcp_codec import codificar, EncodedHistory, Message, TEXTO_ESTANDAR, ToolSchemaCache
+from mcp_json import compilar_rutas, extraer_json, extraer_json_async
+from mcp_metrics import nuevo_registro, reloj, ms_desde
+from mcp_resilience import (RetryPolicy, ESTADOS_REINTENTABLES, error_estructurado,
+                            error_excepcion, es_error, espera_indicada, interruptor_de)
+from mcp_transport import transporte_compartido
 
 class MCPAdapter:
     """
@@ -7,7 +14,20 @@ class MCPAdapter:
     Define la interfaz común que todos los adaptadores deben implementar.
     """
     
-    def __init__(self, api_key, modelo, max_tokens=50, temperatura=0.7):
+    # Nombre del proveedor para los mensajes de estado
+    nombre_proveedor = "LLM"
+    
+    # Familia de tokenizador con la que se estiman los tokens (clave de mcp_tokens.FAMILIAS)
+    familia_tokens = "openai"
+    
+    # Rutas de la respuesta JSON que necesita _procesar_respuesta(); el resto no se construye.
+    # La ruta vacía extrae el documento completo
+    _arbol_respuesta = compilar_rutas([()])
+    
+    # Esquemas de herramientas convertidos, compartidos por los adaptadores de la misma clase
+    _cache_herramientas = ToolSchemaCache()
+    
+    def __init__(self, api_key, modelo, max_tokens=50, temperatura=0.7, transporte=None):
         """
         Inicializa el adaptador MCP con configuraciones comunes.
         
@@ -16,26 +36,171 @@ class MCPAdapter:
             modelo (str): Identificador del modelo a utilizar
             max_tokens (int): Número máximo de tokens en la respuesta
             temperatura (float): Nivel de aleatoriedad en las respuestas (0.0-1.0)
+            transporte (Transport): Transporte HTTP (por defecto el pool keep-alive compartido)
         """
+        # Plantilla de las partes fijas de la petición; se recompila al cambiar su configuración
+        self._plantilla = None
         self.api_key = api_key
         self.modelo = modelo
         self.max_tokens = max_tokens
         self.temperatura = temperatura
         self.historial = []
         self.system = ""
+        # Caché de respuestas (ResponseCache), desactivada por defecto
+        self.cache = None
+        # Política de recorte del historial (HistoryPolicy) y mensajes fijados por id()
+        self.politica_historial = None
+        self._fijados = {}
+        # Estimador de tokens (TokenEstimator), creado la primera vez que se estima
+        self.estimador_tokens = None
+        # Reintentos ante errores transitorios (None para desactivarlos)
+        self.reintentos = RetryPolicy()
+        # Funciones que reciben el registro de métricas de cada consulta
+        self.hooks_metricas = []
+        # Diario en flash de la conversación (ConversationJournal), desactivado por defecto
+        self.journal = None
+        # Agrupador de peticiones idénticas simultáneas (RequestCoalescer), desactivado por defecto
+        self.coalescer = None
+        self.transporte = transporte if transporte is not None else transporte_compartido()
+        # Transporte no bloqueante, creado solo si se usa consultar_async()
+        self._transporte_async = None
+        # Mensajes del historial ya codificados y último mensaje de sistema codificado
+        self._historial_codificado = EncodedHistory(self._codificar_mensaje)
+        self._cache_system = None
+    
+    @property
+    def api_key(self):
+        """Clave API del proveedor."""
+        return self._api_key
+    
+    @api_key.setter
+    def api_key(self, valor):
+        self._api_key = valor
+        self._plantilla = None
+    
+    @property
+    def modelo(self):
+        """Identificador del modelo."""
+        return self._modelo
+    
+    @modelo.setter
+    def modelo(self, valor):
+        self._modelo = valor
+        self._plantilla = None
+    
+    @property
+    def max_tokens(self):
+        """Número máximo de tokens en la respuesta."""
+        return self._max_tokens
+    
+    @max_tokens.setter
+    def max_tokens(self, valor):
+        self._max_tokens = valor
+        self._plantilla = None
+    
+    @property
+    def temperatura(self):
+        """Nivel de aleatoriedad de las respuestas."""
+        return self._temperatura
+    
+    @temperatura.setter
+    def temperatura(self, valor):
+        self._temperatura = valor
+        self._plantilla = None
     
-    def agregar_mensaje(self, rol, contenido):
+    @property
+    def system(self):
+        """Mensaje de sistema."""
+        return self._system
+    
+    @system.setter
+    def system(self, valor):
+        self._system = valor
+        self._cache_system = None
+    
+    def agregar_mensaje(self, rol, contenido, fijar=False):
         """
         Agrega un mensaje al historial de conversación.
         
         Args:
             rol (str): Rol del mensaje ('system', 'user', 'assistant')
             contenido (str): Contenido del mensaje
+            fijar (bool): Si es True la política de historial nunca elimina este mensaje
         """
         if rol == "system":
             self.system = contenido
+            if self.journal is not None:
+                self.journal.anotar_system(contenido)
         else:
-            self.historial.append({"role": rol, "content": contenido})
+            mensaje = Message(rol, contenido)
+            self.historial.append(mensaje)
+            if fijar:
+                self._fijados[id(mensaje)] = mensaje
+            self._anotar(mensaje, fijar)
+    
+    def agregar_llamadas_herramientas(self, llamadas, resultados):
+        """
+        Agrega al historial las llamadas a herramientas del modelo y sus resultados,
+        para devolverlos todos en una única petición de seguimiento.
+        
+        Args:
+            llamadas (list): Llamadas {"id", "name", "arguments"} de la respuesta (clave "calls")
+            resultados (list): Resultado de cada llamada, en el mismo orden
+        """
+        llamada_msg = Message("assistant", "", tool_calls=llamadas)
+        resultado_msg = Message("tool", "", tool_results=[
+            {"id": llamada["id"], "name": llamada["name"], "content": str(resultado)}
+            for llamada, resultado in zip(llamadas, resultados)
+        ])
+        self.historial.append(llamada_msg)
+        self.historial.append(resultado_msg)
+        self._anotar(llamada_msg)
+        self._anotar(resultado_msg)
+    
+    def _anotar(self, mensaje, fijar=False):
+        """
+        Añade el mensaje al diario, si hay uno, y lo compacta cuando ha crecido demasiado.
+        
+        Args:
+            mensaje (Message): Mensaje recién agregado al historial
+            fijar (bool): Si el mensaje está fijado
+        """
+        if self.journal is None:
+            return
+        self.journal.anotar(mensaje, fijar)
+        if self.journal.necesita_compactar():
+            self.journal.compactar(self.historial, self.system, self._fijados)
+    
+    def reanudar(self, max_mensajes=None):
+        """
+        Recupera del diario la conversación guardada (por ejemplo tras un reinicio),
+        leyendo solo el mensaje de sistema, los mensajes fijados y la cola necesaria.
+        
+        Args:
+            max_mensajes (int): Mensajes a recuperar; por defecto el máximo de la
+                                política de historial o todos si no hay política
+            
+        Returns:
+            int: Número de mensajes recuperados
+            
+        Raises:
+            ValueError: Si el adaptador no tiene diario
+        """
+        if self.journal is None:
+            raise ValueError("El adaptador no tiene diario: asigne adapter.journal antes de reanudar.")
+        
+        if max_mensajes is None and self.politica_historial is not None:
+            max_mensajes = self.politica_historial.max_mensajes
+        
+        system, mensajes = self.journal.cargar(max_mensajes)
+        self.system = system
+        self.historial = []
+        self._fijados = {}
+        for mensaje, fijado in mensajes:
+            self.historial.append(mensaje)
+            if fijado:
+                self._fijados[id(mensaje)] = mensaje
+        return len(self.historial)
     
     def consultar(self, nuevos_mensajes=None, functions=None, function_call="auto"):
         """
@@ -49,36 +214,964 @@ class MCPAdapter:
         Returns:
             dict: Respuesta procesada con formato estandarizado
                  {"type": "text", "content": str} o
-                 {"type": "function_call", "name": str, "arguments": str}
+                 {"type": "function_call", "name": str, "arguments": str, "calls": list}
+                 (name y arguments son los de la primera llamada; calls contiene todas
+                 las llamadas {"id", "name", "arguments"} pedidas por el modelo).
+                 Si el proveedor informa del consumo se añade la clave
+                 "usage": {"input_tokens": int, "output_tokens": int}.
+                 Si la petición falla (tras los reintentos) se devuelve
+                 {"type": "error", "status", "message", "retryable", "retry_after"}
         """
         # Agregar nuevos mensajes al historial si existen
         if nuevos_mensajes:
             for mensaje in nuevos_mensajes:
                 self.agregar_mensaje(mensaje["role"], mensaje["content"])
         
+        # Registro de métricas solo si alguien lo va a recibir
+        registro = nuevo_registro(self.nombre_proveedor, self.modelo, "sync") if self.hooks_metricas else None
+        
+        # Recortar el historial antes de construir la petición
+        self._aplicar_politica_historial()
+        
+        # Responder desde la caché sin tocar la red si la petición ya se hizo
+        clave, respuesta = self._buscar_en_cache(functions, function_call)
+        if respuesta is not None:
+            return self._emitir_metricas(registro, respuesta, cache=True)
+        
         # Realizar la petición al proveedor específico
-        response = self._realizar_peticion(functions, function_call)
+        response = self._realizar_peticion(functions, function_call, registro=registro)
         
-        # Si hubo un error en la petición
-        if response is None:
-            return None
+        # Si hubo un error en la petición se devuelve estructurado
+        if es_error(response):
+            return self._emitir_metricas(registro, response)
         
         # Procesar y estandarizar la respuesta
-        return self._procesar_respuesta(response)
+        return self._emitir_metricas(registro, self._guardar_en_cache(clave, self._procesar(response, registro)))
     
-    def _realizar_peticion(self, functions, function_call):
+    async def consultar_async(self, nuevos_mensajes=None, functions=None, function_call="auto"):
+        """
+        Versión asíncrona de consultar() para uasyncio o asyncio de CPython.
+        La petición usa sockets no bloqueantes, de modo que otras tareas del bucle de
+        eventos (sensores, servidor web, otras conversaciones) siguen ejecutándose.
+        
+        Args:
+            nuevos_mensajes (list): Lista opcional de mensajes a agregar al historial
+            functions (list): Lista opcional de funciones disponibles para el modelo
+            function_call (str): Modo de llamada a funciones ("auto", "none", o nombre específico)
+            
+        Returns:
+            dict: Respuesta procesada con el mismo formato que consultar()
+        """
+        if nuevos_mensajes:
+            for mensaje in nuevos_mensajes:
+                self.agregar_mensaje(mensaje["role"], mensaje["content"])
+        
+        registro = nuevo_registro(self.nombre_proveedor, self.modelo, "async") if self.hooks_metricas else None
+        
+        self._aplicar_politica_historial()
+        
+        clave, respuesta = self._buscar_en_cache(functions, function_call)
+        if respuesta is not None:
+            return self._emitir_metricas(registro, respuesta, cache=True)
+        
+        response = await self._realizar_peticion_async(functions, function_call, registro=registro)
+        
+        if es_error(response):
+            return self._emitir_metricas(registro, response)
+        
+        return self._emitir_metricas(registro, self._guardar_en_cache(clave, self._procesar(response, registro)))
+    
+    def run_agent(self, registry, consulta=None, max_iteraciones=5, max_segundos=None, max_tokens_totales=None):
+        """
+        Ejecuta un bucle de agente: consulta al modelo, ejecuta las herramientas que pida
+        y le devuelve los resultados como mensajes nativos de herramienta, hasta obtener
+        una respuesta de texto o agotar alguno de los presupuestos.
+        
+        Args:
+            registry (ToolRegistry): Herramientas disponibles para el modelo
+            consulta (str): Mensaje de usuario opcional a agregar antes de empezar
+            max_iteraciones (int): Número máximo de peticiones al modelo
+            max_segundos (float): Tiempo máximo total en segundos (None sin límite)
+            max_tokens_totales (int): Tokens máximos sumando todas las peticiones (None sin límite)
+            
+        Returns:
+            dict: Última respuesta estandarizada con la clave "agente":
+                 {"iteraciones", "tokens", "segundos", "motivo"}, donde motivo es
+                 "completado", "iteraciones", "tiempo", "tokens" o "error"
+        """
+        if consulta:
+            self.agregar_mensaje("user", consulta)
+        
+        estado = {"inicio": time.time(), "iteraciones": 0, "tokens": 0}
+        respuesta = None
+        while True:
+            motivo = self._presupuesto_agotado(estado, respuesta, max_iteraciones, max_segundos, max_tokens_totales)
+            if motivo:
+                return self._resultado_agente(respuesta, estado, motivo)
+            
+            # La última iteración permitida no ofrece herramientas para forzar una respuesta final
+            modo = "none" if estado["iteraciones"] == max_iteraciones - 1 else "auto"
+            if respuesta is not None:
+                llamadas = respuesta["calls"]
+                self.agregar_llamadas_herramientas(llamadas, registry.ejecutar_llamadas(llamadas))
+            
+            respuesta = self.consultar(functions=registry.esquemas(), function_call=modo)
+            self._contabilizar_agente(estado, respuesta)
+    
+    async def run_agent_async(self, registry, consulta=None, max_iteraciones=5, max_segundos=None, max_tokens_totales=None):
+        """
+        Versión asíncrona de run_agent(): las peticiones usan consultar_async() y las
+        herramientas se ejecutan a la vez en el bucle de eventos.
+        
+        Args:
+            registry (ToolRegistry): Herramientas disponibles para el modelo
+            consulta (str): Mensaje de usuario opcional a agregar antes de empezar
+            max_iteraciones (int): Número máximo de peticiones al modelo
+            max_segundos (float): Tiempo máximo total en segundos (None sin límite)
+            max_tokens_totales (int): Tokens máximos sumando todas las peticiones (None sin límite)
+            
+        Returns:
+            dict: Última respuesta estandarizada con la clave "agente", igual que run_agent()
+        """
+        if consulta:
+            self.agregar_mensaje("user", consulta)
+        
+        estado = {"inicio": time.time(), "iteraciones": 0, "tokens": 0}
+        respuesta = None
+        while True:
+            motivo = self._presupuesto_agotado(estado, respuesta, max_iteraciones, max_segundos, max_tokens_totales)
+            if motivo:
+                return self._resultado_agente(respuesta, estado, motivo)
+            
+            modo = "none" if estado["iteraciones"] == max_iteraciones - 1 else "auto"
+            if respuesta is not None:
+                llamadas = respuesta["calls"]
+                self.agregar_llamadas_herramientas(llamadas, await registry.ejecutar_llamadas_async(llamadas))
+            
+            respuesta = await self.consultar_async(functions=registry.esquemas(), function_call=modo)
+            self._contabilizar_agente(estado, respuesta)
+    
+    def _presupuesto_agotado(self, estado, respuesta, max_iteraciones, max_segundos, max_tokens_totales):
+        """
+        Decide si el bucle de agente debe terminar antes de la siguiente petición.
+        
+        Args:
+            estado (dict): Iteraciones, tokens e instante de inicio del bucle
+            respuesta (dict): Última respuesta recibida (None antes de la primera petición)
+            max_iteraciones (int): Número máximo de peticiones
+            max_segundos (float): Tiempo máximo total en segundos
+            max_tokens_totales (int): Tokens máximos sumando todas las peticiones
+            
+        Returns:
+            str: Motivo de la parada o None si debe continuar
+        """
+        if estado["iteraciones"]:
+            if respuesta is None or respuesta.get("type") == "error":
+                return "error"
+            if respuesta.get("type") != "function_call":
+                return "completado"
+        if estado["iteraciones"] >= max_iteraciones:
+            return "iteraciones"
+        if max_segundos is not None and time.time() - estado["inicio"] >= max_segundos:
+            return "tiempo"
+        if max_tokens_totales is not None and estado["tokens"] >= max_tokens_totales:
+            return "tokens"
+        return None
+    
+    def _contabilizar_agente(self, estado, respuesta):
+        """Suma una iteración y los tokens informados en la respuesta al estado del bucle."""
+        estado["iteraciones"] += 1
+        uso = respuesta.get("usage") if respuesta else None
+        if uso:
+            estado["tokens"] += uso["input_tokens"] + uso["output_tokens"]
+    
+    def _resultado_agente(self, respuesta, estado, motivo):
+        """Añade a la última respuesta el resumen de la ejecución del bucle de agente."""
+        resultado = dict(respuesta) if respuesta else {"type": "error", "content": None}
+        resultado["agente"] = {
+            "iteraciones": estado["iteraciones"],
+            "tokens": estado["tokens"],
+            "segundos": time.time() - estado["inicio"],
+            "motivo": motivo
+        }
+        return resultado
+    
+    @property
+    def transporte_async(self):
+        """Transporte asíncrono; por defecto el pool no bloqueante compartido."""
+        if self._transporte_async is None:
+            # Importación diferida: los programas síncronos no cargan asyncio
+            from mcp_transport_async import transporte_async_compartido
+            self._transporte_async = transporte_async_compartido()
+        return self._transporte_async
+    
+    @transporte_async.setter
+    def transporte_async(self, transporte):
+        self._transporte_async = transporte
+    
+    def consultar_stream(self, nuevos_mensajes=None, functions=None, function_call="auto"):
+        """
+        Realiza una consulta en modo streaming y entrega la respuesta a medida que llega.
+        El mensaje final del asistente se guarda en el historial igual que en consultar().
+        
+        Args:
+            nuevos_mensajes (list): Lista opcional de mensajes a agregar al historial
+            functions (list): Lista opcional de funciones disponibles para el modelo
+            function_call (str): Modo de llamada a funciones ("auto", "none", o nombre específico)
+            
+        Yields:
+            dict: Fragmentos con formato estandarizado
+                 {"type": "text_delta", "content": str} o
+                 {"type": "function_call_delta", "index": int, "name": str/None, "arguments": str}
+                 El último elemento es la respuesta completa, igual que la de consultar()
+        """
+        if nuevos_mensajes:
+            for mensaje in nuevos_mensajes:
+                self.agregar_mensaje(mensaje["role"], mensaje["content"])
+        
+        registro = nuevo_registro(self.nombre_proveedor, self.modelo, "stream") if self.hooks_metricas else None
+        
+        self._aplicar_politica_historial()
+        
+        for fragmento in self._transmitir(functions, function_call, registro):
+            yield fragmento
+    
+    def _transmitir(self, functions, function_call, registro=None, reintentar=True):
+        """
+        Envía la petición en streaming con el historial actual y entrega sus fragmentos.
+        
+        Args:
+            functions (list): Funciones disponibles
+            function_call (str): Modo de llamada a funciones
+            registro (dict): Registro de métricas de la consulta, si se mide
+            reintentar (bool): Si se reintentan los errores transitorios antes de empezar
+            
+        Yields:
+            dict: Fragmentos estandarizados, como consultar_stream()
+        """
+        response = self._realizar_peticion_stream(functions, function_call, registro=registro, reintentar=reintentar)
+        if es_error(response):
+            yield self._emitir_metricas(registro, response)
+            return
+        
+        # Estado acumulado del stream: texto y llamadas a funciones en construcción
+        estado = {"texto": "", "llamadas": []}
+        
+        from mcp_sse import leer_eventos_sse
+        try:
+            for evento, datos in leer_eventos_sse(response.raw):
+                # Solo se mide el análisis de cada evento, no el tiempo del consumidor del generador
+                inicio = reloj()
+                fragmentos = self._procesar_evento_stream(evento, datos, estado)
+                if registro is not None:
+                    registro["analisis_ms"] += ms_desde(inicio)
+                for fragmento in fragmentos:
+                    yield fragmento
+        finally:
+            response.close()
+            self._medir_respuesta(registro, response, 0)
+        
+        yield self._emitir_metricas(registro, self._finalizar_stream(estado))
+    
+    def _aplicar_politica_historial(self):
+        """
+        Aplica la política de historial configurada, si existe, eliminando los turnos
+        más antiguos para mantener acotados el tamaño de la petición y la memoria.
+        
+        Returns:
+            int: Número de mensajes eliminados
+        """
+        if self.politica_historial is None:
+            return 0
+        
+        eliminados = self.politica_historial.aplicar(self.historial, self._fijados, self._estimar_tokens_mensaje, self.system)
+        if eliminados and self.estimador_tokens is not None:
+            self.estimador_tokens.podar(self.historial)
+        return eliminados
+    
+    def _buscar_en_cache(self, functions, function_call):
+        """
+        Busca la respuesta de la petición actual en la caché configurada.
+        Si la encuentra y es de texto, la agrega al historial como haría el proveedor.
+        
+        Args:
+            functions (list): Funciones disponibles
+            function_call (str): Modo de llamada a funciones
+            
+        Returns:
+            tuple: (clave, respuesta) donde respuesta es None si no hay caché o no se encontró
+        """
+        if self.cache is None:
+            return None, None
+        
+        clave = self._clave_cache(functions, function_call)
+        respuesta = self.cache.obtener(clave)
+        if respuesta is not None:
+            print(f"Respuesta de {self.nombre_proveedor} obtenida de la caché")
+            if respuesta["type"] == "text":
+                self.agregar_mensaje("assistant", respuesta["content"])
+        
+        return clave, respuesta
+    
+    def _guardar_en_cache(self, clave, respuesta):
+        """
+        Guarda una respuesta estandarizada válida en la caché y la devuelve.
+        
+        Args:
+            clave (str): Clave de la petición o None si no hay caché
+            respuesta (dict): Respuesta estandarizada
+            
+        Returns:
+            dict: La misma respuesta
+        """
+        if clave is not None and respuesta and respuesta.get("type") in ("text", "function_call"):
+            self.cache.guardar(clave, respuesta)
+        return respuesta
+    
+    def _clave_cache(self, functions, function_call):
+        """
+        Calcula la clave de caché de la petición: proveedor, modelo, parámetros,
+        mensaje de sistema, historial y herramientas. Usa los fragmentos ya codificados,
+        por lo que no serializa de nuevo la conversación.
+        
+        Returns:
+            str: Clave hexadecimal
+        """
+        partes = [
+            self.nombre_proveedor,
+            self.modelo,
+            str(self.temperatura),
+            str(self.max_tokens),
+            self.system
+        ]
+        partes.extend(self._mensajes_codificados())
+        if functions is not None:
+            partes.append(self._herramientas_codificadas(functions))
+            partes.append(str(function_call))
+        from mcp_cache import clave_cache
+        return clave_cache(partes)
+    
+    def estimar_tokens(self, functions=None):
+        """
+        Estima localmente los tokens de entrada de la próxima petición (sistema,
+        historial y herramientas), sin contactar con el proveedor. Los mensajes ya
+        estimados no se recalculan, así que puede llamarse antes de cada petición.
+        
+        Args:
+            functions (list): Funciones que se enviarán con la petición
+            
+        Returns:
+            int: Tokens estimados
+        """
+        estimador = self._estimador()
+        tokens = estimador.coste_peticion + estimador.estimar_historial(self.historial)
+        if self.system:
+            tokens += estimador.coste_mensaje + estimador.estimar_texto(self.system)
+        if functions:
+            tokens += estimador.estimar_bytes(len(self._herramientas_codificadas(functions)))
+        return tokens
+    
+    def _estimador(self):
+        """Devuelve el estimador de tokens, creándolo para la familia del proveedor si no hay uno."""
+        if self.estimador_tokens is None:
+            from mcp_tokens import TokenEstimator
+            self.estimador_tokens = TokenEstimator(self.familia_tokens)
+        return self.estimador_tokens
+    
+    def _estimar_tokens_mensaje(self, mensaje):
+        """
+        Estima los tokens de un mensaje con el estimador del adaptador.
+        
+        Args:
+            mensaje (Message): Mensaje del historial
+            
+        Returns:
+            int: Tokens estimados
+        """
+        return self._estimador().estimar_mensaje(mensaje)
+    
+    def consultar_lote(self, conversaciones, functions=None, function_call="auto", concurrencia=4, intervalo=10):
+        """
+        Procesa muchas conversaciones independientes y entrega cada resultado al terminar.
+        Por defecto envía peticiones normales concurrentes; los adaptadores con API de
+        lotes del proveedor (OpenAI, Claude) la usan en su lugar.
+        
+        Args:
+            conversaciones (dict/list): {custom_id: mensajes} o lista de listas de mensajes
+            functions (list): Lista opcional de funciones disponibles para el modelo
+            function_call (str): Modo de llamada a funciones ("auto", "none", o nombre específico)
+            concurrencia (int): Peticiones simultáneas cuando no hay API de lotes
+            intervalo (float): Espera inicial entre consultas del estado del lote, en segundos
+            
+        Yields:
+            tuple: (custom_id, respuesta) con la respuesta en formato estandarizado o un error
+                   estructurado si esa conversación falló
+        """
+        from mcp_batch import lote_concurrente
+        return lote_concurrente(self, conversaciones, functions, function_call, concurrencia)
+    
+    def _clonar(self, mensajes=None):
+        """
+        Crea un adaptador independiente con la misma configuración y el historial indicado.
+        
+        Args:
+            mensajes (list): Mensajes {"role", "content"} del nuevo historial ("system" incluido)
+            
+        Returns:
+            MCPAdapter: Nuevo adaptador del mismo tipo
+        """
+        clon = type(self)(self.api_key, self.modelo, self.max_tokens, self.temperatura, self.transporte)
+        for atributo in ("url", "base_url"):
+            if hasattr(self, atributo):
+                setattr(clon, atributo, getattr(self, atributo))
+        clon._transporte_async = self._transporte_async
+        clon.system = self.system
+        for mensaje in mensajes or []:
+            clon.agregar_mensaje(mensaje["role"], mensaje["content"])
+        return clon
+    
+    def _medir_respuesta(self, registro, response, cuerpo_ms):
+        """
+        Copia al registro de métricas los tiempos y bytes medidos por el transporte.
+        La lectura del cuerpo cuenta como descarga y el resto de cuerpo_ms como análisis.
+        
+        Args:
+            registro (dict): Registro de métricas (None si no se mide)
+            response: Respuesta del transporte
+            cuerpo_ms (float): Milisegundos dedicados a leer y analizar el cuerpo
+        """
+        if registro is None:
+            return
+        tiempos = getattr(response, "tiempos", None)
+        if tiempos is None:
+            # Transporte sin instrumentación (urequests): todo el cuerpo cuenta como descarga
+            registro["descarga_ms"] += cuerpo_ms
+            return
+        registro["conexion_ms"] += tiempos["conexion_ms"]
+        registro["primer_byte_ms"] += tiempos["primer_byte_ms"]
+        registro["descarga_ms"] += tiempos["lectura_ms"]
+        registro["analisis_ms"] += max(0, cuerpo_ms - tiempos["lectura_ms"])
+        registro["bytes_recibidos"] += response.bytes_recibidos
+    
+    def _emitir_metricas(self, registro, respuesta, cache=False):
+        """
+        Completa el registro de métricas de una consulta y lo entrega a los hooks.
+        
+        Args:
+            registro (dict): Registro de métricas (None si no se mide)
+            respuesta (dict): Respuesta estandarizada o error estructurado
+            cache (bool): Si la respuesta salió de la caché
+            
+        Returns:
+            dict: La misma respuesta, para encadenar
+        """
+        if registro is None:
+            return respuesta
+        
+        registro["total_ms"] = ms_desde(registro.pop("inicio"))
+        registro["cache"] = cache
+        if respuesta is not None and respuesta.get("type") == "error":
+            registro["estado"] = respuesta["status"] or "error"
+        else:
+            registro["estado"] = "ok"
+            uso = respuesta.get("usage") if respuesta and not cache else None
+            if uso:
+                registro["input_tokens"] = uso["input_tokens"]
+                registro["output_tokens"] = uso["output_tokens"]
+        
+        for hook in self.hooks_metricas:
+            try:
+                hook(registro)
+            except Exception as e:
+                print(f"Error en hook de métricas: {e}")
+        return respuesta
+    
+    @property
+    def interruptor(self):
+        """Interruptor de circuito compartido por los adaptadores del mismo proveedor."""
+        return interruptor_de(self.nombre_proveedor)
+    
+    def _preparar_cuerpo(self, functions, function_call, stream, registro):
+        """
+        Construye la petición midiendo el tiempo de serialización y el tamaño del cuerpo.
+        
+        Args:
+            functions (list): Funciones disponibles
+            function_call (str): Modo de llamada a funciones
+            stream (bool): Si se solicita la respuesta en streaming
+            registro (dict): Registro de métricas de la consulta, si se mide
+            
+        Returns:
+            tuple: (url, headers, cuerpo) de la petición
+        """
+        inicio = reloj()
+        url, headers, cuerpo = self._preparar_peticion(functions, function_call, stream=stream)
+        if registro is not None:
+            registro["serializacion_ms"] = ms_desde(inicio)
+            registro["bytes_enviados"] = len(cuerpo)
+        return url, headers, cuerpo
+    
+    def _comprobar_interruptor(self):
+        """
+        Comprueba el interruptor del proveedor antes de enviar una petición.
+        
+        Returns:
+            dict: Error estructurado si el proveedor está en pausa o caído, None si se puede enviar
+        """
+        restante = self.interruptor.permitir()
+        if restante:
+            return error_estructurado(None, f"{self.nombre_proveedor} no disponible temporalmente", True, restante)
+        return None
+    
+    def _error_http(self, status_code, texto, headers):
+        """
+        Construye el error estructurado de una respuesta HTTP distinta de 200.
+        
+        Args:
+            status_code (int): Código HTTP
+            texto (str): Cuerpo de la respuesta
+            headers (dict): Cabeceras de la respuesta
+            
+        Returns:
+            dict: Error estructurado
+        """
+        return error_estructurado(status_code, texto, status_code in ESTADOS_REINTENTABLES, espera_indicada(headers))
+    
+    def _registrar_exito(self, headers):
+        """Cierra el interruptor y lo pausa si la respuesta indica que se agotó un límite."""
+        self.interruptor.registrar_exito()
+        espera = espera_indicada(headers)
+        if espera:
+            self.interruptor.pausar(espera)
+    
+    def _registrar_fallo(self, error):
+        """
+        Actualiza el interruptor con un intento fallido. Un límite de peticiones pausa
+        al proveedor el tiempo indicado; los errores de red y 5xx cuentan como caída y
+        el resto de errores HTTP demuestran que el proveedor responde.
+        
+        Args:
+            error (dict): Error estructurado del intento
+        """
+        if error["status"] == 429 and error["retry_after"]:
+            self.interruptor.pausar(error["retry_after"])
+        elif error["status"] is None or error["status"] >= 500:
+            self.interruptor.registrar_fallo()
+        else:
+            # También termina una petición de prueba, que de otro modo bloquearía al proveedor
+            self.interruptor.registrar_exito()
+    
+    def _espera_reintento(self, error, intento, reintentar):
+        """
+        Decide si se repite la petición y cuánto esperar antes.
+        
+        Args:
+            error (dict): Error estructurado del intento
+            intento (int): Reintentos ya realizados
+            reintentar (bool): Si se permiten reintentos en esta petición
+            
+        Returns:
+            float: Segundos a esperar o None si se devuelve el error
+        """
+        if not reintentar or self.reintentos is None:
+            return None
+        espera = self.reintentos.espera(intento, error)
+        if espera is not None:
+            print(f"Reintentando consulta a {self.nombre_proveedor} en {espera:.1f} s...")
+        return espera
+    
+    def _realizar_peticion(self, functions, function_call, reintentar=True, registro=None):
         """
-        Método que debe ser implementado por cada adaptador específico.
         Realiza la petición al API del proveedor y retorna la respuesta cruda.
+        Los errores transitorios se reintentan según self.reintentos. Con un coalescer,
+        si otro hilo ya envió una petición idéntica se espera su respuesta en su lugar.
         
         Args:
             functions (list): Funciones disponibles
             function_call (str): Modo de llamada a funciones
+            reintentar (bool): Si se reintentan los errores transitorios
+            registro (dict): Registro de métricas de la consulta, si se mide
             
         Returns:
-            dict: Respuesta cruda del proveedor
+            dict: Respuesta cruda del proveedor o error estructurado
         """
-        raise NotImplementedError("Subclases deben implementar _realizar_peticion()")
+        url, headers, cuerpo = self._preparar_cuerpo(functions, function_call, False, registro)
+        
+        if self.coalescer is None:
+            return self._enviar_peticion(url, headers, cuerpo, reintentar, registro)
+        
+        from mcp_singleflight import clave_peticion
+        response, compartida = self.coalescer.ejecutar(
+            clave_peticion(url, headers, cuerpo),
+            lambda: self._enviar_peticion(url, headers, cuerpo, reintentar, registro)
+        )
+        self._marcar_compartida(registro, compartida)
+        return response
+    
+    def _marcar_compartida(self, registro, compartida):
+        """Indica en el registro de métricas que la respuesta vino de la petición de otro."""
+        if registro is not None and compartida:
+            registro["compartida"] = True
+            registro["bytes_enviados"] = 0
+    
+    def _enviar_peticion(self, url, headers, cuerpo, reintentar, registro):
+        """
+        Envía una petición ya construida, con los reintentos y el interruptor del proveedor.
+        
+        Returns:
+            dict: Respuesta cruda del proveedor o error estructurado
+        """
+        intento = 0
+        while True:
+            error = self._comprobar_interruptor()
+            if error is None:
+                try:
+                    print(f"Enviando consulta a {self.nombre_proveedor}...")
+                    if registro is not None:
+                        registro["intentos"] += 1
+                    # El cuerpo se lee en bloques pequeños directamente del socket
+                    response = self.transporte.post(url, headers=headers, data=cuerpo, stream=True)
+                    
+                    if response.status_code == 200:
+                        inicio = reloj()
+                        result = extraer_json(response.raw, self._arbol_respuesta)
+                        self._medir_respuesta(registro, response, ms_desde(inicio))
+                        response.close()
+                        self._registrar_exito(getattr(response, "headers", None))
+                        return result
+                    else:
+                        error = self._error_http(response.status_code, response.text, getattr(response, "headers", None))
+                        response.close()
+                except Exception as e:
+                    error = error_excepcion(e)
+                self._registrar_fallo(error)
+            
+            espera = self._espera_reintento(error, intento, reintentar)
+            if espera is None:
+                return error
+            time.sleep(espera)
+            intento += 1
+    
+    async def _realizar_peticion_async(self, functions, function_call, reintentar=True, registro=None):
+        """
+        Realiza la petición al API del proveedor sin bloquear el bucle de eventos.
+        Las esperas entre reintentos tampoco bloquean. Con un coalescer, las tareas que
+        piden lo mismo mientras la petición está en curso comparten su respuesta.
+        
+        Args:
+            functions (list): Funciones disponibles
+            function_call (str): Modo de llamada a funciones
+            reintentar (bool): Si se reintentan los errores transitorios
+            registro (dict): Registro de métricas de la consulta, si se mide
+            
+        Returns:
+            dict: Respuesta cruda del proveedor o error estructurado
+        """
+        url, headers, cuerpo = self._preparar_cuerpo(functions, function_call, False, registro)
+        
+        if self.coalescer is None:
+            return await self._enviar_peticion_async(url, headers, cuerpo, reintentar, registro)
+        
+        from mcp_singleflight import clave_peticion
+        response, compartida = await self.coalescer.ejecutar_async(
+            clave_peticion(url, headers, cuerpo),
+            lambda: self._enviar_peticion_async(url, headers, cuerpo, reintentar, registro)
+        )
+        self._marcar_compartida(registro, compartida)
+        return response
+    
+    async def _enviar_peticion_async(self, url, headers, cuerpo, reintentar, registro):
+        """
+        Versión asíncrona de _enviar_peticion().
+        
+        Returns:
+            dict: Respuesta cruda del proveedor o error estructurado
+        """
+        try:
+            import asyncio
+        except ImportError:
+            import uasyncio as asyncio
+        
+        intento = 0
+        while True:
+            error = self._comprobar_interruptor()
+            if error is None:
+                try:
+                    print(f"Enviando consulta asíncrona a {self.nombre_proveedor}...")
+                    if registro is not None:
+                        registro["intentos"] += 1
+                    response = await self.transporte_async.post(url, headers=headers, data=cuerpo, stream=True)
+                    
+                    try:
+                        if response.status_code == 200:
+                            inicio = reloj()
+                            result = await extraer_json_async(response, self._arbol_respuesta)
+                            self._medir_respuesta(registro, response, ms_desde(inicio))
+                            self._registrar_exito(getattr(response, "headers", None))
+                            return result
+                        else:
+                            texto = await response.read()
+                            error = self._error_http(response.status_code, texto.decode("utf-8"), response.headers)
+                    finally:
+                        # También si la tarea se cancela: una conexión a medio leer se cierra
+                        response.close()
+                except Exception as e:
+                    error = error_excepcion(e)
+                self._registrar_fallo(error)
+            
+            espera = self._espera_reintento(error, intento, reintentar)
+            if espera is None:
+                return error
+            await asyncio.sleep(espera)
+            intento += 1
+    
+    def _realizar_peticion_stream(self, functions, function_call, registro=None, reintentar=True):
+        """
+        Realiza la petición en modo streaming sin leer el cuerpo de la respuesta.
+        Solo se reintenta hasta recibir la respuesta 200; un stream cortado no se repite.
+        
+        Args:
+            functions (list): Funciones disponibles
+            function_call (str): Modo de llamada a funciones
+            registro (dict): Registro de métricas de la consulta, si se mide
+            reintentar (bool): Si se reintentan los errores transitorios
+            
+        Returns:
+            Response: Respuesta abierta para leer los eventos o error estructurado
+        """
+        url, headers, cuerpo = self._preparar_cuerpo(functions, function_call, True, registro)
+        
+        intento = 0
+        while True:
+            error = self._comprobar_interruptor()
+            if error is None:
+                try:
+                    print(f"Enviando consulta en streaming a {self.nombre_proveedor}...")
+                    if registro is not None:
+                        registro["intentos"] += 1
+                    response = self.transporte.post(url, headers=headers, data=cuerpo, stream=True)
+                    
+                    if response.status_code == 200:
+                        self._registrar_exito(getattr(response, "headers", None))
+                        return response
+                    else:
+                        error = self._error_http(response.status_code, response.text, getattr(response, "headers", None))
+                        response.close()
+                except Exception as e:
+                    error = error_excepcion(e)
+                self._registrar_fallo(error)
+            
+            espera = self._espera_reintento(error, intento, reintentar)
+            if espera is None:
+                return error
+            time.sleep(espera)
+            intento += 1
+    
+    def _finalizar_stream(self, estado):
+        """
+        Construye la respuesta estandarizada final a partir del estado del stream.
+        
+        Args:
+            estado (dict): Texto y llamadas a funciones acumulados durante el stream (y "usage"
+                           o "error" si el proveedor los informó)
+            
+        Returns:
+            dict: Respuesta procesada con formato estandarizado o el error del stream
+        """
+        # Un stream interrumpido por un error no deja una respuesta incompleta en el historial
+        if estado.get("error"):
+            return estado["error"]
+        
+        if estado["llamadas"]:
+            respuesta = self._respuesta_llamadas(estado["llamadas"])
+        else:
+            # Guardar en el historial
+            self.agregar_mensaje("assistant", estado["texto"])
+            
+            respuesta = {
+                "type": "text",
+                "content": estado["texto"]
+            }
+        
+        # Consumo de tokens si el proveedor lo informa durante el stream
+        if estado.get("usage"):
+            respuesta["usage"] = estado["usage"]
+        return respuesta
+    
+    def _procesar(self, response, registro=None):
+        """
+        Procesa la respuesta cruda y añade el consumo de tokens informado por el proveedor.
+        
+        Args:
+            response (dict): Respuesta cruda del proveedor
+            registro (dict): Registro de métricas de la consulta, si se mide
+            
+        Returns:
+            dict: Respuesta procesada con formato estandarizado
+        """
+        inicio = reloj()
+        respuesta = self._procesar_respuesta(response)
+        if registro is not None:
+            registro["analisis_ms"] += ms_desde(inicio)
+        if respuesta is not None:
+            uso = self._extraer_uso(response)
+            if uso:
+                respuesta["usage"] = uso
+        return respuesta
+    
+    def _extraer_uso(self, response):
+        """
+        Extrae el consumo de tokens de la respuesta cruda. Los adaptadores lo
+        sobrescriben según el formato de su proveedor.
+        
+        Args:
+            response (dict): Respuesta cruda del proveedor
+            
+        Returns:
+            dict: {"input_tokens": int, "output_tokens": int} o None si no se informa
+        """
+        return None
+    
+    def _respuesta_llamadas(self, llamadas):
+        """
+        Construye la respuesta estandarizada para una o varias llamadas a funciones.
+        
+        Args:
+            llamadas (list): Llamadas {"id", "name", "arguments"} en el orden del modelo
+            
+        Returns:
+            dict: Respuesta de tipo function_call con la primera llamada y la lista completa
+        """
+        for llamada in llamadas:
+            if not llamada["arguments"]:
+                llamada["arguments"] = "{}"
+        return {
+            "type": "function_call",
+            "name": llamadas[0]["name"],
+            "arguments": llamadas[0]["arguments"],
+            "calls": llamadas
+        }
+    
+    def _preparar_peticion(self, functions, function_call, stream=False):
+        """
+        Método que debe ser implementado por cada adaptador específico.
+        Construye la URL, las cabeceras y el cuerpo de la petición al proveedor.
+        
+        Args:
+            functions (list): Funciones disponibles
+            function_call (str): Modo de llamada a funciones
+            stream (bool): Si la petición debe solicitar la respuesta en streaming
+            
+        Returns:
+            tuple: (url, headers, cuerpo) donde cuerpo es un EncodedBody con los
+                   fragmentos del JSON, que el transporte envía sin unirlos
+        """
+        raise NotImplementedError("Subclases deben implementar _preparar_peticion()")
+    
+    def _mensajes_codificados(self):
+        """
+        Devuelve el historial codificado con el formato del proveedor.
+        Solo se codifican los mensajes añadidos desde la petición anterior.
+        
+        Returns:
+            list: Un fragmento JSON en bytes por mensaje del historial
+        """
+        return self._historial_codificado.sincronizar(self.historial)
+    
+    def _system_codificado(self):
+        """
+        Devuelve el mensaje de sistema codificado, reutilizando la codificación
+        anterior mientras no cambie.
+        
+        Returns:
+            bytes: Mensaje de sistema codificado con el formato del proveedor
+        """
+        if self._cache_system is None:
+            self._cache_system = self._codificar_system(self.system)
+        return self._cache_system
+    
+    def _plantilla_peticion(self):
+        """
+        Devuelve las partes fijas de la petición ya codificadas, compilándolas solo
+        la primera vez o tras cambiar la clave, el modelo, la temperatura o max_tokens.
+        
+        Returns:
+            dict: Plantilla generada por _compilar_plantilla()
+        """
+        if self._plantilla is None:
+            self._plantilla = self._compilar_plantilla()
+        return self._plantilla
+    
+    def _compilar_plantilla(self):
+        """
+        Codifica las partes de la petición que no dependen de la conversación.
+        Debe ser implementado por cada adaptador específico.
+        
+        Returns:
+            dict: Al menos "headers" (EncodedHeaders), "inicio" y "fin" (pares
+                  (clave, bytes) que van antes y después de los mensajes)
+        """
+        raise NotImplementedError("Subclases deben implementar _compilar_plantilla()")
+    
+    def _herramientas_codificadas(self, functions):
+        """
+        Devuelve las herramientas en el formato del proveedor, ya codificadas en JSON.
+        La conversión y la codificación se hacen una sola vez por lista de funciones.
+        
+        Args:
+            functions (list): Funciones en formato OpenAI (estándar)
+            
+        Returns:
+            bytes: Herramientas codificadas con el formato del proveedor
+        """
+        return self._cache_herramientas.obtener(functions, self._herramientas_nativas)[1]
+    
+    def _herramientas_nativas(self, functions):
+        """
+        Construye el valor del campo de herramientas del proveedor.
+        Por defecto es la lista devuelta por _convertir_funciones().
+        
+        Args:
+            functions (list): Funciones en formato OpenAI (estándar)
+            
+        Returns:
+            list: Herramientas en el formato del proveedor
+        """
+        return self._convertir_funciones(functions)
+    
+    def invalidar_cache_herramientas(self):
+        """
+        Descarta los esquemas de herramientas en caché de este proveedor.
+        Necesario si se modifica en el lugar una lista de funciones ya utilizada.
+        """
+        self._cache_herramientas.invalidar()
+    
+    def _codificar_mensaje(self, mensaje):
+        """
+        Codifica un mensaje del historial con el formato del proveedor.
+        Por defecto el mensaje se envía tal como está guardado ({"role", "content"}).
+        
+        Args:
+            mensaje (Message): Mensaje del historial
+            
+        Returns:
+            bytes: Mensaje codificado en JSON
+        """
+        if "tool_calls" in mensaje or "tool_results" in mensaje:
+            return codificar(dict(mensaje))
+        return TEXTO_ESTANDAR.codificar(mensaje)
+    
+    def _codificar_system(self, system):
+        """
+        Codifica el mensaje de sistema con el formato del proveedor.
+        
+        Args:
+            system (str): Mensaje de sistema
+            
+        Returns:
+            bytes: Mensaje de sistema codificado en JSON
+        """
+        return codificar(system)
     
     def _procesar_respuesta(self, response):
         """
@@ -93,6 +1186,21 @@ class MCPAdapter:
         """
         raise NotImplementedError("Subclases deben implementar _procesar_respuesta()")
     
+    def _procesar_evento_stream(self, evento, datos, estado):
+        """
+        Método que debe ser implementado por cada adaptador específico.
+        Convierte un evento SSE del proveedor en fragmentos estandarizados.
+        
+        Args:
+            evento (str): Nombre del evento SSE (o None)
+            datos (str): Contenido del campo data del evento
+            estado (dict): Estado acumulado del stream, actualizado en el lugar
+            
+        Returns:
+            list: Fragmentos estandarizados producidos por el evento
+        """
+        raise NotImplementedError("Subclases deben implementar _procesar_evento_stream()")
+    
     def _convertir_funciones(self, functions):
         """
         Método que debe ser implementado por cada adaptador específico.
@@ -0,0 +1,294 @@
+# mcp_batch.py
+import json
+import time
+
+try:
+    import asyncio
+except ImportError:
+    import uasyncio as asyncio
+
+from mcp_codec import codificar
+from mcp_resilience import ESTADOS_REINTENTABLES, error_estructurado, error_excepcion
+
+# Separador de las partes del formulario multipart al subir el archivo de OpenAI
+_LIMITE = b"----mcp-lote-5f2a9c"
+
+
+def _normalizar(conversaciones):
+    """
+    Convierte las conversaciones en pares (custom_id, mensajes).
+    
+    Args:
+        conversaciones (dict/list): {custom_id: mensajes} o lista de listas de mensajes
+                                    (en ese caso el custom_id es la posición como texto)
+        
+    Returns:
+        list: Pares (custom_id, mensajes)
+    """
+    if isinstance(conversaciones, dict):
+        return list(conversaciones.items())
+    return [(str(i), mensajes) for i, mensajes in enumerate(conversaciones)]
+
+
+def _esperar_lote(consultar_estado, terminado, intervalo, intervalo_max):
+    """
+    Consulta el estado de un lote con esperas crecientes hasta que termine.
+    
+    Args:
+        consultar_estado (callable): Devuelve el estado actual del lote (dict) o None si hay error
+        terminado (callable): Recibe el estado y devuelve True cuando el lote ha terminado
+        intervalo (float): Espera inicial entre consultas en segundos
+        intervalo_max (float): Espera máxima entre consultas en segundos
+        
+    Returns:
+        dict: Estado final del lote o None si no se pudo consultar
+    """
+    while True:
+        estado = consultar_estado()
+        if estado is None or terminado(estado):
+            return estado
+        print(f"Lote en curso: {estado.get('request_counts')}")
+        time.sleep(intervalo)
+        # Los lotes tardan minutos u horas: espaciar las consultas reduce peticiones inútiles
+        intervalo = min(intervalo * 1.5, intervalo_max)
+
+
+def _json_o_none(response):
+    """Decodifica una respuesta JSON de la API de lotes o imprime el error y devuelve None."""
+    if response.status_code == 200:
+        return response.json()
+    print(f"Error: {response.status_code} - {response.text}")
+    return None
+
+
+def _lineas_json(response):
+    """Recorre un archivo JSONL descargado línea a línea sin cargarlo completo en memoria."""
+    try:
+        while True:
+            linea = response.readline()
+            if not linea:
+                break
+            linea = linea.strip()
+            if linea:
+                yield json.loads(linea)
+    finally:
+        response.close()
+
+
+def lote_openai(adapter, conversaciones, functions=None, function_call="auto", intervalo=10, intervalo_max=300):
+    """
+    Procesa conversaciones con la Batch API de OpenAI: sube un archivo JSONL,
+    crea el lote, espera a que termine y descarga los resultados.
+    
+    Args:
+        adapter (OpenAIMCPAdapter): Adaptador con la configuración a usar
+        conversaciones (dict/list): Conversaciones independientes
+        functions (list): Funciones disponibles para el modelo
+        function_call (str): Modo de llamada a funciones
+        intervalo (float): Espera inicial entre consultas de estado en segundos
+        intervalo_max (float): Espera máxima entre consultas de estado en segundos
+        
+    Yields:
+        tuple: (custom_id, respuesta) con la respuesta en formato estandarizado o un error
+               estructurado si esa conversación falló
+    """
+    base = adapter.url.rsplit("/chat/completions", 1)[0]
+    autorizacion = {"Authorization": f"Bearer {adapter.api_key}"}
+    
+    # Una línea JSONL por conversación, con el cuerpo ya codificado por el adaptador
+    lineas = []
+    for custom_id, mensajes in _normalizar(conversaciones):
+        _, _, cuerpo = adapter._clonar(mensajes)._preparar_peticion(functions, function_call)
+        lineas.append(b'{"custom_id": ' + codificar(custom_id) + b', "method": "POST", "url": "/v1/chat/completions", "body": ' + cuerpo.unir() + b'}')
+    
+    formulario = b"".join([
+        b"--", _LIMITE, b'\r\nContent-Disposition: form-data; name="purpose"\r\n\r\nbatch\r\n',
+        b"--", _LIMITE, b'\r\nContent-Disposition: form-data; name="file"; filename="lote.jsonl"\r\n',
+        b"Content-Type: application/jsonl\r\n\r\n", b"\n".join(lineas), b"\r\n",
+        b"--", _LIMITE, b"--\r\n"
+    ])
+    lineas = None
+    
+    print("Subiendo lote a OpenAI...")
+    headers = {"Content-Type": "multipart/form-data; boundary=" + _LIMITE.decode()}
+    headers.update(autorizacion)
+    archivo = _json_o_none(adapter.transporte.post(base + "/files", headers=headers, data=formulario))
+    formulario = None
+    if archivo is None:
+        return
+    
+    headers = {"Content-Type": "application/json"}
+    headers.update(autorizacion)
+    lote = _json_o_none(adapter.transporte.post(base + "/batches", headers=headers, data=codificar({
+        "input_file_id": archivo["id"],
+        "endpoint": "/v1/chat/completions",
+        "completion_window": "24h"
+    })))
+    if lote is None:
+        return
+    
+    estado = _esperar_lote(
+        lambda: _json_o_none(adapter.transporte.get(f"{base}/batches/{lote['id']}", headers=autorizacion)),
+        lambda e: e["status"] in ("completed", "failed", "expired", "cancelled"),
+        intervalo, intervalo_max
+    )
+    if estado is None:
+        return
+    if estado["status"] != "completed":
+        print(f"El lote terminó con estado {estado['status']}")
+    
+    # Un único adaptador procesa todas las respuestas; su historial se descarta
+    procesador = adapter._clonar()
+    
+    for clave in ("output_file_id", "error_file_id"):
+        if not estado.get(clave):
+            continue
+        response = adapter.transporte.get(f"{base}/files/{estado[clave]}/content", headers=autorizacion, stream=True)
+        if response.status_code != 200:
+            _json_o_none(response)
+            continue
+        
+        for resultado in _lineas_json(response):
+            cuerpo = (resultado.get("response") or {}).get("body")
+            status = (resultado.get("response") or {}).get("status_code")
+            if cuerpo and status == 200:
+                respuesta = procesador._procesar(cuerpo)
+                procesador.historial = []
+            else:
+                detalle = json.dumps(resultado.get("error") or cuerpo)
+                print(f"Error en {resultado['custom_id']}: {detalle}")
+                respuesta = error_estructurado(status, detalle, status in ESTADOS_REINTENTABLES)
+            yield resultado["custom_id"], respuesta
+
+
+def lote_claude(adapter, conversaciones, functions=None, function_call="auto", intervalo=10, intervalo_max=300):
+    """
+    Procesa conversaciones con la Message Batches API de Anthropic: crea el lote,
+    espera a que termine y descarga los resultados.
+    
+    Args:
+        adapter (ClaudeMCPAdapter): Adaptador con la configuración a usar
+        conversaciones (dict/list): Conversaciones independientes (custom_id con letras, números, - y _)
+        functions (list): Funciones disponibles para el modelo
+        function_call (str): Modo de llamada a funciones
+        intervalo (float): Espera inicial entre consultas de estado en segundos
+        intervalo_max (float): Espera máxima entre consultas de estado en segundos
+        
+    Yields:
+        tuple: (custom_id, respuesta) con la respuesta en formato estandarizado o un error
+               estructurado si esa conversación falló
+    """
+    url_lotes = adapter.url + "/batches"
+    headers = None
+    
+    peticiones = []
+    for custom_id, mensajes in _normalizar(conversaciones):
+        _, headers, cuerpo = adapter._clonar(mensajes)._preparar_peticion(functions, function_call)
+        peticiones.append(b'{"custom_id": ' + codificar(custom_id) + b', "params": ' + cuerpo.unir() + b'}')
+    
+    if headers is None:
+        return
+    
+    print("Enviando lote a Claude...")
+    datos = b'{"requests": [' + b", ".join(peticiones) + b"]}"
+    peticiones = None
+    lote = _json_o_none(adapter.transporte.post(url_lotes, headers=headers, data=datos))
+    datos = None
+    if lote is None:
+        return
+    
+    estado = _esperar_lote(
+        lambda: _json_o_none(adapter.transporte.get(f"{url_lotes}/{lote['id']}", headers=headers)),
+        lambda e: e["processing_status"] == "ended",
+        intervalo, intervalo_max
+    )
+    if estado is None or not estado.get("results_url"):
+        return
+    
+    response = adapter.transporte.get(estado["results_url"], headers=headers, stream=True)
+    if response.status_code != 200:
+        _json_o_none(response)
+        return
+    
+    procesador = adapter._clonar()
+    for resultado in _lineas_json(response):
+        tipo = resultado["result"]["type"]
+        if tipo == "succeeded":
+            respuesta = procesador._procesar(resultado["result"]["message"])
+            procesador.historial = []
+        else:
+            print(f"Error en {resultado['custom_id']}: {resultado['result']}")
+            # Las peticiones caducadas o canceladas se pueden repetir; las erróneas no
+            respuesta = error_estructurado(None, json.dumps(resultado["result"]), tipo != "errored")
+        yield resultado["custom_id"], respuesta
+
+
+def lote_concurrente(adapter, conversaciones, functions=None, function_call="auto", concurrencia=4):
+    """
+    Procesa conversaciones enviando varias peticiones normales a la vez, para
+    proveedores sin API de lotes (Gemini). Reutiliza las conexiones del transporte asíncrono.
+    No debe llamarse desde una tarea asyncio, ya que usa su propio bucle de eventos, que
+    se cierra al terminar o al abandonar el generador.
+    
+    Args:
+        adapter (MCPAdapter): Adaptador con la configuración a usar
+        conversaciones (dict/list): Conversaciones independientes
+        functions (list): Funciones disponibles para el modelo
+        function_call (str): Modo de llamada a funciones
+        concurrencia (int): Número máximo de peticiones simultáneas
+        
+    Yields:
+        tuple: (custom_id, respuesta) a medida que termina cada conversación
+               (respuesta es un error estructurado si la consulta falló)
+    """
+    pendientes = _normalizar(conversaciones)
+    completados = []
+    estado = {"siguiente": 0, "activos": 0, "evento": None}
+    tareas = []
+    
+    async def trabajador():
+        while estado["siguiente"] < len(pendientes):
+            custom_id, mensajes = pendientes[estado["siguiente"]]
+            estado["siguiente"] += 1
+            try:
+                respuesta = await adapter._clonar(mensajes).consultar_async(functions=functions, function_call=function_call)
+            except Exception as e:
+                print(f"Error en {custom_id}: {e}")
+                respuesta = error_excepcion(e)
+            completados.append((custom_id, respuesta))
+            estado["evento"].set()
+        estado["activos"] -= 1
+        estado["evento"].set()
+    
+    async def iniciar():
+        # El evento y las tareas se crean dentro del bucle que los ejecuta
+        estado["evento"] = asyncio.Event()
+        for _ in range(min(concurrencia, len(pendientes))):
+            estado["activos"] += 1
+            tareas.append(asyncio.create_task(trabajador()))
+    
+    async def esperar():
+        await estado["evento"].wait()
+        estado["evento"].clear()
+    
+    async def cancelar():
+        for tarea in tareas:
+            tarea.cancel()
+        await asyncio.gather(*tareas, return_exceptions=True)
+    
+    bucle = asyncio.new_event_loop()
+    try:
+        bucle.run_until_complete(iniciar())
+        # El bucle solo avanza hasta el siguiente resultado, que se entrega de inmediato
+        while estado["activos"] or completados:
+            if not completados:
+                bucle.run_until_complete(esperar())
+            while completados:
+                yield completados.pop(0)
+    finally:
+        # También si el generador se abandona a medias: cancelar lo pendiente, cerrar las
+        # conexiones abiertas en este bucle y el propio bucle
+        bucle.run_until_complete(cancelar())
+        adapter.transporte_async.cerrar(bucle)
+        bucle.run_until_complete(asyncio.sleep(0))
+        bucle.close()
@@ -0,0 +1,245 @@
+# mcp_bench.py
+import gc
+import sys
+
+try:
+    import asyncio
+except ImportError:
+    import uasyncio as asyncio
+
+from mcp_factory import MCPFactory
+from mcp_metrics import reloj, ms_desde
+from mcp_mock_server import MockProviderServer
+from mcp_transport import KeepAliveTransport, UrequestsTransport
+
+
+# Transportes síncronos que se comparan (el modo async usa siempre el transporte no bloqueante)
+TRANSPORTES = {
+    "keepalive": KeepAliveTransport,
+    "urequests": UrequestsTransport,
+}
+
+# Función de ejemplo para medir respuestas con llamadas a herramientas
+FUNCION_EJEMPLO = {
+    "name": "leer_sensor",
+    "description": "Lee el valor actual de un sensor",
+    "parameters": {
+        "type": "object",
+        "properties": {"sensor": {"type": "string", "description": "Nombre del sensor"}},
+        "required": ["sensor"]
+    }
+}
+
+
+class _Memoria:
+    """
+    Mide el pico de memoria de una prueba: tracemalloc en CPython; en MicroPython,
+    el máximo de gc.mem_alloc() observado tras cada petición (aproximado).
+    """
+    
+    def __init__(self):
+        try:
+            import tracemalloc
+            self._tracemalloc = tracemalloc
+        except ImportError:
+            self._tracemalloc = None
+        self._base = 0
+        self._pico = 0
+    
+    def iniciar(self):
+        """Empieza la medición desde el uso actual."""
+        gc.collect()
+        if self._tracemalloc is not None:
+            if not self._tracemalloc.is_tracing():
+                self._tracemalloc.start()
+            self._tracemalloc.reset_peak()
+            self._base = self._tracemalloc.get_traced_memory()[0]
+        else:
+            self._base = gc.mem_alloc()
+        self._pico = 0
+    
+    def muestrear(self):
+        """Toma una muestra (solo necesario en MicroPython)."""
+        if self._tracemalloc is None:
+            self._pico = max(self._pico, gc.mem_alloc() - self._base)
+    
+    def pico(self):
+        """
+        Returns:
+            int: Bytes de pico por encima del uso inicial
+        """
+        if self._tracemalloc is not None:
+            return self._tracemalloc.get_traced_memory()[1] - self._base
+        return self._pico
+
+
+def _percentil(ordenados, fraccion):
+    """Percentil por el método del rango más cercano sobre una lista ordenada."""
+    if not ordenados:
+        return None
+    indice = min(len(ordenados) - 1, int(len(ordenados) * fraccion))
+    return round(ordenados[indice], 1)
+
+
+def _consultar_stream(adapter, mensajes, functions):
+    """Consume un stream completo y devuelve su fragmento final."""
+    final = None
+    for fragmento in adapter.consultar_stream(mensajes, functions):
+        final = fragmento
+    return final
+
+
+def medir(servidor, proveedor, modo="sync", transporte="keepalive", peticiones=20, concurrencia=4, herramientas=False):
+    """
+    Lanza peticiones de un proveedor contra el servidor simulado y mide el resultado.
+    Cada petición usa un adaptador nuevo con un único mensaje, de modo que el historial
+    no crece entre peticiones.
+    
+    Args:
+        servidor (MockProviderServer): Servidor simulado ya arrancado
+        proveedor (str): "openai", "claude" o "gemini"
+        modo (str): "sync", "stream" o "async"
+        transporte (str): Clave de TRANSPORTES (ignorado en modo async)
+        peticiones (int): Número de peticiones
+        concurrencia (int): Peticiones simultáneas en modo async
+        herramientas (bool): Si se ofrece una función, con lo que el servidor responde una llamada
+    
+    Returns:
+        dict: proveedor, modo, transporte, peticiones, errores, req_s y latencias
+              p50/p90/p99/max en ms, y memoria_pico en bytes
+    """
+    pool = TRANSPORTES[transporte]()
+    base = servidor.configurar(MCPFactory.create_adapter(proveedor, "mock", transporte=pool))
+    functions = [FUNCION_EJEMPLO] if herramientas else None
+    mensajes = [{"role": "user", "content": "Lee el sensor de temperatura"}]
+    
+    latencias = []
+    errores = 0
+    memoria = _Memoria()
+    
+    def nuevo_adapter():
+        adapter = base._clonar()
+        # Los errores inyectados se cuentan, no se reintentan
+        adapter.reintentos = None
+        return adapter
+    
+    def resultado_valido(respuesta):
+        return respuesta is not None and respuesta.get("type") != "error"
+    
+    memoria.iniciar()
+    inicio = reloj()
+    
+    if modo == "async":
+        from mcp_transport_async import AsyncKeepAliveTransport
+        base.transporte_async = AsyncKeepAliveTransport()
+        
+        async def trabajador(pendientes):
+            nonlocal errores
+            while pendientes:
+                pendientes.pop()
+                t = reloj()
+                respuesta = await nuevo_adapter().consultar_async(mensajes, functions)
+                latencias.append(ms_desde(t))
+                memoria.muestrear()
+                if not resultado_valido(respuesta):
+                    errores += 1
+        
+        async def lanzar():
+            pendientes = list(range(peticiones))
+            await asyncio.gather(*[trabajador(pendientes) for _ in range(concurrencia)])
+            base.transporte_async.cerrar()
+        
+        asyncio.run(lanzar())
+        transporte = "async"
+    else:
+        for _ in range(peticiones):
+            adapter = nuevo_adapter()
+            t = reloj()
+            if modo == "stream":
+                respuesta = _consultar_stream(adapter, mensajes, functions)
+            else:
+                respuesta = adapter.consultar(mensajes, functions)
+            latencias.append(ms_desde(t))
+            memoria.muestrear()
+            if not resultado_valido(respuesta):
+                errores += 1
+    
+    total_ms = ms_desde(inicio)
+    pool.cerrar()
+    
+    latencias.sort()
+    return {
+        "proveedor": proveedor,
+        "modo": modo,
+        "transporte": transporte,
+        "peticiones": peticiones,
+        "errores": errores,
+        "req_s": round(peticiones * 1000 / total_ms, 1) if total_ms else None,
+        "p50": _percentil(latencias, 0.5),
+        "p90": _percentil(latencias, 0.9),
+        "p99": _percentil(latencias, 0.99),
+        "max": round(latencias[-1], 1) if latencias else None,
+        "memoria_pico": memoria.pico()
+    }
+
+
+def ejecutar(proveedores=("openai", "claude", "gemini"), modos=("sync", "stream", "async"),
+             transportes=("keepalive", "urequests"), peticiones=20, concurrencia=4, herramientas=False,
+             servidor=None):
+    """
+    Ejecuta la batería completa y muestra una tabla con los resultados.
+    
+    Args:
+        proveedores (tuple): Proveedores a medir
+        modos (tuple): Modos de consulta ("sync", "stream", "async")
+        transportes (tuple): Transportes síncronos a comparar; los que no estén
+                             disponibles (p. ej. urequests en CPython) se omiten
+        peticiones (int): Peticiones por combinación
+        concurrencia (int): Peticiones simultáneas en modo async
+        herramientas (bool): Si se ofrece una función para obtener llamadas a herramientas
+        servidor (MockProviderServer): Servidor ya arrancado (por defecto uno local sin latencia)
+    
+    Returns:
+        list: Resultados de medir() para cada combinación
+    """
+    propio = servidor is None
+    if propio:
+        servidor = MockProviderServer()
+        servidor.iniciar_en_hilo()
+    
+    disponibles = []
+    for transporte in transportes:
+        if transporte == "urequests":
+            try:
+                import urequests
+            except ImportError:
+                print("urequests no está disponible, se omite su transporte")
+                continue
+        disponibles.append(transporte)
+    
+    resultados = []
+    for proveedor in proveedores:
+        for modo in modos:
+            for transporte in (["keepalive"] if modo == "async" else disponibles):
+                resultados.append(medir(servidor, proveedor, modo, transporte, peticiones, concurrencia, herramientas))
+    
+    if propio:
+        servidor.cerrar()
+    
+    # La tabla se muestra al final para no mezclarla con los mensajes de los adaptadores
+    print(f"{'proveedor':<9} {'modo':<7} {'transporte':<10} {'req/s':>7} {'p50':>7} {'p90':>7} {'p99':>7} {'max':>7} {'errores':>7} {'memoria':>9}")
+    for r in resultados:
+        print(f"{r['proveedor']:<9} {r['modo']:<7} {r['transporte']:<10} {r['req_s']:>7} {r['p50']:>7} "
+              f"{r['p90']:>7} {r['p99']:>7} {r['max']:>7} {r['errores']:>7} {r['memoria_pico']:>9}")
+    
+    return resultados
+
+
+if __name__ == "__main__":
+    # Uso: python mcp_bench.py [peticiones] [latencia_ms]
+    peticiones = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    latencia = float(sys.argv[2]) if len(sys.argv) > 2 else 0
+    servidor = MockProviderServer(latencia_ms=latencia)
+    servidor.iniciar_en_hilo()
+    ejecutar(peticiones=peticiones, servidor=servidor)
+    servidor.cerrar()
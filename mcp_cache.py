@@ -0,0 +1,204 @@
+# mcp_cache.py
+import json
+import os
+import time
+
+try:
+    import hashlib
+except ImportError:
+    import uhashlib as hashlib
+
+try:
+    import binascii
+except ImportError:
+    import ubinascii as binascii
+
+try:
+    from collections import OrderedDict
+except ImportError:
+    from ucollections import OrderedDict
+
+
+def clave_cache(partes):
+    """
+    Calcula la clave de caché de una petición a partir de sus partes ya codificadas.
+    
+    Args:
+        partes (list): Fragmentos en bytes o str que identifican la petición
+        
+    Returns:
+        str: Hash SHA-256 en hexadecimal
+    """
+    h = hashlib.sha256()
+    for parte in partes:
+        if isinstance(parte, str):
+            parte = parte.encode("utf-8")
+        h.update(parte)
+        # Separador para que ("ab", "c") y ("a", "bc") no coincidan
+        h.update(b"\x00")
+    return binascii.hexlify(h.digest()).decode()
+
+
+class ResponseCache:
+    """
+    Caché de respuestas estandarizadas de los adaptadores MCP.
+    Mantiene en RAM un LRU limitado por bytes y, opcionalmente, un almacén en
+    flash que sobrevive a los reinicios; ambos respetan el tiempo de vida (TTL).
+    """
+    
+    def __init__(self, max_bytes=8192, directorio=None, ttl=None):
+        """
+        Inicializa la caché.
+        
+        Args:
+            max_bytes (int): Tamaño máximo de las respuestas guardadas en RAM
+            directorio (str): Directorio de flash para persistir respuestas (None solo RAM)
+            ttl (int): Segundos de validez de las respuestas en RAM y flash (None sin caducidad)
+        """
+        self.max_bytes = max_bytes
+        self.directorio = directorio
+        self.ttl = ttl
+        self._entradas = OrderedDict()
+        self._bytes = 0
+        self.aciertos = 0
+        self.fallos = 0
+        
+        if directorio:
+            try:
+                os.mkdir(directorio)
+            except OSError:
+                # El directorio ya existe
+                pass
+    
+    def obtener(self, clave):
+        """
+        Busca una respuesta en RAM y, si no está, en flash.
+        
+        Args:
+            clave (str): Clave calculada con clave_cache()
+            
+        Returns:
+            dict: Copia de la respuesta estandarizada (sin "usage", ya que no consume
+                  tokens) o None si no está en caché
+        """
+        entrada = self._entradas.pop(clave, None)
+        if entrada is not None and self._caducada(entrada[0]):
+            self._bytes -= len(entrada[1])
+            entrada = None
+        
+        if entrada is not None:
+            # Volver a insertar al final marca la entrada como la más reciente
+            self._entradas[clave] = entrada
+        else:
+            entrada = self._leer_flash(clave)
+            if entrada is None:
+                self.fallos += 1
+                return None
+            self._insertar(clave, entrada[1], entrada[0])
+        
+        self.aciertos += 1
+        respuesta = json.loads(entrada[1])
+        respuesta.pop("usage", None)
+        return respuesta
+    
+    def guardar(self, clave, respuesta):
+        """
+        Guarda una respuesta estandarizada en RAM y, si está configurado, en flash.
+        
+        Args:
+            clave (str): Clave calculada con clave_cache()
+            respuesta (dict): Respuesta estandarizada del adaptador
+        """
+        # El uso de tokens pertenece a la petición original, no a las respuestas en caché
+        datos = json.dumps({k: v for k, v in respuesta.items() if k != "usage"})
+        if len(datos) > self.max_bytes:
+            return
+        
+        marca = time.time()
+        self._insertar(clave, datos, marca)
+        self._escribir_flash(clave, datos, marca)
+    
+    def _insertar(self, clave, datos, marca):
+        """Inserta una entrada en RAM con su marca de tiempo, expulsando las menos usadas hasta que quepa."""
+        anterior = self._entradas.pop(clave, None)
+        if anterior is not None:
+            self._bytes -= len(anterior[1])
+        
+        while self._entradas and self._bytes + len(datos) > self.max_bytes:
+            antigua = next(iter(self._entradas))
+            self._bytes -= len(self._entradas.pop(antigua)[1])
+        
+        self._entradas[clave] = (marca, datos)
+        self._bytes += len(datos)
+    
+    def _caducada(self, marca):
+        """Indica si una entrada guardada en el instante marca superó el TTL."""
+        return self.ttl is not None and time.time() - marca > self.ttl
+    
+    def limpiar(self):
+        """Vacía la caché en RAM y elimina las respuestas guardadas en flash."""
+        self._entradas = OrderedDict()
+        self._bytes = 0
+        if self.directorio:
+            for nombre in os.listdir(self.directorio):
+                self._eliminar(nombre)
+    
+    def purgar(self):
+        """
+        Elimina de flash las respuestas caducadas.
+        
+        Returns:
+            int: Número de archivos eliminados
+        """
+        if not self.directorio or self.ttl is None:
+            return 0
+        
+        eliminados = 0
+        for nombre in os.listdir(self.directorio):
+            if self._leer_archivo(nombre) is None:
+                eliminados += 1
+        return eliminados
+    
+    def _ruta(self, nombre):
+        """Ruta completa de un archivo de la caché en flash."""
+        return self.directorio + "/" + nombre
+    
+    def _leer_flash(self, clave):
+        """Lee una respuesta de flash como (marca, datos), o None si no existe o caducó."""
+        if not self.directorio:
+            return None
+        return self._leer_archivo(clave[:32] + ".json", clave)
+    
+    def _leer_archivo(self, nombre, clave=None):
+        """Lee un archivo de la caché en flash como (marca, datos) y lo elimina si caducó."""
+        try:
+            with open(self._ruta(nombre)) as archivo:
+                entrada = json.loads(archivo.read())
+        except (OSError, ValueError):
+            return None
+        
+        if clave is not None and entrada.get("k") != clave:
+            return None
+        
+        if self._caducada(entrada["t"]):
+            self._eliminar(nombre)
+            return None
+        
+        return entrada["t"], entrada["v"]
+    
+    def _escribir_flash(self, clave, datos, marca):
+        """Escribe una respuesta en flash junto con su marca de tiempo."""
+        if not self.directorio:
+            return
+        try:
+            with open(self._ruta(clave[:32] + ".json"), "w") as archivo:
+                archivo.write(json.dumps({"k": clave, "t": marca, "v": datos}))
+        except OSError as e:
+            print(f"No se pudo guardar la respuesta en flash: {e}")
+    
+    def _eliminar(self, nombre):
+        """Elimina un archivo de la caché en flash si existe."""
+        try:
+            os.remove(self._ruta(nombre))
+        except OSError:
+            pass
@@ -0,0 +1,342 @@
+# mcp_codec.py
+import json
+
+try:
+    import hashlib
+except ImportError:
+    import uhashlib as hashlib
+
+
+def codificar(valor):
+    """
+    Codifica un valor como JSON en bytes UTF-8.
+    
+    Args:
+        valor: Valor serializable a JSON
+        
+    Returns:
+        bytes: JSON codificado
+    """
+    return json.dumps(valor).encode("utf-8")
+
+
+def fragmentos_lista(piezas):
+    """
+    Construye los fragmentos de un array JSON a partir de elementos ya codificados.
+    
+    Args:
+        piezas (list): Elementos del array en bytes (cada uno puede contener varios elementos separados por comas)
+        
+    Returns:
+        list: Fragmentos en bytes que concatenados forman el array
+    """
+    partes = [b"["]
+    for i, pieza in enumerate(piezas):
+        if i:
+            partes.append(b", ")
+        partes.append(pieza)
+    partes.append(b"]")
+    return partes
+
+
+def fragmentos_objeto(campos):
+    """
+    Construye los fragmentos de un objeto JSON a partir de valores ya codificados.
+    
+    Args:
+        campos (list): Pares (clave, valor) donde clave es str y valor son bytes
+                       o una lista de fragmentos en bytes
+        
+    Returns:
+        list: Fragmentos en bytes que concatenados forman el objeto
+    """
+    partes = [b"{"]
+    for i, (clave, valor) in enumerate(campos):
+        if i:
+            partes.append(b", ")
+        partes.append(b'"' + clave.encode("utf-8") + b'": ')
+        if isinstance(valor, list):
+            partes.extend(valor)
+        else:
+            partes.append(valor)
+    partes.append(b"}")
+    return partes
+
+
+class EncodedBody:
+    """
+    Cuerpo de una petición como lista de fragmentos JSON ya codificados, sin unirlos
+    en memoria. Los transportes keep-alive los envían uno tras otro con la longitud
+    calculada de antemano; los fragmentos de los mensajes son los que ya guarda
+    EncodedHistory, así que el cuerpo apenas ocupa memoria adicional.
+    """
+    
+    __slots__ = ("fragmentos", "longitud")
+    
+    def __init__(self, fragmentos):
+        """
+        Args:
+            fragmentos (list): Fragmentos en bytes que concatenados forman el cuerpo
+        """
+        self.fragmentos = fragmentos
+        longitud = 0
+        for fragmento in fragmentos:
+            longitud += len(fragmento)
+        self.longitud = longitud
+    
+    def __len__(self):
+        return self.longitud
+    
+    def unir(self):
+        """
+        Returns:
+            bytes: Cuerpo completo, para transportes que no admiten fragmentos (urequests)
+        """
+        return b"".join(self.fragmentos)
+
+
+# Roles de los mensajes del historial; cada Message guarda el índice en lugar de la cadena
+ROLES = ("user", "assistant", "system", "tool")
+_CODIGOS = {"user": 0, "assistant": 1, "system": 2, "tool": 3}
+
+
+class Message:
+    """
+    Mensaje compacto del historial. El rol se guarda como código (índice de ROLES) y
+    las llamadas y resultados de herramientas solo ocupan memoria si existen.
+    Admite el acceso de un diccionario ({"role", "content", "tool_calls", "tool_results"})
+    para que el código que trata los mensajes como dict siga funcionando.
+    """
+    
+    __slots__ = ("codigo", "content", "tool_calls", "tool_results")
+    
+    def __init__(self, rol, content, tool_calls=None, tool_results=None):
+        """
+        Crea el mensaje.
+        
+        Args:
+            rol (str): Rol del mensaje ('user', 'assistant', 'tool'...)
+            content (str): Contenido del mensaje
+            tool_calls (list): Llamadas {"id", "name", "arguments"} del modelo, si las hay
+            tool_results (list): Resultados {"id", "name", "content"} de herramientas, si los hay
+        """
+        # Un rol desconocido se conserva como cadena
+        self.codigo = _CODIGOS.get(rol, rol)
+        self.content = content
+        self.tool_calls = tool_calls
+        self.tool_results = tool_results
+    
+    @property
+    def role(self):
+        """Rol del mensaje como cadena."""
+        codigo = self.codigo
+        return ROLES[codigo] if isinstance(codigo, int) else codigo
+    
+    def keys(self):
+        """Claves presentes, como en el diccionario equivalente."""
+        claves = ["role", "content"]
+        if self.tool_calls is not None:
+            claves.append("tool_calls")
+        if self.tool_results is not None:
+            claves.append("tool_results")
+        return claves
+    
+    def __getitem__(self, clave):
+        if clave == "role":
+            return self.role
+        if clave == "content":
+            return self.content
+        if clave == "tool_calls" and self.tool_calls is not None:
+            return self.tool_calls
+        if clave == "tool_results" and self.tool_results is not None:
+            return self.tool_results
+        raise KeyError(clave)
+    
+    def __setitem__(self, clave, valor):
+        if clave == "role":
+            self.codigo = _CODIGOS.get(valor, valor)
+        elif clave in ("content", "tool_calls", "tool_results"):
+            setattr(self, clave, valor)
+        else:
+            raise KeyError(clave)
+    
+    def __contains__(self, clave):
+        return clave in ("role", "content") or (clave in ("tool_calls", "tool_results") and getattr(self, clave) is not None)
+    
+    def get(self, clave, defecto=None):
+        """Valor de la clave o defecto si no existe, como dict.get()."""
+        return self[clave] if clave in self else defecto
+    
+    def __repr__(self):
+        return repr(dict(self))
+
+
+class TextMessageEncoder:
+    """
+    Codifica mensajes de texto directamente al JSON del proveedor, concatenando un
+    prefijo ya codificado por rol con el contenido, sin construir diccionarios intermedios.
+    """
+    
+    def __init__(self, formato, sufijo, alias=None):
+        """
+        Precodifica el prefijo de cada rol.
+        
+        Args:
+            formato (str): Inicio del JSON del mensaje con {rol} donde va el rol,
+                           terminado justo antes del contenido
+            sufijo (bytes): Cierre del JSON tras el contenido
+            alias (dict): Nombre del rol en el proveedor cuando difiere (p. ej. {"assistant": "model"})
+        """
+        self.formato = formato
+        self.sufijo = sufijo
+        self.alias = alias or {}
+        self._prefijos = [self._prefijo(rol) for rol in ROLES]
+    
+    def _prefijo(self, rol):
+        """Codifica el prefijo de un rol."""
+        return self.formato.replace("{rol}", json.dumps(self.alias.get(rol, rol))).encode("utf-8")
+    
+    def codificar(self, mensaje):
+        """
+        Codifica un mensaje de texto (Message o dict con "role" y "content").
+        
+        Args:
+            mensaje: Mensaje del historial
+            
+        Returns:
+            bytes: Mensaje codificado en JSON
+        """
+        if isinstance(mensaje, Message):
+            codigo = mensaje.codigo
+        else:
+            codigo = _CODIGOS.get(mensaje["role"], mensaje["role"])
+        prefijo = self._prefijos[codigo] if isinstance(codigo, int) else self._prefijo(codigo)
+        return prefijo + codificar(mensaje["content"]) + self.sufijo
+
+
+# Mensajes de texto en la forma estándar {"role", "content"} (OpenAI y Claude)
+TEXTO_ESTANDAR = TextMessageEncoder('{"role": {rol}, "content": ', b"}")
+
+
+class EncodedHistory:
+    """
+    Mantiene codificados en JSON los mensajes del historial para no volver a
+    serializar toda la conversación en cada petición: solo se codifican los
+    mensajes añadidos desde la última sincronización.
+    """
+    
+    def __init__(self, codificar_mensaje):
+        """
+        Inicializa la caché vacía.
+        
+        Args:
+            codificar_mensaje (callable): Función que recibe un mensaje del historial
+                                          y devuelve su JSON en bytes con el formato del proveedor
+        """
+        self.codificar_mensaje = codificar_mensaje
+        self._mensajes = []
+        self._piezas = []
+    
+    def sincronizar(self, historial):
+        """
+        Actualiza la caché con el historial actual y devuelve los mensajes codificados.
+        Si el historial solo creció, codifica únicamente los mensajes nuevos; si se
+        recortó o reemplazó, reutiliza la codificación de los mensajes que sigan presentes.
+        
+        Args:
+            historial (list): Historial de mensajes del adaptador
+            
+        Returns:
+            list: Un fragmento JSON en bytes por mensaje, en el mismo orden que el historial
+        """
+        mensajes = self._mensajes
+        n = len(mensajes)
+        
+        if n > len(historial) or (n and (historial[0] is not mensajes[0] or historial[n - 1] is not mensajes[n - 1])):
+            self._reconstruir(historial)
+            return self._piezas
+        
+        for i in range(n, len(historial)):
+            mensaje = historial[i]
+            mensajes.append(mensaje)
+            self._piezas.append(self.codificar_mensaje(mensaje))
+        
+        return self._piezas
+    
+    def _reconstruir(self, historial):
+        """Reconstruye la caché reutilizando los mensajes que ya estaban codificados."""
+        previas = {}
+        for mensaje, pieza in zip(self._mensajes, self._piezas):
+            previas[id(mensaje)] = (mensaje, pieza)
+        
+        mensajes = []
+        piezas = []
+        for mensaje in historial:
+            previa = previas.get(id(mensaje))
+            if previa is not None and previa[0] is mensaje:
+                piezas.append(previa[1])
+            else:
+                piezas.append(self.codificar_mensaje(mensaje))
+            mensajes.append(mensaje)
+        
+        self._mensajes = mensajes
+        self._piezas = piezas
+    
+    def invalidar(self):
+        """Descarta la caché; necesario si se modifica un mensaje del historial en el lugar."""
+        self._mensajes = []
+        self._piezas = []
+
+
+class ToolSchemaCache:
+    """
+    Caché de esquemas de herramientas convertidos al formato de un proveedor.
+    Guarda la estructura nativa y su JSON ya codificado, indexados por la identidad
+    de la lista de funciones y, si esta cambia, por un hash de su contenido.
+    """
+    
+    def __init__(self, max_entradas=4):
+        """
+        Inicializa la caché vacía.
+        
+        Args:
+            max_entradas (int): Número máximo de listas de funciones distintas a conservar
+        """
+        self.max_entradas = max_entradas
+        # Entradas [functions, longitud, huella, nativo, codificado], la más reciente primero
+        self._entradas = []
+    
+    def obtener(self, functions, convertir):
+        """
+        Devuelve las herramientas convertidas y codificadas, convirtiéndolas solo si no están en caché.
+        
+        Args:
+            functions (list): Funciones en formato OpenAI (estándar)
+            convertir (callable): Función que convierte la lista al formato del proveedor
+            
+        Returns:
+            tuple: (nativo, codificado) con la estructura del proveedor y su JSON en bytes
+        """
+        # Misma lista que en peticiones anteriores: sin conversión ni codificación
+        for entrada in self._entradas:
+            if entrada[0] is functions and entrada[1] == len(functions):
+                return entrada[3], entrada[4]
+        
+        # Lista nueva con el mismo contenido que una ya convertida
+        huella = hashlib.sha256(codificar(functions)).digest()
+        for entrada in self._entradas:
+            if entrada[2] == huella:
+                entrada[0] = functions
+                entrada[1] = len(functions)
+                return entrada[3], entrada[4]
+        
+        nativo = convertir(functions)
+        codificado = codificar(nativo)
+        self._entradas.insert(0, [functions, len(functions), huella, nativo, codificado])
+        del self._entradas[self.max_entradas:]
+        
+        return nativo, codificado
+    
+    def invalidar(self):
+        """Descarta todas las entradas; necesario si se modifica una lista de funciones en el lugar."""
+        self._entradas = []
@@ -1,7 +1,61 @@
 # mcp_factory.py
-from openai_mcp_adapter import OpenAIMCPAdapter
-from claude_mcp_adapter import ClaudeMCPAdapter
-from gemini_mcp_adapter import GeminiMCPAdapter
+import sys
+
+# Proveedores disponibles: nombre -> [módulo, clase, modelo predeterminado].
+# El módulo solo se importa la primera vez que se crea un adaptador de ese proveedor,
+# por lo que un dispositivo que usa uno solo no carga los demás en memoria.
+_PROVEEDORES = {
+    "openai": ["openai_mcp_adapter", "OpenAIMCPAdapter", "gpt-3.5-turbo"],
+    "claude": ["claude_mcp_adapter", "ClaudeMCPAdapter", "claude-3-7-sonnet-20250219"],
+    "gemini": ["gemini_mcp_adapter", "GeminiMCPAdapter", "gemini-2.0-flash"],
+}
+
+
+def registrar_proveedor(nombre, modulo, clase=None, modelo=None):
+    """
+    Registra (o reemplaza) un proveedor para MCPFactory.create_adapter().
+    
+    Args:
+        nombre (str): Nombre del proveedor (sin distinguir mayúsculas)
+        modulo (str/type): Nombre del módulo a importar al crear el primer adaptador
+                           (también congelado o .mpy), o la clase del adaptador ya importada
+        clase (str): Nombre de la clase dentro del módulo (no se usa si modulo es una clase)
+        modelo (str): Modelo predeterminado del proveedor
+    """
+    if isinstance(modulo, str):
+        _PROVEEDORES[nombre.lower()] = [modulo, clase, modelo]
+    else:
+        _PROVEEDORES[nombre.lower()] = [None, modulo, modelo]
+
+
+def proveedores_registrados():
+    """
+    Returns:
+        list: Nombres de los proveedores registrados
+    """
+    return list(_PROVEEDORES)
+
+
+def _clase_adapter(nombre):
+    """
+    Devuelve la clase del adaptador de un proveedor, importando su módulo si es la primera vez.
+    
+    Args:
+        nombre (str): Nombre del proveedor en minúsculas
+        
+    Returns:
+        tuple: (clase, modelo predeterminado)
+    """
+    entrada = _PROVEEDORES[nombre]
+    modulo, clase = entrada[0], entrada[1]
+    if modulo is not None:
+        # __import__ busca también módulos congelados y .mpy; sys.modules da el submódulo si es un paquete
+        __import__(modulo)
+        clase = getattr(sys.modules[modulo], clase)
+        # Se sustituye la entrada entera: otro hilo que la esté resolviendo a la vez sigue viendo la original
+        _PROVEEDORES[nombre] = [None, clase, entrada[2]]
+    return clase, entrada[2]
+
 
 class MCPFactory:
     """
@@ -10,16 +64,17 @@ class MCPFactory:
     """
     
     @staticmethod
-    def create_adapter(provider, api_key, modelo=None, max_tokens=50, temperatura=0.7):
+    def create_adapter(provider, api_key, modelo=None, max_tokens=50, temperatura=0.7, transporte=None):
         """
         Crea un adaptador MCP basado en el proveedor especificado.
         
         Args:
-            provider (str): Proveedor de LLM ("openai", "claude", "gemini")
+            provider (str): Proveedor de LLM ("openai", "claude", "gemini" o uno registrado)
             api_key (str): Clave API para el proveedor
             modelo (str): Identificador del modelo a utilizar (específico para cada proveedor)
             max_tokens (int): Número máximo de tokens en la respuesta
             temperatura (float): Nivel de aleatoriedad (0.0-1.0)
+            transporte (Transport): Transporte HTTP (por defecto el pool keep-alive compartido)
             
         Returns:
             MCPAdapter: Una instancia del adaptador apropiado
@@ -29,23 +84,90 @@ class MCPFactory:
         """
         provider = provider.lower()
         
-        if provider == "openai":
-            # Usar modelo predeterminado si no se especifica
-            if modelo is None:
-                modelo = "gpt-3.5-turbo"
-            return OpenAIMCPAdapter(api_key, modelo, max_tokens, temperatura)
-        
-        elif provider == "claude":
-            # Usar modelo predeterminado si no se especifica
-            if modelo is None:
-                modelo = "claude-3-7-sonnet-20250219"
-            return ClaudeMCPAdapter(api_key, modelo, max_tokens, temperatura)
-        
-        elif provider == "gemini":
-            # Usar modelo predeterminado si no se especifica
-            if modelo is None:
-                modelo = "gemini-2.0-flash"
-            return GeminiMCPAdapter(api_key, modelo, max_tokens, temperatura)
-        
-        else:
-            raise ValueError(f"Proveedor '{provider}' no compatible. Use 'openai', 'claude' o 'gemini'.")
\ No newline at end of file
+        if provider not in _PROVEEDORES:
+            raise ValueError(f"Proveedor '{provider}' no compatible. Use {', '.join(repr(p) for p in _PROVEEDORES)}.")
+        
+        clase, modelo_predeterminado = _clase_adapter(provider)
+        
+        # Usar modelo predeterminado si no se especifica
+        if modelo is None:
+            modelo = modelo_predeterminado
+        return clase(api_key, modelo, max_tokens, temperatura, transporte)
+    
+    @staticmethod
+    def registrar_proveedor(nombre, modulo, clase=None, modelo=None):
+        """
+        Registra un proveedor adicional; equivale a registrar_proveedor() del módulo.
+        
+        Args:
+            nombre (str): Nombre del proveedor
+            modulo (str/type): Módulo a importar de forma diferida o clase del adaptador
+            clase (str): Nombre de la clase dentro del módulo
+            modelo (str): Modelo predeterminado del proveedor
+        """
+        registrar_proveedor(nombre, modulo, clase, modelo)
+    
+    @staticmethod
+    def create_hedged_adapter(proveedores, retardo_ms=None, max_tokens=50, temperatura=0.7, transporte=None):
+        """
+        Crea un adaptador compuesto que consulta varios proveedores en paralelo
+        y devuelve la primera respuesta válida.
+        
+        Args:
+            proveedores (list): Tuplas (provider, api_key) o (provider, api_key, modelo),
+                                en orden de preferencia
+            retardo_ms (int): Espera antes de lanzar cada petición de respaldo
+                              (None las lanza todas a la vez)
+            max_tokens (int): Número máximo de tokens en la respuesta
+            temperatura (float): Nivel de aleatoriedad (0.0-1.0)
+            transporte (Transport): Transporte HTTP (por defecto el pool keep-alive compartido)
+            
+        Returns:
+            HedgedAdapter: Adaptador compuesto
+            
+        Raises:
+            ValueError: Si algún proveedor no es compatible o la lista está vacía
+        """
+        # Importación diferida: solo se carga asyncio si se usa el adaptador compuesto
+        from mcp_hedge import HedgedAdapter
+        
+        if not proveedores:
+            raise ValueError("Se necesita al menos un proveedor.")
+        
+        adapters = []
+        for proveedor in proveedores:
+            modelo = proveedor[2] if len(proveedor) > 2 else None
+            adapters.append(MCPFactory.create_adapter(proveedor[0], proveedor[1], modelo, max_tokens, temperatura, transporte))
+        
+        return HedgedAdapter(adapters, retardo_ms)
+    
+    @staticmethod
+    def create_router_adapter(proveedores, max_tokens=50, temperatura=0.7, transporte=None, **opciones):
+        """
+        Crea un adaptador compuesto que envía cada consulta al proveedor con mejor
+        latencia y tasa de errores recientes, y pasa al siguiente si falla.
+        
+        Args:
+            proveedores (list): Tuplas (provider, api_key) o (provider, api_key, modelo)
+            max_tokens (int): Número máximo de tokens en la respuesta
+            temperatura (float): Nivel de aleatoriedad (0.0-1.0)
+            transporte (Transport): Transporte HTTP (por defecto el pool keep-alive compartido)
+            **opciones: alfa, penalizacion_error y vida_media_error de RouterAdapter
+            
+        Returns:
+            RouterAdapter: Adaptador compuesto
+            
+        Raises:
+            ValueError: Si algún proveedor no es compatible o la lista está vacía
+        """
+        from mcp_router import RouterAdapter
+        
+        if not proveedores:
+            raise ValueError("Se necesita al menos un proveedor.")
+        
+        adapters = []
+        for proveedor in proveedores:
+            modelo = proveedor[2] if len(proveedor) > 2 else None
+            adapters.append(MCPFactory.create_adapter(proveedor[0], proveedor[1], modelo, max_tokens, temperatura, transporte))
+        
+        return RouterAdapter(adapters, **opciones)
\ No newline at end of file
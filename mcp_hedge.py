@@ -0,0 +1,199 @@
+# mcp_hedge.py
+try:
+    import asyncio
+except ImportError:
+    import uasyncio as asyncio
+
+from mcp_base import MCPAdapter
+from mcp_metrics import nuevo_registro
+from mcp_resilience import error_estructurado, error_excepcion, es_error
+
+
+class HedgedAdapter(MCPAdapter):
+    """
+    Adaptador compuesto que envía la misma conversación a varios proveedores y se
+    queda con la primera respuesta válida, cancelando las peticiones más lentas.
+    Con retardo_ms las peticiones de respaldo solo se lanzan si la principal tarda
+    más de ese umbral (o falla antes).
+    """
+    
+    nombre_proveedor = "Hedged"
+    
+    def __init__(self, adapters, retardo_ms=None):
+        """
+        Inicializa el adaptador compuesto.
+        
+        Args:
+            adapters (list): Adaptadores MCP en orden de preferencia
+            retardo_ms (int): Espera antes de lanzar cada petición de respaldo
+                              (None las lanza todas a la vez)
+        """
+        principal = adapters[0]
+        super().__init__(principal.api_key, principal.modelo, principal.max_tokens, principal.temperatura, principal.transporte)
+        self.familia_tokens = principal.familia_tokens
+        self.adapters = adapters
+        self.retardo_ms = retardo_ms
+        # Adaptador que respondió la última consulta
+        self.ultimo_ganador = None
+        # Bucle de eventos de consultar(), creado la primera vez y conservado entre consultas
+        # para que las conexiones del pool asíncrono, ligadas a él, se reutilicen
+        self._bucle = None
+    
+    def consultar(self, nuevos_mensajes=None, functions=None, function_call="auto"):
+        """
+        Versión síncrona de consultar_async(): ejecuta la carrera en un bucle de eventos propio.
+        No debe llamarse desde una tarea asyncio; en ese caso use consultar_async().
+        
+        Returns:
+            dict: Respuesta estandarizada del proveedor más rápido o el último error si todos fallan
+        """
+        if self._bucle is None:
+            self._bucle = asyncio.new_event_loop()
+        return self._bucle.run_until_complete(self.consultar_async(nuevos_mensajes, functions, function_call))
+    
+    def cerrar(self):
+        """Cierra el bucle de eventos de consultar(), si se llegó a crear."""
+        if self._bucle is not None:
+            self._bucle.close()
+            self._bucle = None
+    
+    async def consultar_async(self, nuevos_mensajes=None, functions=None, function_call="auto"):
+        """
+        Envía la conversación a los proveedores y devuelve la primera respuesta válida.
+        
+        Args:
+            nuevos_mensajes (list): Lista opcional de mensajes a agregar al historial
+            functions (list): Lista opcional de funciones disponibles para el modelo
+            function_call (str): Modo de llamada a funciones ("auto", "none", o nombre específico)
+            
+        Returns:
+            dict: Respuesta estandarizada del proveedor más rápido o el último error si todos fallan
+        """
+        if nuevos_mensajes:
+            for mensaje in nuevos_mensajes:
+                self.agregar_mensaje(mensaje["role"], mensaje["content"])
+        
+        self._aplicar_politica_historial()
+        self._sincronizar_adapters()
+        
+        # Responder desde la caché del adaptador compuesto sin lanzar la carrera
+        clave, respuesta = self._buscar_en_cache(functions, function_call)
+        if respuesta is not None:
+            registro = nuevo_registro(self.nombre_proveedor, self.modelo, "async") if self.hooks_metricas else None
+            return self._emitir_metricas(registro, respuesta, cache=True)
+        
+        estado = {
+            "ganador": None,
+            "respuesta": None,
+            "registro": None,
+            "error": None,
+            "terminadas": 0,
+            "listo": asyncio.Event(),
+            "fallo": asyncio.Event()
+        }
+        
+        tareas = []
+        for i, adapter in enumerate(self.adapters):
+            retardo = 0 if i == 0 or self.retardo_ms is None else self.retardo_ms * i
+            tareas.append(asyncio.create_task(self._intentar(adapter, retardo, functions, function_call, estado)))
+        
+        await estado["listo"].wait()
+        
+        # Cancelar las peticiones que siguen en curso y esperar a que terminen de cerrarse,
+        # para no dejar tareas pendientes en el bucle persistente de consultar()
+        for tarea in tareas:
+            tarea.cancel()
+        await asyncio.gather(*tareas, return_exceptions=True)
+        
+        ganador = estado["ganador"]
+        if ganador is None:
+            return estado["error"] or error_estructurado(None, "Ningún proveedor devolvió una respuesta válida", True)
+        
+        self.ultimo_ganador = ganador
+        print(f"Respuesta más rápida: {ganador.nombre_proveedor}")
+        
+        # Solo el ganador procesa la respuesta, por lo que el historial compartido recibe un único mensaje
+        registro = estado["registro"]
+        respuesta = ganador._procesar(estado["respuesta"], registro)
+        return self._emitir_metricas(registro, self._guardar_en_cache(clave, respuesta))
+    
+    async def _intentar(self, adapter, retardo_ms, functions, function_call, estado):
+        """Lanza la petición a un proveedor, tras el retardo de respaldo si corresponde."""
+        if retardo_ms:
+            # Esperar el umbral de latencia, salvo que otra petición falle antes
+            try:
+                await asyncio.wait_for(estado["fallo"].wait(), retardo_ms / 1000)
+            except asyncio.TimeoutError:
+                pass
+        
+        if estado["ganador"] is not None:
+            return
+        
+        # Cada intento se mide por separado, con el nombre de su proveedor
+        registro = nuevo_registro(adapter.nombre_proveedor, adapter.modelo, "async") if self.hooks_metricas else None
+        
+        # Sin reintentos internos: el respaldo es el siguiente proveedor
+        try:
+            response = await adapter._realizar_peticion_async(functions, function_call, reintentar=False, registro=registro)
+        except Exception as e:
+            response = error_excepcion(e)
+        
+        estado["terminadas"] += 1
+        
+        if es_error(response):
+            estado["error"] = self._emitir_metricas(registro, response)
+            estado["fallo"].set()
+        elif estado["ganador"] is None:
+            estado["ganador"] = adapter
+            estado["respuesta"] = response
+            estado["registro"] = registro
+            estado["listo"].set()
+        
+        if estado["terminadas"] == len(self.adapters):
+            estado["listo"].set()
+    
+    def consultar_stream(self, nuevos_mensajes=None, functions=None, function_call="auto"):
+        """
+        El streaming no se duplica entre proveedores: se delega en el adaptador principal.
+        """
+        self._sincronizar_adapters()
+        return self.adapters[0].consultar_stream(nuevos_mensajes, functions, function_call)
+    
+    def estimar_tokens(self, functions=None):
+        """
+        Estima los tokens con el adaptador principal: todos envían la misma
+        conversación, así que su estimación vale para la carrera.
+        
+        Args:
+            functions (list): Funciones que se enviarán con la petición
+            
+        Returns:
+            int: Tokens estimados
+        """
+        self._sincronizar_adapters()
+        return self.adapters[0].estimar_tokens(functions)
+    
+    def _mensajes_codificados(self):
+        """Historial codificado por el adaptador principal, para la clave de caché."""
+        return self.adapters[0]._mensajes_codificados()
+    
+    def _herramientas_codificadas(self, functions):
+        """Herramientas codificadas por el adaptador principal (las usan la caché y la estimación)."""
+        return self.adapters[0]._herramientas_codificadas(functions)
+    
+    def _sincronizar_adapters(self):
+        """
+        Comparte el historial, los mensajes fijados, el mensaje de sistema y el diario con
+        los adaptadores internos: la respuesta del ganador llega al diario y los fijados
+        sobreviven a la política de historial y a la compactación.
+        """
+        for adapter in self.adapters:
+            adapter.historial = self.historial
+            adapter._fijados = self._fijados
+            # Reasignar el mismo system descartaría su codificación
+            if adapter.system != self.system:
+                adapter.system = self.system
+            adapter.journal = self.journal
+            # Con un agrupador en el compuesto, cada proveedor agrupa sus peticiones idénticas
+            if self.coalescer is not None:
+                adapter.coalescer = self.coalescer
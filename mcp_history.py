@@ -0,0 +1,131 @@
+# mcp_history.py
+from mcp_codec import Message
+
+class HistoryPolicy:
+    """
+    Política de recorte del historial de conversación.
+    Limita el número de mensajes y los tokens estimados eliminando los turnos más
+    antiguos (un mensaje de usuario y todo lo que le sigue hasta el siguiente), de modo
+    que el historial resultante sigue empezando por un mensaje de usuario y conserva
+    la alternancia user/assistant que exigen Claude y Gemini.
+    """
+    
+    def __init__(self, max_mensajes=None, max_tokens=None, colapsar=False, max_caracteres_resumen=300):
+        """
+        Inicializa la política.
+        
+        Args:
+            max_mensajes (int): Número máximo de mensajes en el historial (None sin límite)
+            max_tokens (int): Presupuesto máximo de tokens estimados, incluido el mensaje de sistema
+            colapsar (bool): Si es True los turnos eliminados se resumen en un único intercambio
+            max_caracteres_resumen (int): Longitud máxima del resumen de los turnos eliminados
+        """
+        self.max_mensajes = max_mensajes
+        self.max_tokens = max_tokens
+        self.colapsar = colapsar
+        self.max_caracteres_resumen = max_caracteres_resumen
+    
+    def aplicar(self, historial, fijados, estimar, system=""):
+        """
+        Recorta el historial en el lugar si supera los límites.
+        Nunca elimina el último turno ni los turnos que contienen mensajes fijados.
+        
+        Args:
+            historial (list): Historial de mensajes del adaptador
+            fijados (dict): Mensajes fijados indexados por id()
+            estimar (callable): Función que estima los tokens de un mensaje
+            system (str): Mensaje de sistema, que cuenta para el presupuesto de tokens
+            
+        Returns:
+            int: Número de mensajes eliminados
+        """
+        if self.max_mensajes is None and self.max_tokens is None:
+            return 0
+        
+        costes = [estimar(mensaje) for mensaje in historial]
+        base = estimar({"role": "system", "content": system}) if system else 0
+        turnos = self._turnos(historial)
+        
+        eliminar = self._seleccionar(historial, fijados, costes, base, turnos, 0, 0)
+        if not eliminar:
+            return 0
+        
+        resumen = None
+        if self.colapsar:
+            # Reservar espacio para el intercambio de resumen y volver a seleccionar
+            resumen = self._resumen(historial, eliminar)
+            reserva = estimar(resumen[0]) + estimar(resumen[1])
+            eliminar = self._seleccionar(historial, fijados, costes, base, turnos, 2, reserva)
+            resumen = self._resumen(historial, eliminar)
+        
+        nuevo = []
+        siguiente = 0
+        for ini, fin in eliminar:
+            nuevo.extend(historial[siguiente:ini])
+            # El resumen ocupa el lugar del primer turno eliminado
+            if resumen is not None:
+                nuevo.extend(resumen)
+                resumen = None
+            siguiente = fin
+        nuevo.extend(historial[siguiente:])
+        
+        eliminados = len(historial) - len(nuevo)
+        historial[:] = nuevo
+        return eliminados
+    
+    def _turnos(self, historial):
+        """Divide el historial en turnos (inicio, fin) que empiezan en un mensaje de usuario."""
+        turnos = []
+        inicio = 0
+        for i in range(1, len(historial)):
+            if historial[i]["role"] == "user":
+                turnos.append((inicio, i))
+                inicio = i
+        if historial:
+            turnos.append((inicio, len(historial)))
+        return turnos
+    
+    def _excede(self, mensajes, tokens):
+        """Indica si el tamaño actual supera alguno de los límites."""
+        if self.max_mensajes is not None and mensajes > self.max_mensajes:
+            return True
+        if self.max_tokens is not None and tokens > self.max_tokens:
+            return True
+        return False
+    
+    def _seleccionar(self, historial, fijados, costes, base, turnos, mensajes_extra, tokens_extra):
+        """Elige los turnos a eliminar, del más antiguo al más reciente."""
+        mensajes = len(historial) + mensajes_extra
+        tokens = base + sum(costes) + tokens_extra
+        eliminar = []
+        
+        for ini, fin in turnos[:-1]:
+            if not self._excede(mensajes, tokens):
+                break
+            if any(id(historial[i]) in fijados for i in range(ini, fin)):
+                continue
+            eliminar.append((ini, fin))
+            mensajes -= fin - ini
+            tokens -= sum(costes[ini:fin])
+        
+        return eliminar
+    
+    def _resumen(self, historial, eliminar):
+        """Construye el intercambio user/assistant que sustituye a los turnos eliminados."""
+        lineas = []
+        restante = self.max_caracteres_resumen
+        for ini, fin in eliminar:
+            for i in range(ini, fin):
+                if restante <= 0:
+                    break
+                contenido = historial[i]["content"]
+                if not isinstance(contenido, str) or not contenido:
+                    continue
+                linea = f"{historial[i]['role']}: {contenido}"[:restante]
+                lineas.append(linea)
+                restante -= len(linea)
+        
+        return [
+            Message("user", "Resumen de la conversación anterior:\n" + "\n".join(lineas)),
+            Message("assistant", "Entendido.")
+        ]
@@ -0,0 +1,353 @@
+# mcp_journal.py
+import json
+import os
+
+from mcp_codec import Message
+
+
+class ConversationJournal:
+    """
+    Diario de la conversación en flash: cada mensaje se añade como una línea JSON al
+    final del fichero, sin reescribirlo. Un índice pequeño guarda la posición de uno de
+    cada `intervalo` mensajes y la del último mensaje de sistema, de modo que al reanudar
+    solo se lee la cola necesaria. Cuando el fichero crece demasiado se compacta
+    reescribiéndolo con el historial vigente.
+    """
+    
+    def __init__(self, ruta, max_bytes=16384, intervalo=16):
+        """
+        Inicializa el diario sin abrir todavía el fichero.
+        
+        Args:
+            ruta (str): Fichero del diario (el índice se guarda en ruta + ".idx")
+            max_bytes (int): Tamaño a partir del cual se compacta el fichero
+            intervalo (int): Mensajes entre dos posiciones guardadas en el índice (los cambios
+                             del mensaje de sistema no cuentan)
+        """
+        self.ruta = ruta
+        self.ruta_indice = ruta + ".idx"
+        self.max_bytes = max_bytes
+        self.intervalo = intervalo
+        self._fichero = None
+        # Posición de los mensajes 0, intervalo, 2*intervalo..., del último mensaje de sistema
+        # y de los mensajes fijados
+        self._posiciones = None
+        self._system = None
+        self._fijados = []
+        # Líneas de mensajes (todas salvo las de sistema)
+        self._mensajes = 0
+        self._bytes = 0
+        # Tamaño tras la última compactación, para no compactar en cada mensaje
+        # si el historial vigente ya supera max_bytes
+        self._bytes_compactados = 0
+    
+    def anotar(self, mensaje, fijar=False):
+        """
+        Añade un mensaje al final del diario.
+        
+        Args:
+            mensaje (Message): Mensaje del historial
+            fijar (bool): Si el mensaje está fijado frente a la política de historial
+        """
+        registro = dict(mensaje)
+        if fijar:
+            registro["pin"] = True
+        self._escribir(registro)
+    
+    def anotar_system(self, contenido):
+        """
+        Añade un cambio del mensaje de sistema y guarda su posición en el índice.
+        
+        Args:
+            contenido (str): Nuevo mensaje de sistema
+        """
+        self._escribir({"role": "system", "content": contenido}, system=True)
+    
+    def necesita_compactar(self):
+        """
+        Returns:
+            bool: Si el fichero supera max_bytes y ha crecido desde la última compactación
+        """
+        return self._bytes > self.max_bytes and self._bytes >= 2 * self._bytes_compactados
+    
+    def compactar(self, historial, system="", fijados=None):
+        """
+        Reescribe el diario con el historial vigente (en un fichero temporal que después
+        sustituye al original, para no perder el diario si se corta la alimentación).
+        
+        Args:
+            historial (list): Historial actual del adaptador
+            system (str): Mensaje de sistema actual
+            fijados (dict): Mensajes fijados por id()
+        """
+        self.cerrar()
+        temporal = self.ruta + ".tmp"
+        posiciones = []
+        posicion_system = None
+        posiciones_fijados = []
+        mensajes = 0
+        posicion = 0
+        
+        with open(temporal, "wb") as f:
+            registros = []
+            if system:
+                registros.append({"role": "system", "content": system})
+            for mensaje in historial:
+                registro = dict(mensaje)
+                if fijados and id(mensaje) in fijados:
+                    registro["pin"] = True
+                registros.append(registro)
+            
+            for registro in registros:
+                if registro["role"] == "system":
+                    posicion_system = posicion
+                else:
+                    if mensajes % self.intervalo == 0:
+                        posiciones.append(posicion)
+                    mensajes += 1
+                if registro.get("pin"):
+                    posiciones_fijados.append(posicion)
+                linea = json.dumps(registro).encode("utf-8") + b"\n"
+                f.write(linea)
+                posicion += len(linea)
+        
+        _reemplazar(temporal, self.ruta)
+        self._posiciones = posiciones
+        self._system = posicion_system
+        self._fijados = posiciones_fijados
+        self._mensajes = mensajes
+        self._bytes = posicion
+        self._bytes_compactados = posicion
+        self._guardar_indice()
+    
+    def cargar(self, max_mensajes=None):
+        """
+        Lee el último mensaje de sistema, los mensajes fijados y la cola del historial.
+        
+        Args:
+            max_mensajes (int): Número máximo de mensajes de la cola a recuperar, sin contar
+                                el sistema ni los fijados anteriores a ella (None todos)
+        
+        Returns:
+            tuple: (system, mensajes) donde mensajes son tuplas (Message, fijado)
+        """
+        self._preparar()
+        if not self._bytes:
+            return "", []
+        
+        system = ""
+        if self._system is not None:
+            for registro in self._leer_desde(self._system, 1):
+                if registro is not None:
+                    system = registro["content"]
+        
+        if not self._posiciones:
+            return system, []
+        
+        # Primer mensaje necesario y posición guardada más cercana por delante de él
+        inicio = 0 if max_mensajes is None else max(0, self._mensajes - max_mensajes)
+        bloque = min(inicio // self.intervalo, len(self._posiciones) - 1)
+        saltar = inicio - bloque * self.intervalo
+        
+        # Los mensajes fijados anteriores a la cola se leen uno a uno
+        fijados = []
+        for posicion in self._fijados:
+            if posicion < self._posiciones[bloque]:
+                for registro in self._leer_desde(posicion, 1):
+                    if registro is not None:
+                        fijados.append(_mensaje(registro))
+        
+        cola = []
+        i = 0
+        for registro in self._leer_desde(self._posiciones[bloque]):
+            # Las líneas de sistema no cuentan como mensajes; las dañadas sí, como al indexar
+            if registro is not None and registro["role"] == "system":
+                continue
+            i += 1
+            if registro is None:
+                continue
+            if i <= saltar:
+                if registro.get("pin"):
+                    fijados.append(_mensaje(registro))
+                continue
+            cola.append(_mensaje(registro))
+        
+        # La cola puede empezar a mitad de un turno: se descarta hasta el primer mensaje de usuario
+        while cola and (cola[0][0].role != "user" or "tool_results" in cola[0][0]):
+            descartado = cola.pop(0)
+            if descartado[1]:
+                fijados.append(descartado)
+        
+        return system, fijados + cola
+    
+    def borrar(self):
+        """Elimina el diario y su índice."""
+        self.cerrar()
+        for ruta in (self.ruta, self.ruta_indice):
+            try:
+                os.remove(ruta)
+            except OSError:
+                pass
+        self._posiciones = []
+        self._system = None
+        self._fijados = []
+        self._mensajes = 0
+        self._bytes = 0
+        self._bytes_compactados = 0
+    
+    def cerrar(self):
+        """Cierra el fichero del diario (se vuelve a abrir al anotar)."""
+        if self._fichero is not None:
+            self._fichero.close()
+            self._fichero = None
+    
+    def _escribir(self, registro, system=False):
+        """Añade una línea al diario y actualiza el índice si un mensaje empieza un nuevo bloque."""
+        self._preparar()
+        if self._fichero is None:
+            self._fichero = open(self.ruta, "ab")
+        
+        linea = json.dumps(registro).encode("utf-8") + b"\n"
+        nuevo_bloque = not system and self._mensajes % self.intervalo == 0
+        if nuevo_bloque:
+            self._posiciones.append(self._bytes)
+        if system:
+            self._system = self._bytes
+        fijado = registro.get("pin", False)
+        if fijado:
+            self._fijados.append(self._bytes)
+        
+        self._fichero.write(linea)
+        self._fichero.flush()
+        if not system:
+            self._mensajes += 1
+        self._bytes += len(linea)
+        
+        # El índice solo se reescribe una vez por bloque, al cambiar el sistema o al fijar un mensaje
+        if nuevo_bloque or system or fijado:
+            self._guardar_indice()
+    
+    def _preparar(self):
+        """
+        Carga el índice la primera vez y cuenta los mensajes de la cola. Si el índice
+        falta o no corresponde al fichero, se reconstruye leyéndolo entero.
+        """
+        if self._posiciones is not None:
+            return
+        
+        try:
+            self._bytes = os.stat(self.ruta)[6]
+        except OSError:
+            self._posiciones = []
+            return
+        
+        try:
+            with open(self.ruta_indice) as f:
+                indice = json.load(f)
+            posiciones = indice["posiciones"]
+            if indice["intervalo"] != self.intervalo or not posiciones or not self._inicio_de_linea(posiciones[-1]):
+                raise ValueError("Índice desactualizado")
+            self._posiciones = posiciones
+            self._system = indice["system"]
+            self._fijados = indice["fijados"]
+        except (OSError, ValueError, KeyError):
+            # Sin índice válido se recorre el fichero completo
+            self._posiciones = []
+            self._system = None
+            self._fijados = []
+        
+        # Recorrer desde la última posición guardada para contar los mensajes de la cola
+        completo = not self._posiciones
+        inicio = 0 if completo else self._posiciones[-1]
+        self._mensajes = 0 if completo else (len(self._posiciones) - 1) * self.intervalo
+        self._escanear(inicio)
+        self._bytes_compactados = self._bytes
+        if completo:
+            self._guardar_indice()
+    
+    def _inicio_de_linea(self, posicion):
+        """Comprueba que una posición del índice sigue siendo el inicio de una línea del fichero."""
+        if posicion == 0:
+            return True
+        if posicion >= self._bytes:
+            return False
+        with open(self.ruta, "rb") as f:
+            f.seek(posicion - 1)
+            return f.read(1) == b"\n"
+    
+    def _escanear(self, posicion):
+        """
+        Recorre las líneas desde una posición, añadiendo al índice el inicio de cada bloque
+        y la posición del sistema. Una última línea cortada por un apagado se termina con
+        un salto de línea para no mezclarla con la siguiente (se leerá como dañada).
+        
+        Args:
+            posicion (int): Inicio de una línea (la de un bloque ya guardado o 0)
+        """
+        cortada = False
+        with open(self.ruta, "rb") as f:
+            f.seek(posicion)
+            while True:
+                linea = f.readline()
+                if not linea:
+                    break
+                if linea.startswith(b'{"role": "system"'):
+                    self._system = posicion
+                else:
+                    if self._mensajes % self.intervalo == 0 and (not self._posiciones or posicion > self._posiciones[-1]):
+                        self._posiciones.append(posicion)
+                    self._mensajes += 1
+                if b'"pin": true' in linea and posicion not in self._fijados:
+                    self._fijados.append(posicion)
+                posicion += len(linea)
+                cortada = not linea.endswith(b"\n")
+        
+        if cortada:
+            with open(self.ruta, "ab") as f:
+                f.write(b"\n")
+            self._bytes = posicion + 1
+    
+    def _leer_desde(self, posicion, limite=None):
+        """
+        Lee registros desde una posición del fichero, omitiendo las líneas incompletas o dañadas.
+        
+        Yields:
+            dict: Registro de cada línea
+        """
+        leidos = 0
+        with open(self.ruta, "rb") as f:
+            f.seek(posicion)
+            while limite is None or leidos < limite:
+                linea = f.readline()
+                if not linea:
+                    break
+                leidos += 1
+                try:
+                    registro = json.loads(linea)
+                except ValueError:
+                    # Línea dañada por un apagado a mitad de escritura
+                    registro = None
+                yield registro
+    
+    def _guardar_indice(self):
+        """Escribe el índice en un fichero temporal y lo renombra."""
+        temporal = self.ruta_indice + ".tmp"
+        with open(temporal, "w") as f:
+            json.dump({"intervalo": self.intervalo, "posiciones": self._posiciones,
+                       "system": self._system, "fijados": self._fijados}, f)
+        _reemplazar(temporal, self.ruta_indice)
+
+
+def _mensaje(registro):
+    """Convierte un registro del diario en (Message, fijado)."""
+    mensaje = Message(registro["role"], registro["content"], registro.get("tool_calls"), registro.get("tool_results"))
+    return mensaje, registro.get("pin", False)
+
+
+def _reemplazar(origen, destino):
+    """Renombra origen sobre destino (MicroPython no siempre sobrescribe al renombrar)."""
+    try:
+        os.rename(origen, destino)
+    except OSError:
+        os.remove(destino)
+        os.rename(origen, destino)
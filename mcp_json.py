@@ -0,0 +1,310 @@
+# mcp_json.py
+import json
+
+# Bytes significativos del JSON
+_COMILLA = 0x22         # "
+_BARRA = 0x5C           # \
+_LLAVE_ABRE = 0x7B      # {
+_LLAVE_CIERRA = 0x7D    # }
+_CORCHETE_ABRE = 0x5B   # [
+_CORCHETE_CIERRA = 0x5D # ]
+_COMA = 0x2C            # ,
+_ESPACIOS = b" \t\r\n"
+_FIN_PRIMITIVO = b",]} \t\r\n"
+
+# Tamaño de los bloques leídos del flujo
+TAM_BLOQUE = 256
+
+# Marca de nodo hoja en el árbol de rutas y de valor no extraído
+_HOJA = None
+_AUSENTE = object()
+
+
+def compilar_rutas(rutas):
+    """
+    Convierte una lista de rutas en el árbol que usa el analizador.
+    
+    Args:
+        rutas (list): Rutas como tuplas de claves (str) e índices (int); "*" equivale
+                      a cualquier clave o índice. Ej: ("choices", 0, "message")
+        
+    Returns:
+        dict: Árbol de rutas
+    """
+    arbol = {}
+    for ruta in rutas:
+        nodo = arbol
+        for paso in ruta:
+            nodo = nodo.setdefault(paso, {})
+        nodo[_HOJA] = True
+    return arbol
+
+
+class _Analizador:
+    """
+    Analizador JSON incremental que no depende de la E/S: pide los datos con yield
+    y los recibe con send(), de modo que el mismo código sirve para lectura síncrona
+    y asíncrona. Solo construye los valores que cuelgan de las rutas pedidas; el resto
+    se recorre sin crear objetos.
+    """
+    
+    def __init__(self, arbol):
+        self.arbol = arbol
+        self.buf = b""
+        self.pos = 0
+        self.fin = False
+        # Bytes acumulados del valor que se está capturando
+        self.captura = None
+        self.inicio_captura = 0
+        self.resultado = None
+    
+    def analizar(self):
+        """Generador principal: analiza un documento y deja el árbol disperso en resultado."""
+        valor = yield from self._valor(self.arbol)
+        self.resultado = {} if valor is _AUSENTE else valor
+    
+    def _rellenar(self):
+        """Solicita el siguiente bloque de datos, conservando lo pendiente de la captura."""
+        if self.captura is not None:
+            self.captura.extend(self.buf[self.inicio_captura:])
+            self.inicio_captura = 0
+        datos = yield
+        if not datos:
+            self.fin = True
+            datos = b""
+        self.buf = datos
+        self.pos = 0
+    
+    def _byte(self):
+        """Devuelve el siguiente byte que no sea espacio, sin consumirlo (None al final)."""
+        while True:
+            buf = self.buf
+            pos = self.pos
+            n = len(buf)
+            while pos < n and buf[pos] in _ESPACIOS:
+                pos += 1
+            self.pos = pos
+            if pos < n:
+                return buf[pos]
+            if self.fin:
+                return None
+            yield from self._rellenar()
+    
+    def _valor(self, nodo):
+        """Analiza un valor: lo captura si es hoja, desciende si hay rutas más profundas o lo salta."""
+        c = yield from self._byte()
+        if c is None:
+            raise ValueError("JSON incompleto")
+        
+        if _HOJA in nodo:
+            return (yield from self._capturar())
+        if c == _LLAVE_ABRE:
+            return (yield from self._objeto(nodo))
+        if c == _CORCHETE_ABRE:
+            return (yield from self._array(nodo))
+        
+        yield from self._saltar()
+        return _AUSENTE
+    
+    def _objeto(self, nodo):
+        """Recorre un objeto y conserva solo las claves presentes en el árbol."""
+        self.pos += 1
+        resultado = {}
+        while True:
+            c = yield from self._byte()
+            if c == _LLAVE_CIERRA:
+                self.pos += 1
+                return resultado
+            if c == _COMA:
+                self.pos += 1
+                continue
+            if c is None:
+                raise ValueError("JSON incompleto")
+            
+            clave = yield from self._capturar()
+            # Separador ':'
+            yield from self._byte()
+            self.pos += 1
+            
+            hijo = nodo.get(clave)
+            if hijo is None:
+                hijo = nodo.get("*")
+            if hijo is None:
+                yield from self._saltar()
+            else:
+                valor = yield from self._valor(hijo)
+                if valor is not _AUSENTE:
+                    resultado[clave] = valor
+    
+    def _array(self, nodo):
+        """Recorre un array y conserva solo los índices presentes en el árbol."""
+        self.pos += 1
+        resultado = []
+        indice = 0
+        while True:
+            c = yield from self._byte()
+            if c == _CORCHETE_CIERRA:
+                self.pos += 1
+                return resultado
+            if c == _COMA:
+                self.pos += 1
+                continue
+            if c is None:
+                raise ValueError("JSON incompleto")
+            
+            hijo = nodo.get(indice)
+            if hijo is None:
+                hijo = nodo.get("*")
+            if hijo is None:
+                yield from self._saltar()
+            else:
+                valor = yield from self._valor(hijo)
+                if valor is not _AUSENTE:
+                    resultado.append(valor)
+            indice += 1
+    
+    def _capturar(self):
+        """Guarda los bytes del siguiente valor y lo decodifica con json.loads."""
+        yield from self._byte()
+        self.captura = bytearray()
+        self.inicio_captura = self.pos
+        yield from self._saltar()
+        self.captura.extend(self.buf[self.inicio_captura:self.pos])
+        datos = self.captura
+        self.captura = None
+        return json.loads(str(datos, "utf-8"))
+    
+    def _saltar(self):
+        """Avanza sobre el siguiente valor completo sin construirlo."""
+        c = yield from self._byte()
+        
+        if c == _COMILLA:
+            self.pos += 1
+            yield from self._saltar_cadena()
+            return
+        
+        if c == _LLAVE_ABRE or c == _CORCHETE_ABRE:
+            profundidad = 0
+            while True:
+                buf = self.buf
+                pos = self.pos
+                n = len(buf)
+                while pos < n:
+                    c = buf[pos]
+                    if c == _COMILLA:
+                        break
+                    if c == _LLAVE_ABRE or c == _CORCHETE_ABRE:
+                        profundidad += 1
+                    elif c == _LLAVE_CIERRA or c == _CORCHETE_CIERRA:
+                        profundidad -= 1
+                        if profundidad == 0:
+                            self.pos = pos + 1
+                            return
+                    pos += 1
+                
+                if pos < n:
+                    # Cadena dentro del contenedor
+                    self.pos = pos + 1
+                    yield from self._saltar_cadena()
+                else:
+                    self.pos = pos
+                    if self.fin:
+                        raise ValueError("JSON incompleto")
+                    yield from self._rellenar()
+        
+        # Número, true, false o null
+        while True:
+            buf = self.buf
+            pos = self.pos
+            n = len(buf)
+            while pos < n and buf[pos] not in _FIN_PRIMITIVO:
+                pos += 1
+            self.pos = pos
+            if pos < n or self.fin:
+                return
+            yield from self._rellenar()
+    
+    def _saltar_cadena(self):
+        """Avanza hasta la comilla que cierra la cadena actual, respetando los escapes."""
+        escapado = False
+        while True:
+            buf = self.buf
+            pos = self.pos
+            n = len(buf)
+            while pos < n:
+                if escapado:
+                    escapado = False
+                    pos += 1
+                    continue
+                comilla = buf.find(b'"', pos)
+                barra = buf.find(b"\\", pos, comilla if comilla >= 0 else n)
+                if barra >= 0:
+                    pos = barra + 1
+                    escapado = True
+                elif comilla >= 0:
+                    self.pos = comilla + 1
+                    return
+                else:
+                    pos = n
+            self.pos = pos
+            if self.fin:
+                raise ValueError("JSON incompleto")
+            yield from self._rellenar()
+
+
+def extraer_json(stream, arbol, tam_bloque=TAM_BLOQUE):
+    """
+    Lee un documento JSON de un flujo en bloques de tamaño fijo y extrae solo las rutas pedidas.
+    La memoria usada no depende del tamaño del documento, solo de los valores extraídos.
+    
+    Args:
+        stream: Objeto con método read(n) que devuelve bytes (socket o respuesta HTTP)
+        arbol (dict): Árbol de rutas creado con compilar_rutas()
+        tam_bloque (int): Bytes leídos en cada lectura
+        
+    Returns:
+        dict: Árbol disperso con la misma estructura que el documento, que solo contiene
+              los valores de las rutas pedidas (en los arrays, solo los elementos elegidos)
+    """
+    analizador = _Analizador(arbol)
+    generador = analizador.analizar()
+    try:
+        generador.send(None)
+        while True:
+            generador.send(stream.read(tam_bloque))
+    except StopIteration:
+        pass
+    
+    # Consumir el resto del cuerpo para poder reutilizar la conexión
+    while stream.read(tam_bloque):
+        pass
+    
+    return analizador.resultado
+
+
+async def extraer_json_async(stream, arbol, tam_bloque=TAM_BLOQUE):
+    """
+    Versión asíncrona de extraer_json() para respuestas cuyo read(n) es una corrutina.
+    
+    Args:
+        stream: Objeto con corrutina read(n) que devuelve bytes (AsyncHTTPResponse)
+        arbol (dict): Árbol de rutas creado con compilar_rutas()
+        tam_bloque (int): Bytes leídos en cada lectura
+        
+    Returns:
+        dict: Árbol disperso con los valores de las rutas pedidas
+    """
+    analizador = _Analizador(arbol)
+    generador = analizador.analizar()
+    try:
+        generador.send(None)
+        while True:
+            generador.send(await stream.read(tam_bloque))
+    except StopIteration:
+        pass
+    
+    # Consumir el resto del cuerpo para poder reutilizar la conexión
+    while await stream.read(tam_bloque):
+        pass
+    
+    return analizador.resultado
@@ -0,0 +1,232 @@
+# mcp_metrics.py
+import json
+import time
+
+# Reloj de alta resolución: ticks_us en MicroPython, perf_counter en CPython
+try:
+    from time import ticks_us, ticks_diff
+    
+    def reloj():
+        """Instante actual en unidades del reloj de la plataforma."""
+        return ticks_us()
+    
+    def ms_desde(inicio):
+        """Milisegundos transcurridos desde un instante devuelto por reloj()."""
+        return ticks_diff(ticks_us(), inicio) / 1000
+except ImportError:
+    from time import perf_counter
+    
+    def reloj():
+        """Instante actual en unidades del reloj de la plataforma."""
+        return perf_counter()
+    
+    def ms_desde(inicio):
+        """Milisegundos transcurridos desde un instante devuelto por reloj()."""
+        return (perf_counter() - inicio) * 1000
+
+# Tiempos de cada registro, en milisegundos
+CAMPOS_TIEMPO = ("serializacion_ms", "conexion_ms", "primer_byte_ms", "descarga_ms", "analisis_ms", "total_ms")
+
+# Contadores de cada registro que se suman
+CAMPOS_SUMA = ("bytes_enviados", "bytes_recibidos", "input_tokens", "output_tokens")
+
+# Límites superiores de los cubos del histograma en milisegundos (el último recoge el resto)
+LIMITES_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+
+
+def nuevo_registro(proveedor, modelo, modo):
+    """
+    Crea el registro de métricas de una consulta.
+    
+    Args:
+        proveedor (str): Nombre del proveedor
+        modelo (str): Modelo consultado
+        modo (str): "sync", "async" o "stream"
+        
+    Returns:
+        dict: Registro con los tiempos y contadores a cero
+    """
+    registro = {"proveedor": proveedor, "modelo": modelo, "modo": modo, "estado": None,
+                "cache": False, "compartida": False, "intentos": 0, "inicio": reloj()}
+    for campo in CAMPOS_TIEMPO + CAMPOS_SUMA:
+        registro[campo] = 0
+    return registro
+
+
+class _Ventana:
+    """Contadores e histogramas de un intervalo de tiempo para un proveedor."""
+    
+    def __init__(self, periodo):
+        self.periodo = periodo
+        self.peticiones = 0
+        self.errores = 0
+        self.cache = 0
+        self.compartidas = 0
+        self.sumas = [0] * len(CAMPOS_SUMA)
+        self.tiempos = [0.0] * len(CAMPOS_TIEMPO)
+        # Un histograma por campo de tiempo, con un cubo extra para los valores mayores
+        self.histogramas = [[0] * (len(LIMITES_MS) + 1) for _ in CAMPOS_TIEMPO]
+
+
+class MetricsAggregator:
+    """
+    Agregador de registros de métricas con histogramas por ventanas rotatorias.
+    Cada registro solo incrementa contadores (sin guardar muestras), de modo que la
+    memoria es fija; el resumen combina las ventanas de los últimos minutos.
+    Se conecta a un adaptador con adapter.hooks_metricas.append(agregador.registrar).
+    """
+    
+    def __init__(self, duracion_ventana=60, num_ventanas=5):
+        """
+        Inicializa el agregador vacío.
+        
+        Args:
+            duracion_ventana (int): Segundos de cada ventana
+            num_ventanas (int): Ventanas que se conservan (el resumen cubre duracion * num)
+        """
+        self.duracion_ventana = duracion_ventana
+        self.num_ventanas = num_ventanas
+        # Ventanas por proveedor: lista circular indexada por periodo
+        self._ventanas = {}
+    
+    def _periodo(self):
+        """Número de la ventana actual."""
+        return int(time.time() // self.duracion_ventana)
+    
+    def registrar(self, registro):
+        """
+        Añade un registro de métricas a la ventana actual de su proveedor.
+        
+        Args:
+            registro (dict): Registro emitido por el adaptador
+        """
+        periodo = self._periodo()
+        ventanas = self._ventanas.get(registro["proveedor"])
+        if ventanas is None:
+            ventanas = [None] * self.num_ventanas
+            self._ventanas[registro["proveedor"]] = ventanas
+        
+        indice = periodo % self.num_ventanas
+        ventana = ventanas[indice]
+        if ventana is None or ventana.periodo != periodo:
+            ventana = _Ventana(periodo)
+            ventanas[indice] = ventana
+        
+        ventana.peticiones += 1
+        if registro["estado"] != "ok":
+            ventana.errores += 1
+        if registro["cache"]:
+            ventana.cache += 1
+        if registro.get("compartida"):
+            ventana.compartidas += 1
+        for i, campo in enumerate(CAMPOS_SUMA):
+            ventana.sumas[i] += registro.get(campo) or 0
+        for i, campo in enumerate(CAMPOS_TIEMPO):
+            valor = registro.get(campo) or 0
+            ventana.tiempos[i] += valor
+            cubo = 0
+            while cubo < len(LIMITES_MS) and valor > LIMITES_MS[cubo]:
+                cubo += 1
+            ventana.histogramas[i][cubo] += 1
+    
+    def resumen(self):
+        """
+        Combina las ventanas vigentes de cada proveedor.
+        
+        Returns:
+            dict: Por proveedor, número de peticiones, errores, aciertos de caché,
+                  respuestas compartidas con una petición idéntica en curso, sumas
+                  de bytes y tokens, y por cada tiempo la media y los percentiles p50, p90
+                  y p99 (límite superior del cubo del histograma, None si supera el último)
+        """
+        periodo = self._periodo()
+        resultado = {}
+        for proveedor, ventanas in self._ventanas.items():
+            vigentes = [v for v in ventanas if v is not None and periodo - v.periodo < self.num_ventanas]
+            peticiones = sum(v.peticiones for v in vigentes)
+            if not peticiones:
+                continue
+            
+            datos = {
+                "peticiones": peticiones,
+                "errores": sum(v.errores for v in vigentes),
+                "cache": sum(v.cache for v in vigentes),
+                "compartidas": sum(v.compartidas for v in vigentes)
+            }
+            for i, campo in enumerate(CAMPOS_SUMA):
+                datos[campo] = sum(v.sumas[i] for v in vigentes)
+            for i, campo in enumerate(CAMPOS_TIEMPO):
+                histograma = [sum(v.histogramas[i][c] for v in vigentes) for c in range(len(LIMITES_MS) + 1)]
+                datos[campo] = {
+                    "media": round(sum(v.tiempos[i] for v in vigentes) / peticiones, 1),
+                    "p50": _percentil(histograma, peticiones, 0.5),
+                    "p90": _percentil(histograma, peticiones, 0.9),
+                    "p99": _percentil(histograma, peticiones, 0.99)
+                }
+            resultado[proveedor] = datos
+        return resultado
+    
+    def texto(self):
+        """
+        Resumen en texto, una línea por proveedor y tiempo, para leerlo por el puerto serie.
+        
+        Returns:
+            str: Resumen legible
+        """
+        lineas = []
+        for proveedor, datos in self.resumen().items():
+            lineas.append(f"{proveedor}: {datos['peticiones']} peticiones, {datos['errores']} errores, "
+                          f"{datos['cache']} de caché, {datos['compartidas']} compartidas, "
+                          f"{datos['bytes_enviados']}/{datos['bytes_recibidos']} bytes, "
+                          f"{datos['input_tokens']}/{datos['output_tokens']} tokens")
+            for campo in CAMPOS_TIEMPO:
+                t = datos[campo]
+                lineas.append(f"  {campo}: media {t['media']} p50 {t['p50']} p90 {t['p90']} p99 {t['p99']}")
+        return "\n".join(lineas)
+    
+    def limpiar(self):
+        """Descarta todas las ventanas."""
+        self._ventanas = {}
+    
+    async def servir(self, puerto=8080, host="0.0.0.0"):
+        """
+        Expone el resumen en JSON por HTTP en un servidor mínimo del bucle de eventos.
+        
+        Args:
+            puerto (int): Puerto TCP
+            host (str): Dirección en la que escuchar
+            
+        Returns:
+            Servidor asyncio (cerrar con close())
+        """
+        try:
+            import asyncio
+        except ImportError:
+            import uasyncio as asyncio
+        
+        async def atender(lector, escritor):
+            try:
+                # Descartar la petición hasta la línea vacía
+                while True:
+                    linea = await lector.readline()
+                    if not linea or linea == b"\r\n":
+                        break
+                cuerpo = json.dumps(self.resumen()).encode("utf-8")
+                escritor.write(("HTTP/1.0 200 OK\r\nContent-Type: application/json\r\nContent-Length: %d\r\n\r\n" % len(cuerpo)).encode())
+                escritor.write(cuerpo)
+                await escritor.drain()
+            finally:
+                escritor.close()
+        
+        return await asyncio.start_server(atender, host, puerto)
+
+
+def _percentil(histograma, total, fraccion):
+    """Límite superior del cubo que contiene el percentil indicado."""
+    objetivo = total * fraccion
+    acumulado = 0
+    for cubo, cuenta in enumerate(histograma):
+        acumulado += cuenta
+        if acumulado >= objetivo:
+            return LIMITES_MS[cubo] if cubo < len(LIMITES_MS) else None
+    return None
@@ -0,0 +1,432 @@
+# mcp_mock_server.py
+import json
+
+try:
+    import asyncio
+except ImportError:
+    import uasyncio as asyncio
+
+try:
+    import random
+except ImportError:
+    import urandom as random
+
+
+# Excepciones con las que termina una conexión que el cliente cerró (no son fallos del servidor)
+try:
+    _DESCONEXIONES = (ConnectionError, asyncio.IncompleteReadError)
+except (NameError, AttributeError):
+    _DESCONEXIONES = (OSError, EOFError)
+
+# Palabras con las que se generan las respuestas de texto
+PALABRAS = ("sensor", "lectura", "estable", "temperatura", "humedad", "normal", "valor", "registro")
+
+
+class MockProviderServer:
+    """
+    Servidor HTTP/1.1 local que imita las APIs de OpenAI (chat/completions), Anthropic
+    (messages) y Gemini (generateContent y streamGenerateContent) para probar y medir
+    los adaptadores sin conexión. Mantiene las conexiones abiertas (keep-alive), responde
+    en streaming si se pide, devuelve llamadas a herramientas y permite añadir latencia
+    y errores.
+    
+    Si la petición incluye herramientas y el último mensaje no es un resultado de
+    herramienta, responde con una llamada a la primera; en caso contrario responde texto.
+    """
+    
+    def __init__(self, latencia_ms=0, variacion_ms=0, retardo_fragmento_ms=0, tasa_error=0, estado_error=503, palabras=8):
+        """
+        Inicializa el servidor sin arrancarlo.
+        
+        Args:
+            latencia_ms (float): Retardo antes de cada respuesta
+            variacion_ms (float): Variación aleatoria máxima añadida a la latencia
+            retardo_fragmento_ms (float): Retardo entre eventos de las respuestas en streaming
+            tasa_error (float): Probabilidad (0.0-1.0) de responder con estado_error
+            estado_error (int): Código HTTP de los errores inyectados (429 incluye Retry-After)
+            palabras (int): Número de palabras de cada respuesta de texto
+        """
+        self.latencia_ms = latencia_ms
+        self.variacion_ms = variacion_ms
+        self.retardo_fragmento_ms = retardo_fragmento_ms
+        self.tasa_error = tasa_error
+        self.estado_error = estado_error
+        self.palabras = palabras
+        self.host = "127.0.0.1"
+        self.puerto = None
+        self.servidor = None
+        # Bucle propio cuando se arranca con iniciar_en_hilo()
+        self._bucle = None
+        self._terminado = None
+        # Contadores de peticiones atendidas y errores inyectados
+        self.peticiones = 0
+        self.errores = 0
+        # Excepciones inesperadas al atender peticiones (las pruebas comprueban que no haya)
+        self.errores_internos = []
+    
+    @property
+    def url_base(self):
+        """URL del servidor, sin barra final."""
+        return f"http://{self.host}:{self.puerto}"
+    
+    async def iniciar(self, puerto=0, host="127.0.0.1"):
+        """
+        Arranca el servidor en el bucle de eventos actual.
+        
+        Args:
+            puerto (int): Puerto TCP (0 elige uno libre)
+            host (str): Dirección en la que escuchar
+        
+        Returns:
+            Servidor asyncio (cerrar con close())
+        """
+        self.host = host
+        self.servidor = await asyncio.start_server(self._atender, host, puerto)
+        if puerto == 0:
+            # Puerto asignado por el sistema (solo disponible en CPython)
+            puerto = self.servidor.sockets[0].getsockname()[1]
+        self.puerto = puerto
+        return self.servidor
+    
+    def iniciar_en_hilo(self, puerto=0, host="127.0.0.1"):
+        """
+        Arranca el servidor en un hilo con su propio bucle de eventos, para poder
+        usarlo desde código síncrono en el mismo proceso (CPython). cerrar() detiene
+        el bucle y espera a que termine el hilo.
+        
+        Args:
+            puerto (int): Puerto TCP (0 elige uno libre)
+            host (str): Dirección en la que escuchar
+        
+        Returns:
+            int: Puerto en el que escucha el servidor
+        """
+        import _thread
+        
+        listo = _thread.allocate_lock()
+        listo.acquire()
+        self._terminado = _thread.allocate_lock()
+        self._terminado.acquire()
+        
+        def ejecutar():
+            bucle = asyncio.new_event_loop()
+            asyncio.set_event_loop(bucle)
+            bucle.run_until_complete(self.iniciar(puerto, host))
+            self._bucle = bucle
+            listo.release()
+            bucle.run_forever()
+            
+            # cerrar() detuvo el bucle: dejar de escuchar, cancelar las conexiones abiertas y liberarlo
+            self.servidor.close()
+            self.servidor = None
+            pendientes = asyncio.all_tasks(bucle)
+            for tarea in pendientes:
+                tarea.cancel()
+            bucle.run_until_complete(asyncio.gather(*pendientes, return_exceptions=True))
+            bucle.close()
+            self._terminado.release()
+        
+        _thread.start_new_thread(ejecutar, ())
+        listo.acquire()
+        return self.puerto
+    
+    def configurar(self, adapter):
+        """
+        Redirige un adaptador (y sus internos si es compuesto) hacia este servidor.
+        
+        Args:
+            adapter (MCPAdapter): Adaptador a redirigir
+        
+        Returns:
+            MCPAdapter: El mismo adaptador
+        """
+        for interno in getattr(adapter, "adapters", None) or [adapter]:
+            if hasattr(interno, "base_url"):
+                interno.base_url = self.url_base + "/v1beta"
+            elif hasattr(interno, "url"):
+                # Conservar la ruta del proveedor (/v1/chat/completions o /v1/messages)
+                ruta = "/" + interno.url.split("://", 1)[-1].split("/", 1)[1]
+                interno.url = self.url_base + ruta
+        return adapter
+    
+    async def _atender(self, lector, escritor):
+        """Atiende las peticiones de una conexión hasta que el cliente la cierre."""
+        try:
+            while True:
+                linea = await lector.readline()
+                if not linea:
+                    break
+                metodo, ruta, version = linea.decode("utf-8").split(None, 2)
+                
+                headers = {}
+                while True:
+                    linea = await lector.readline()
+                    if not linea or linea == b"\r\n":
+                        break
+                    nombre, _, valor = linea.decode("utf-8").partition(":")
+                    headers[nombre.strip().lower()] = valor.strip()
+                
+                longitud = int(headers.get("content-length", 0))
+                cuerpo = await lector.readexactly(longitud) if longitud else b""
+                
+                await self._responder(escritor, ruta, cuerpo)
+                
+                if headers.get("connection", "").lower() == "close" or version.strip() == "HTTP/1.0":
+                    break
+        except _DESCONEXIONES:
+            # El cliente cerró la conexión (p. ej. al cancelar una petición o agotar su límite de tiempo)
+            pass
+        except Exception as e:
+            # Un fallo del propio servidor no debe pasar desapercibido en las pruebas
+            print(f"Error en el servidor simulado: {e}")
+            self.errores_internos.append(e)
+        finally:
+            escritor.close()
+    
+    async def _responder(self, escritor, ruta, cuerpo):
+        """Genera y envía la respuesta a una petición."""
+        self.peticiones += 1
+        
+        espera = self.latencia_ms
+        if self.variacion_ms:
+            espera += random.random() * self.variacion_ms
+        if espera:
+            await asyncio.sleep(espera / 1000)
+        
+        if self.tasa_error and random.random() < self.tasa_error:
+            self.errores += 1
+            extra = {"Retry-After": "0"} if self.estado_error == 429 else {}
+            await self._enviar(escritor, self.estado_error, {"error": {"message": "Error simulado"}}, extra)
+            return
+        
+        try:
+            peticion = json.loads(cuerpo) if cuerpo else {}
+        except ValueError:
+            await self._enviar(escritor, 400, {"error": {"message": "JSON no válido"}})
+            return
+        
+        if ruta.startswith("/v1/chat/completions"):
+            proveedor = "openai"
+        elif ruta.startswith("/v1/messages"):
+            proveedor = "claude"
+        elif ruta.startswith("/v1beta/models/"):
+            proveedor = "gemini"
+        else:
+            await self._enviar(escritor, 404, {"error": {"message": f"Ruta desconocida: {ruta}"}})
+            return
+        
+        stream = peticion.get("stream") or ":streamGenerateContent" in ruta
+        herramienta = self._herramienta_a_llamar(proveedor, peticion)
+        entrada = len(cuerpo) // 4
+        
+        if stream:
+            await self._enviar_stream(escritor, self._eventos(proveedor, herramienta, entrada))
+        else:
+            await self._enviar(escritor, 200, self._respuesta(proveedor, herramienta, entrada))
+    
+    def _texto(self):
+        """Texto de respuesta con el número de palabras configurado."""
+        return " ".join([PALABRAS[i % len(PALABRAS)] for i in range(self.palabras)])
+    
+    def _herramienta_a_llamar(self, proveedor, peticion):
+        """
+        Decide si la respuesta debe ser una llamada a herramienta.
+        
+        Returns:
+            tuple: (nombre, argumentos) de la primera herramienta, o None para responder texto
+        """
+        tools = peticion.get("tools")
+        if not tools:
+            return None
+        
+        if proveedor == "openai":
+            mensajes = peticion.get("messages") or [{}]
+            if peticion.get("tool_choice") == "none" or mensajes[-1].get("role") == "tool":
+                return None
+            funcion = tools[0].get("function", tools[0])
+            return funcion["name"], _argumentos_de(funcion.get("parameters"))
+        
+        if proveedor == "claude":
+            mensajes = peticion.get("messages") or [{}]
+            contenido = mensajes[-1].get("content")
+            if (peticion.get("tool_choice") or {}).get("type") == "none":
+                return None
+            if isinstance(contenido, list) and [b for b in contenido if b.get("type") == "tool_result"]:
+                return None
+            return tools[0]["name"], _argumentos_de(tools[0].get("input_schema"))
+        
+        contents = peticion.get("contents") or [{}]
+        modo = peticion.get("toolConfig", {}).get("functionCallingConfig", {}).get("mode")
+        if modo == "NONE" or [p for p in contents[-1].get("parts", []) if "functionResponse" in p]:
+            return None
+        funcion = tools[0].get("functionDeclarations", [tools[0]])[0]
+        return funcion["name"], _argumentos_de(funcion.get("parameters"))
+    
+    def _respuesta(self, proveedor, herramienta, entrada):
+        """Cuerpo de una respuesta completa en el formato del proveedor."""
+        texto = self._texto()
+        
+        if proveedor == "openai":
+            if herramienta:
+                mensaje = {"role": "assistant", "content": None, "tool_calls": [{
+                    "id": "call_mock_0", "type": "function",
+                    "function": {"name": herramienta[0], "arguments": json.dumps(herramienta[1])}
+                }]}
+            else:
+                mensaje = {"role": "assistant", "content": texto}
+            return {
+                "id": "chatcmpl-mock",
+                "object": "chat.completion",
+                "choices": [{"index": 0, "message": mensaje, "finish_reason": "tool_calls" if herramienta else "stop"}],
+                "usage": {"prompt_tokens": entrada, "completion_tokens": self.palabras, "total_tokens": entrada + self.palabras}
+            }
+        
+        if proveedor == "claude":
+            if herramienta:
+                bloque = {"type": "tool_use", "id": "toolu_mock_0", "name": herramienta[0], "input": herramienta[1]}
+            else:
+                bloque = {"type": "text", "text": texto}
+            return {
+                "id": "msg_mock",
+                "type": "message",
+                "role": "assistant",
+                "content": [bloque],
+                "stop_reason": "tool_use" if herramienta else "end_turn",
+                "usage": {"input_tokens": entrada, "output_tokens": self.palabras}
+            }
+        
+        if herramienta:
+            parte = {"functionCall": {"name": herramienta[0], "args": herramienta[1]}}
+        else:
+            parte = {"text": texto}
+        return {
+            "candidates": [{"content": {"role": "model", "parts": [parte]}, "finishReason": "STOP"}],
+            "usageMetadata": {"promptTokenCount": entrada, "candidatesTokenCount": self.palabras}
+        }
+    
+    def _eventos(self, proveedor, herramienta, entrada):
+        """
+        Eventos SSE de una respuesta en streaming en el formato del proveedor.
+        
+        Yields:
+            tuple: (evento, datos) con el nombre del evento (o None) y el objeto a enviar
+        """
+        palabras = [p + " " for p in self._texto().split(" ")]
+        
+        if proveedor == "openai":
+            if herramienta:
+                argumentos = json.dumps(herramienta[1])
+                mitad = len(argumentos) // 2
+                yield None, {"choices": [{"index": 0, "delta": {"tool_calls": [{
+                    "index": 0, "id": "call_mock_0", "type": "function",
+                    "function": {"name": herramienta[0], "arguments": ""}}]}}]}
+                for parte in (argumentos[:mitad], argumentos[mitad:]):
+                    yield None, {"choices": [{"index": 0, "delta": {"tool_calls": [{"index": 0, "function": {"arguments": parte}}]}}]}
+            else:
+                for palabra in palabras:
+                    yield None, {"choices": [{"index": 0, "delta": {"content": palabra}}]}
+            yield None, {"choices": [], "usage": {"prompt_tokens": entrada, "completion_tokens": self.palabras}}
+            yield None, "[DONE]"
+        
+        elif proveedor == "claude":
+            yield "message_start", {"type": "message_start", "message": {
+                "id": "msg_mock", "role": "assistant", "content": [],
+                "usage": {"input_tokens": entrada, "output_tokens": 1}}}
+            if herramienta:
+                argumentos = json.dumps(herramienta[1])
+                mitad = len(argumentos) // 2
+                yield "content_block_start", {"type": "content_block_start", "index": 0, "content_block": {
+                    "type": "tool_use", "id": "toolu_mock_0", "name": herramienta[0], "input": {}}}
+                for parte in (argumentos[:mitad], argumentos[mitad:]):
+                    yield "content_block_delta", {"type": "content_block_delta", "index": 0,
+                                                  "delta": {"type": "input_json_delta", "partial_json": parte}}
+            else:
+                yield "content_block_start", {"type": "content_block_start", "index": 0,
+                                              "content_block": {"type": "text", "text": ""}}
+                for palabra in palabras:
+                    yield "content_block_delta", {"type": "content_block_delta", "index": 0,
+                                                  "delta": {"type": "text_delta", "text": palabra}}
+            yield "content_block_stop", {"type": "content_block_stop", "index": 0}
+            yield "message_delta", {"type": "message_delta",
+                                    "delta": {"stop_reason": "tool_use" if herramienta else "end_turn"},
+                                    "usage": {"output_tokens": self.palabras}}
+            yield "message_stop", {"type": "message_stop"}
+        
+        else:
+            if herramienta:
+                yield None, {"candidates": [{"content": {"role": "model", "parts": [
+                    {"functionCall": {"name": herramienta[0], "args": herramienta[1]}}]}}]}
+            else:
+                for palabra in palabras:
+                    yield None, {"candidates": [{"content": {"role": "model", "parts": [{"text": palabra}]}}]}
+            yield None, {"candidates": [{"content": {"role": "model", "parts": []}, "finishReason": "STOP"}],
+                         "usageMetadata": {"promptTokenCount": entrada, "candidatesTokenCount": self.palabras}}
+    
+    async def _enviar(self, escritor, estado, objeto, extra=None):
+        """Envía una respuesta JSON completa con Content-Length."""
+        cuerpo = json.dumps(objeto).encode("utf-8")
+        cabecera = f"HTTP/1.1 {estado} {'OK' if estado == 200 else 'Error'}\r\nContent-Type: application/json\r\nContent-Length: {len(cuerpo)}\r\n"
+        for nombre, valor in (extra or {}).items():
+            cabecera += f"{nombre}: {valor}\r\n"
+        # Cabecera y cuerpo en una sola escritura para no retrasar el segundo segmento TCP
+        escritor.write(cabecera.encode("utf-8") + b"\r\n" + cuerpo)
+        await escritor.drain()
+    
+    async def _enviar_stream(self, escritor, eventos):
+        """Envía eventos SSE en bloques chunked, con el retardo configurado entre ellos."""
+        escritor.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nTransfer-Encoding: chunked\r\n\r\n")
+        for evento, datos in eventos:
+            texto = datos if isinstance(datos, str) else json.dumps(datos)
+            if evento:
+                texto = f"event: {evento}\ndata: {texto}\n\n"
+            else:
+                texto = f"data: {texto}\n\n"
+            bloque = texto.encode("utf-8")
+            escritor.write(f"{len(bloque):x}\r\n".encode() + bloque + b"\r\n")
+            await escritor.drain()
+            if self.retardo_fragmento_ms:
+                await asyncio.sleep(self.retardo_fragmento_ms / 1000)
+        escritor.write(b"0\r\n\r\n")
+        await escritor.drain()
+    
+    def cerrar(self):
+        """
+        Deja de aceptar conexiones. Si el servidor se arrancó con iniciar_en_hilo(),
+        detiene además su bucle de eventos y espera a que el hilo lo libere.
+        """
+        bucle = self._bucle
+        if bucle is not None:
+            self._bucle = None
+            bucle.call_soon_threadsafe(bucle.stop)
+            self._terminado.acquire()
+        elif self.servidor is not None:
+            self.servidor.close()
+            self.servidor = None
+
+
+def _argumentos_de(esquema):
+    """
+    Genera argumentos de ejemplo para un esquema JSON de parámetros.
+    
+    Args:
+        esquema (dict): Esquema {"type": "object", "properties": ...} (puede ser None)
+    
+    Returns:
+        dict: Un valor plausible por cada propiedad
+    """
+    argumentos = {}
+    for nombre, propiedad in ((esquema or {}).get("properties") or {}).items():
+        tipo = str(propiedad.get("type", "string")).lower()
+        if propiedad.get("enum"):
+            argumentos[nombre] = propiedad["enum"][0]
+        elif tipo in ("number", "integer"):
+            argumentos[nombre] = 1
+        elif tipo == "boolean":
+            argumentos[nombre] = True
+        elif tipo == "array":
+            argumentos[nombre] = []
+        elif tipo == "object":
+            argumentos[nombre] = {}
+        else:
+            argumentos[nombre] = "mock"
+    return argumentos
@@ -0,0 +1,256 @@
+# mcp_resilience.py
+import time
+
+try:
+    import random
+except ImportError:
+    import urandom as random
+
+# Estados HTTP transitorios que merece la pena reintentar (529: Anthropic sobrecargado)
+ESTADOS_REINTENTABLES = (408, 409, 425, 429, 500, 502, 503, 504, 529)
+
+
+def error_estructurado(status, mensaje, retryable, retry_after=None):
+    """
+    Construye el resultado de error que devuelven las consultas en lugar de None.
+    
+    Args:
+        status (int): Código HTTP (None si no hubo respuesta)
+        mensaje (str): Descripción del error
+        retryable (bool): Si el error es transitorio y la petición puede repetirse
+        retry_after (float): Segundos que el proveedor pide esperar, si los indicó
+        
+    Returns:
+        dict: {"type": "error", "status", "message", "retryable", "retry_after"}
+    """
+    return {
+        "type": "error",
+        "status": status,
+        "message": mensaje,
+        "retryable": retryable,
+        "retry_after": retry_after
+    }
+
+
+def es_error(respuesta):
+    """Indica si un resultado es un error estructurado."""
+    return isinstance(respuesta, dict) and respuesta.get("type") == "error" and "retryable" in respuesta
+
+
+def error_excepcion(e):
+    """
+    Convierte una excepción de la petición en error estructurado. Los errores de red
+    y los tiempos de espera agotados son transitorios; el resto no se reintenta.
+    
+    Args:
+        e (Exception): Excepción capturada
+        
+    Returns:
+        dict: Error estructurado sin código HTTP
+    """
+    transitorio = isinstance(e, (OSError, EOFError)) or type(e).__name__ == "TimeoutError"
+    return error_estructurado(None, f"Excepción: {e}", transitorio)
+
+
+def _cabecera(headers, nombre):
+    """Busca una cabecera sin distinguir mayúsculas (urequests conserva las originales)."""
+    if not headers:
+        return None
+    valor = headers.get(nombre)
+    if valor is None:
+        for clave, v in headers.items():
+            if clave.lower() == nombre:
+                return v
+    return valor
+
+
+def _duracion(texto):
+    """
+    Convierte una duración como "1s", "6m0s", "250ms" o "1.5" a segundos.
+    
+    Args:
+        texto (str): Duración en el formato de las cabeceras de OpenAI o en segundos
+        
+    Returns:
+        float: Segundos o None si no se reconoce el formato
+    """
+    try:
+        return float(texto)
+    except (TypeError, ValueError):
+        pass
+    if not texto:
+        return None
+    
+    total = 0.0
+    numero = ""
+    i = 0
+    while i < len(texto):
+        c = texto[i]
+        if c.isdigit() or c == ".":
+            numero += c
+        elif not numero:
+            return None
+        elif texto[i:i + 2] == "ms":
+            total += float(numero) / 1000
+            numero = ""
+            i += 1
+        elif c in "hms":
+            total += float(numero) * {"h": 3600, "m": 60, "s": 1}[c]
+            numero = ""
+        else:
+            return None
+        i += 1
+    return None if numero else total
+
+
+def espera_indicada(headers):
+    """
+    Calcula cuánto pide esperar el proveedor según las cabeceras de la respuesta:
+    Retry-After / retry-after-ms o, si no están, los límites agotados de OpenAI
+    (x-ratelimit-remaining-* a 0 con su x-ratelimit-reset-*).
+    
+    Args:
+        headers (dict): Cabeceras de la respuesta
+        
+    Returns:
+        float: Segundos a esperar o None si no se indica
+    """
+    valor = _cabecera(headers, "retry-after-ms")
+    if valor is not None:
+        segundos = _duracion(valor)
+        if segundos is not None:
+            return segundos / 1000
+    
+    # Retry-After también puede ser una fecha HTTP; en ese caso se ignora
+    segundos = _duracion(_cabecera(headers, "retry-after"))
+    if segundos is not None:
+        return segundos
+    
+    espera = None
+    for limite in ("requests", "tokens"):
+        if _cabecera(headers, "x-ratelimit-remaining-" + limite) == "0":
+            segundos = _duracion(_cabecera(headers, "x-ratelimit-reset-" + limite))
+            if segundos is not None and (espera is None or segundos > espera):
+                espera = segundos
+    return espera
+
+
+class RetryPolicy:
+    """
+    Política de reintentos con espera exponencial y jitter completo:
+    el intento n espera un tiempo aleatorio entre 0 y min(maximo, base * 2^n),
+    o lo que indique el proveedor si es mayor.
+    """
+    
+    def __init__(self, max_reintentos=3, base=0.5, maximo=20):
+        """
+        Inicializa la política.
+        
+        Args:
+            max_reintentos (int): Reintentos tras el primer intento fallido
+            base (float): Espera base en segundos
+            maximo (float): Espera máxima en segundos; si el proveedor pide más, no se reintenta
+        """
+        self.max_reintentos = max_reintentos
+        self.base = base
+        self.maximo = maximo
+    
+    def espera(self, intento, error):
+        """
+        Calcula la espera antes del siguiente intento.
+        
+        Args:
+            intento (int): Número de intentos ya fallidos menos uno (0 tras el primero)
+            error (dict): Error estructurado del intento fallido
+            
+        Returns:
+            float: Segundos a esperar o None si no debe reintentarse
+        """
+        if not error["retryable"] or intento >= self.max_reintentos:
+            return None
+        
+        espera = random.random() * min(self.maximo, self.base * (2 ** intento))
+        if error["retry_after"] is not None:
+            if error["retry_after"] > self.maximo:
+                return None
+            espera = max(espera, error["retry_after"])
+        return espera
+
+
+class CircuitBreaker:
+    """
+    Interruptor de circuito por proveedor. Tras varios fallos seguidos se abre y las
+    consultas fallan al instante durante un tiempo; después deja pasar una única petición
+    de prueba (semiabierto), rechaza las demás mientras está en curso y se cierra si tiene
+    éxito. También puede pausarse hasta que el proveedor levante un límite de peticiones.
+    """
+    
+    def __init__(self, umbral_fallos=5, tiempo_apertura=30):
+        """
+        Inicializa el interruptor cerrado.
+        
+        Args:
+            umbral_fallos (int): Fallos consecutivos que abren el circuito
+            tiempo_apertura (float): Segundos que el circuito permanece abierto
+        """
+        self.umbral_fallos = umbral_fallos
+        self.tiempo_apertura = tiempo_apertura
+        self.fallos = 0
+        self.abierto_hasta = 0
+        self.estado = "cerrado"
+    
+    def permitir(self):
+        """
+        Indica si se puede enviar una petición.
+        
+        Returns:
+            float: 0 si se permite, o los segundos que faltan para volver a intentarlo
+        """
+        restante = self.abierto_hasta - time.time()
+        if restante > 0:
+            return restante
+        if self.estado != "cerrado":
+            # Pasado el tiempo de apertura solo se deja pasar una petición de prueba; las demás
+            # esperan a su resultado. Si la prueba no informa en tiempo_apertura (p. ej. una
+            # tarea cancelada), se da por perdida y se permite otra
+            self.estado = "semiabierto"
+            self.abierto_hasta = time.time() + self.tiempo_apertura
+        return 0
+    
+    def registrar_exito(self):
+        """Cierra el circuito tras una respuesta correcta."""
+        if self.estado == "semiabierto":
+            # Fin de la prueba; en estado cerrado no se toca una posible pausa por límite
+            self.abierto_hasta = 0
+        self.fallos = 0
+        self.estado = "cerrado"
+    
+    def registrar_fallo(self):
+        """Cuenta un fallo del proveedor y abre el circuito al llegar al umbral."""
+        self.fallos += 1
+        if self.estado == "semiabierto" or self.fallos >= self.umbral_fallos:
+            self.estado = "abierto"
+            self.abierto_hasta = time.time() + self.tiempo_apertura
+    
+    def pausar(self, segundos):
+        """Rechaza peticiones durante el tiempo indicado por un límite de peticiones."""
+        self.abierto_hasta = max(self.abierto_hasta, time.time() + segundos)
+
+
+# Interruptores compartidos por todos los adaptadores del mismo proveedor
+_interruptores = {}
+
+
+def interruptor_de(proveedor):
+    """
+    Devuelve el interruptor de circuito compartido de un proveedor.
+    
+    Args:
+        proveedor (str): Nombre del proveedor
+        
+    Returns:
+        CircuitBreaker: Interruptor del proveedor
+    """
+    if proveedor not in _interruptores:
+        _interruptores[proveedor] = CircuitBreaker()
+    return _interruptores[proveedor]
@@ -0,0 +1,267 @@
+# mcp_router.py
+import time
+
+from mcp_base import MCPAdapter
+from mcp_metrics import nuevo_registro, reloj, ms_desde
+from mcp_resilience import error_estructurado, error_excepcion, es_error
+
+
+class RouterAdapter(MCPAdapter):
+    """
+    Adaptador compuesto que envía cada consulta al proveedor que mejor está respondiendo.
+    Mantiene por proveedor/modelo una media móvil exponencial (EWMA) de la latencia y de
+    la tasa de errores; si el elegido falla, pasa al siguiente sin perder el contexto,
+    porque todos comparten el mismo historial y cada uno lo codifica en su formato
+    (Gemini, por ejemplo, con el rol "model").
+    """
+    
+    nombre_proveedor = "Router"
+    
+    def __init__(self, adapters, alfa=0.3, penalizacion_error=4, vida_media_error=60):
+        """
+        Inicializa el router.
+        
+        Args:
+            adapters (list): Adaptadores MCP; el orden decide entre proveedores sin medir
+            alfa (float): Peso de cada nueva muestra en las medias móviles (0-1)
+            penalizacion_error (float): Cuánto encarece la tasa de errores a un proveedor
+                                        (con un 100 % de errores su latencia cuenta 1 + penalizacion_error veces)
+            vida_media_error (float): Segundos en los que la tasa de errores se reduce a la mitad
+                                      sin nuevas peticiones, para volver a probar un proveedor caído
+        """
+        principal = adapters[0]
+        super().__init__(principal.api_key, principal.modelo, principal.max_tokens, principal.temperatura, principal.transporte)
+        self.familia_tokens = principal.familia_tokens
+        self.adapters = adapters
+        self.alfa = alfa
+        self.penalizacion_error = penalizacion_error
+        self.vida_media_error = vida_media_error
+        # Medias móviles de cada adaptador, en el mismo orden que adapters
+        self.estadisticas = [
+            {"proveedor": adapter.nombre_proveedor, "modelo": adapter.modelo, "latencia_ms": None,
+             "tasa_error": 0.0, "actualizado": 0, "peticiones": 0, "errores": 0}
+            for adapter in adapters
+        ]
+        # Adaptador que respondió la última consulta
+        self.ultimo_elegido = None
+    
+    def consultar(self, nuevos_mensajes=None, functions=None, function_call="auto"):
+        """
+        Envía la consulta al mejor proveedor y, si falla, a los siguientes por orden.
+        Con una caché en el router, una respuesta guardada evita contactar a ningún proveedor.
+        
+        Args:
+            nuevos_mensajes (list): Lista opcional de mensajes a agregar al historial
+            functions (list): Lista opcional de funciones disponibles para el modelo
+            function_call (str): Modo de llamada a funciones ("auto", "none", o nombre específico)
+        
+        Returns:
+            dict: Respuesta estandarizada del proveedor elegido o el último error si todos fallan
+        """
+        self._preparar_consulta(nuevos_mensajes)
+        
+        clave, respuesta = self._buscar_en_cache(functions, function_call)
+        if respuesta is not None:
+            registro = nuevo_registro(self.nombre_proveedor, self.modelo, "sync") if self.hooks_metricas else None
+            return self._emitir_metricas(registro, respuesta, cache=True)
+        
+        error = None
+        for i in self.orden():
+            adapter = self.adapters[i]
+            registro = nuevo_registro(adapter.nombre_proveedor, adapter.modelo, "sync") if self.hooks_metricas else None
+            inicio = reloj()
+            # Sin reintentos internos: el respaldo es el siguiente proveedor
+            try:
+                response = adapter._realizar_peticion(functions, function_call, reintentar=False, registro=registro)
+            except Exception as e:
+                response = error_excepcion(e)
+            
+            if es_error(response):
+                error = self._fallo(i, registro, response)
+                continue
+            
+            self._exito(i, ms_desde(inicio))
+            return self._emitir_metricas(registro, self._guardar_en_cache(clave, adapter._procesar(response, registro)))
+        
+        return error or error_estructurado(None, "Ningún proveedor devolvió una respuesta válida", True)
+    
+    async def consultar_async(self, nuevos_mensajes=None, functions=None, function_call="auto"):
+        """
+        Versión asíncrona de consultar().
+        
+        Returns:
+            dict: Respuesta estandarizada del proveedor elegido o el último error si todos fallan
+        """
+        self._preparar_consulta(nuevos_mensajes)
+        
+        clave, respuesta = self._buscar_en_cache(functions, function_call)
+        if respuesta is not None:
+            registro = nuevo_registro(self.nombre_proveedor, self.modelo, "async") if self.hooks_metricas else None
+            return self._emitir_metricas(registro, respuesta, cache=True)
+        
+        error = None
+        for i in self.orden():
+            adapter = self.adapters[i]
+            registro = nuevo_registro(adapter.nombre_proveedor, adapter.modelo, "async") if self.hooks_metricas else None
+            inicio = reloj()
+            try:
+                response = await adapter._realizar_peticion_async(functions, function_call, reintentar=False, registro=registro)
+            except Exception as e:
+                response = error_excepcion(e)
+            
+            if es_error(response):
+                error = self._fallo(i, registro, response)
+                continue
+            
+            self._exito(i, ms_desde(inicio))
+            return self._emitir_metricas(registro, self._guardar_en_cache(clave, adapter._procesar(response, registro)))
+        
+        return error or error_estructurado(None, "Ningún proveedor devolvió una respuesta válida", True)
+    
+    def consultar_stream(self, nuevos_mensajes=None, functions=None, function_call="auto"):
+        """
+        Versión en streaming de consultar(). Solo se cambia de proveedor si falla antes
+        del primer fragmento; un stream ya empezado no se repite. El tiempo hasta el
+        primer fragmento no se mezcla con la latencia media, solo cuenta el resultado.
+        Como en los adaptadores simples, el streaming no usa la caché ni el agrupador.
+        
+        Yields:
+            dict: Fragmentos con el mismo formato que MCPAdapter.consultar_stream()
+        """
+        self._preparar_consulta(nuevos_mensajes)
+        
+        error = None
+        for i in self.orden():
+            adapter = self.adapters[i]
+            # Sin reintentos internos, como en consultar()
+            fragmentos = adapter._transmitir(functions, function_call, reintentar=False)
+            try:
+                primero = next(fragmentos, None)
+            except Exception as e:
+                primero = error_excepcion(e)
+            if primero is None or primero.get("type") == "error":
+                error = self._fallo(i, None, primero or error_estructurado(None, "Stream vacío", True))
+                continue
+            
+            self._exito(i, None)
+            yield primero
+            for fragmento in fragmentos:
+                yield fragmento
+            return
+        
+        yield error or error_estructurado(None, "Ningún proveedor devolvió una respuesta válida", True)
+    
+    def estimar_tokens(self, functions=None):
+        """
+        Estima los tokens de la próxima petición con el adaptador principal, tras
+        compartir con él la conversación.
+        
+        Args:
+            functions (list): Funciones que se enviarán con la petición
+            
+        Returns:
+            int: Tokens estimados
+        """
+        self._sincronizar_adapters()
+        return self.adapters[0].estimar_tokens(functions)
+    
+    def _mensajes_codificados(self):
+        """Historial codificado por el adaptador principal, para la clave de caché."""
+        return self.adapters[0]._mensajes_codificados()
+    
+    def _herramientas_codificadas(self, functions):
+        """El adaptador compuesto no tiene formato propio: usa las herramientas codificadas del principal."""
+        return self.adapters[0]._herramientas_codificadas(functions)
+    
+    def orden(self):
+        """
+        Ordena los adaptadores del mejor al peor. Los que aún no se han probado van
+        primero, para conocerlos; los que tienen el interruptor de circuito abierto, al final.
+        
+        Returns:
+            list: Índices de self.adapters
+        """
+        ahora = time.time()
+        # Los probados sin latencia medida (solo fallos o streams) cuentan como el más lento
+        medidas = [e["latencia_ms"] for e in self.estadisticas if e["latencia_ms"] is not None]
+        referencia = max(medidas) if medidas else 1000
+        claves = []
+        for i, adapter in enumerate(self.adapters):
+            disponible = adapter.interruptor.abierto_hasta <= ahora
+            claves.append((not disponible, self._puntuacion(self.estadisticas[i], ahora, referencia), i))
+        claves.sort()
+        return [clave[2] for clave in claves]
+    
+    def _puntuacion(self, estadistica, ahora, referencia):
+        """Latencia esperada del proveedor, encarecida según su tasa de errores (menor es mejor)."""
+        if not estadistica["peticiones"]:
+            return 0
+        latencia = estadistica["latencia_ms"]
+        if latencia is None:
+            latencia = referencia
+        return latencia * (1 + self.penalizacion_error * self._tasa_error(estadistica, ahora))
+    
+    def _tasa_error(self, estadistica, ahora):
+        """Tasa de errores reducida según el tiempo transcurrido desde la última petición."""
+        transcurrido = max(0, ahora - estadistica["actualizado"])
+        return estadistica["tasa_error"] * 0.5 ** (transcurrido / self.vida_media_error)
+    
+    def _actualizar(self, i, latencia_ms, fallo):
+        """
+        Añade una muestra a las medias móviles de un adaptador.
+        
+        Args:
+            i (int): Índice del adaptador
+            latencia_ms (float): Latencia de la respuesta correcta (None si no se mide)
+            fallo (bool): Si la petición falló
+        """
+        estadistica = self.estadisticas[i]
+        ahora = time.time()
+        tasa = self._tasa_error(estadistica, ahora)
+        estadistica["tasa_error"] = tasa + self.alfa * ((1 if fallo else 0) - tasa)
+        estadistica["actualizado"] = ahora
+        estadistica["peticiones"] += 1
+        if fallo:
+            estadistica["errores"] += 1
+        
+        if latencia_ms is not None:
+            anterior = estadistica["latencia_ms"]
+            estadistica["latencia_ms"] = latencia_ms if anterior is None else anterior + self.alfa * (latencia_ms - anterior)
+    
+    def _exito(self, i, latencia_ms):
+        """Registra una respuesta correcta y recuerda el adaptador elegido."""
+        self._actualizar(i, latencia_ms, False)
+        self.ultimo_elegido = self.adapters[i]
+    
+    def _fallo(self, i, registro, error):
+        """Registra un intento fallido, emite sus métricas y devuelve el error."""
+        self._actualizar(i, None, True)
+        self._emitir_metricas(registro, error)
+        print(f"{self.adapters[i].nombre_proveedor} no respondió, probando el siguiente proveedor...")
+        return error
+    
+    def _preparar_consulta(self, nuevos_mensajes):
+        """Agrega los mensajes nuevos, recorta el historial y lo comparte con los adaptadores."""
+        if nuevos_mensajes:
+            for mensaje in nuevos_mensajes:
+                self.agregar_mensaje(mensaje["role"], mensaje["content"])
+        
+        self._aplicar_politica_historial()
+        self._sincronizar_adapters()
+    
+    def _sincronizar_adapters(self):
+        """
+        Comparte el historial, los mensajes fijados, el mensaje de sistema y el diario
+        con los adaptadores internos, de modo que la respuesta del elegido queda en la
+        conversación común y, al compactar el diario, los fijados conservan su marca.
+        """
+        for adapter in self.adapters:
+            adapter.historial = self.historial
+            adapter._fijados = self._fijados
+            # Reasignar el mismo system descartaría su codificación
+            if adapter.system != self.system:
+                adapter.system = self.system
+            adapter.journal = self.journal
+            # Con un agrupador en el router, cada proveedor agrupa sus peticiones idénticas
+            if self.coalescer is not None:
+                adapter.coalescer = self.coalescer
@@ -0,0 +1,169 @@
+# mcp_singleflight.py
+try:
+    import _thread
+except ImportError:
+    _thread = None
+
+try:
+    import hashlib
+except ImportError:
+    import uhashlib as hashlib
+
+from mcp_resilience import error_estructurado
+from mcp_transport import bloque_cabeceras, piezas_cuerpo
+
+
+def clave_peticion(url, headers, cuerpo):
+    """
+    Calcula la huella de una petición: URL, cabeceras (que incluyen la clave API) y cuerpo.
+    El cuerpo se recorre por fragmentos, sin unirlo.
+    
+    Args:
+        url (str): URL de destino
+        headers (dict): Cabeceras de la petición
+        cuerpo: Cuerpo de la petición (EncodedBody o bytes)
+    
+    Returns:
+        bytes: Hash SHA-256
+    """
+    h = hashlib.sha256(url.encode("utf-8"))
+    h.update(b"\n")
+    h.update(bloque_cabeceras(headers))
+    for fragmento in piezas_cuerpo(cuerpo):
+        h.update(fragmento)
+    return h.digest()
+
+
+class _Vuelo:
+    """Petición en curso y el resultado que se entrega a quienes la esperan."""
+    
+    def __init__(self, espera):
+        """
+        Args:
+            espera: Cerrojo tomado (hilos) o asyncio.Event que se libera al terminar
+        """
+        # Resultado si la petición termina sin devolver nada (excepción o cancelación)
+        self.resultado = error_estructurado(None, "La petición compartida no terminó", True)
+        self.espera = espera
+
+
+class RequestCoalescer:
+    """
+    Agrupa las peticiones idénticas que coinciden en el tiempo: la primera se envía y
+    las que llegan mientras está en curso esperan su resultado en lugar de repetirla.
+    ejecutar() agrupa entre hilos (_thread) y ejecutar_async() entre tareas asyncio.
+    Solo agrupa peticiones simultáneas; para reutilizar respuestas anteriores use ResponseCache.
+    """
+    
+    def __init__(self):
+        """Inicializa el agrupador sin peticiones en curso."""
+        self._cerrojo = _thread.allocate_lock() if _thread is not None else None
+        # Peticiones en curso por huella; las síncronas y las asíncronas no se mezclan,
+        # porque una espera bloqueante detendría el bucle de eventos de la petición asíncrona
+        self._vuelos = {}
+        self._vuelos_async = {}
+        # Peticiones ahorradas desde la creación
+        self.agrupadas = 0
+    
+    def ejecutar(self, clave, funcion):
+        """
+        Ejecuta funcion() o, si otro hilo ya tiene en curso una petición con la misma
+        clave, espera su resultado.
+        
+        Args:
+            clave (bytes): Huella de la petición (ver clave_peticion())
+            funcion (callable): Envía la petición y devuelve la respuesta
+        
+        Returns:
+            tuple: (respuesta, compartida) donde compartida indica que la respuesta
+                   procede de la petición de otro hilo
+        """
+        self._bloquear()
+        vuelo = self._vuelos.get(clave)
+        lider = vuelo is None
+        if lider:
+            # El cerrojo del vuelo permanece tomado mientras la petición está en curso
+            espera = None
+            if _thread is not None:
+                espera = _thread.allocate_lock()
+                espera.acquire()
+            vuelo = _Vuelo(espera)
+            self._vuelos[clave] = vuelo
+        else:
+            self.agrupadas += 1
+        self._desbloquear()
+        
+        if not lider:
+            vuelo.espera.acquire()
+            vuelo.espera.release()
+            return vuelo.resultado, True
+        
+        try:
+            vuelo.resultado = funcion()
+        finally:
+            self._bloquear()
+            del self._vuelos[clave]
+            self._desbloquear()
+            if vuelo.espera is not None:
+                vuelo.espera.release()
+        return vuelo.resultado, False
+    
+    async def ejecutar_async(self, clave, funcion):
+        """
+        Versión asíncrona de ejecutar(): las tareas que piden lo mismo mientras la
+        petición está en curso esperan sin bloquear el bucle de eventos.
+        
+        Args:
+            clave (bytes): Huella de la petición (ver clave_peticion())
+            funcion (callable): Devuelve la corrutina que envía la petición
+        
+        Returns:
+            tuple: (respuesta, compartida)
+        """
+        try:
+            import asyncio
+        except ImportError:
+            import uasyncio as asyncio
+        
+        vuelo = self._vuelos_async.get(clave)
+        if vuelo is not None:
+            self.agrupadas += 1
+            await vuelo.espera.wait()
+            return vuelo.resultado, True
+        
+        vuelo = _Vuelo(asyncio.Event())
+        self._vuelos_async[clave] = vuelo
+        try:
+            vuelo.resultado = await funcion()
+        finally:
+            # También si la tarea se cancela: quienes esperan reciben el error por defecto
+            del self._vuelos_async[clave]
+            vuelo.espera.set()
+        return vuelo.resultado, False
+    
+    def _bloquear(self):
+        """Toma el cerrojo del registro de peticiones en curso, si hay hilos."""
+        if self._cerrojo is not None:
+            self._cerrojo.acquire()
+    
+    def _desbloquear(self):
+        """Libera el cerrojo del registro de peticiones en curso."""
+        if self._cerrojo is not None:
+            self._cerrojo.release()
+
+
+# Agrupador compartido por todos los adaptadores que lo activen
+_coalescer_compartido = None
+
+
+def coalescer_compartido():
+    """
+    Devuelve el agrupador de peticiones compartido, creándolo la primera vez.
+    
+    Returns:
+        RequestCoalescer: Agrupador común a todos los adaptadores
+    """
+    global _coalescer_compartido
+    if _coalescer_compartido is None:
+        _coalescer_compartido = RequestCoalescer()
+    return _coalescer_compartido
@@ -0,0 +1,50 @@
+# mcp_sse.py
+
+def leer_eventos_sse(stream):
+    """
+    Lee un flujo Server-Sent Events línea por línea y entrega cada evento completo.
+    Solo mantiene en memoria la línea y el evento actuales, nunca el cuerpo entero.
+    
+    Args:
+        stream: Objeto con método readline() que devuelve bytes (socket o respuesta HTTP)
+        
+    Yields:
+        tuple: (evento, datos) donde evento es el nombre del campo "event:" (o None)
+               y datos el contenido de los campos "data:" unidos por saltos de línea
+    """
+    evento = None
+    datos = []
+    
+    while True:
+        linea = stream.readline()
+        
+        # Fin del flujo
+        if not linea:
+            break
+        
+        linea = linea.decode("utf-8").rstrip("\r\n")
+        
+        # Una línea vacía cierra el evento actual
+        if not linea:
+            if datos:
+                yield evento, "\n".join(datos)
+            evento = None
+            datos = []
+            continue
+        
+        # Comentarios (usados como keep-alive por algunos proveedores)
+        if linea.startswith(":"):
+            continue
+        
+        if linea.startswith("event:"):
+            evento = linea[6:].strip()
+        elif linea.startswith("data:"):
+            valor = linea[5:]
+            # El estándar indica eliminar un único espacio inicial
+            if valor.startswith(" "):
+                valor = valor[1:]
+            datos.append(valor)
+    
+    # Evento final sin línea vacía de cierre
+    if datos:
+        yield evento, "\n".join(datos)
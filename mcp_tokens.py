@@ -0,0 +1,276 @@
+# mcp_tokens.py
+try:
+    import _thread
+except ImportError:
+    _thread = None
+
+# Parámetros de la heurística por familia de tokenizador:
+#   caracteres_por_token: caracteres por token en texto ASCII corrido (código, JSON, inglés)
+#   tokens_por_palabra: tokens por palabra separada por espacios en lenguaje natural
+#   tokens_por_byte_extra: tokens añadidos por cada byte UTF-8 más allá del primero de un
+#                          carácter (acentos, emojis, CJK se dividen en más tokens)
+#   coste_mensaje: tokens de formato por mensaje (rol y delimitadores)
+#   coste_peticion: tokens fijos de cada petición (inicio de la respuesta)
+FAMILIAS = {
+    "openai": {"caracteres_por_token": 4.0, "tokens_por_palabra": 1.3, "tokens_por_byte_extra": 0.5,
+               "coste_mensaje": 4, "coste_peticion": 3},
+    "claude": {"caracteres_por_token": 3.5, "tokens_por_palabra": 1.4, "tokens_por_byte_extra": 0.6,
+               "coste_mensaje": 4, "coste_peticion": 3},
+    "gemini": {"caracteres_por_token": 4.0, "tokens_por_palabra": 1.3, "tokens_por_byte_extra": 0.5,
+               "coste_mensaje": 3, "coste_peticion": 2},
+}
+
+# Tablas BPE ya abiertas por ruta, compartidas por todos los estimadores
+_tablas = {}
+
+
+class _TablaOrdenada:
+    """
+    Tabla BPE ordenada que permanece en flash. Solo se guarda en RAM el fichero
+    abierto y la longitud del token más largo; cada consulta es una búsqueda
+    binaria por posiciones del fichero (seek), así que el tamaño de la tabla no
+    consume memoria.
+    """
+    
+    def __init__(self, ruta):
+        """
+        Abre la tabla y comprueba en una pasada que está ordenada.
+        
+        Args:
+            ruta (str): Fichero UTF-8 con un token por línea, en orden de sort()
+            
+        Raises:
+            OSError: Si el fichero no se puede leer
+            ValueError: Si las líneas no están ordenadas o hay líneas vacías
+        """
+        self.archivo = open(ruta, "rb")
+        self._cerrojo = _thread.allocate_lock() if _thread is not None else None
+        self.maximo = 1
+        anterior = b""
+        try:
+            for linea in self.archivo:
+                token = linea.rstrip(b"\r\n")
+                # El orden de los bytes UTF-8 coincide con el de los str ordenados
+                if not token or token < anterior:
+                    raise ValueError("la tabla debe estar ordenada y sin líneas vacías")
+                self.maximo = max(self.maximo, len(token.decode("utf-8")))
+                anterior = token
+            self.archivo.seek(0, 2)
+            self.tamano = self.archivo.tell()
+        except Exception:
+            self.archivo.close()
+            raise
+    
+    def __contains__(self, token):
+        """
+        Busca un token por bisección sobre las posiciones del fichero.
+        
+        Args:
+            token (str): Token a buscar
+            
+        Returns:
+            bool: Si el token está en la tabla
+        """
+        clave = token.encode("utf-8")
+        if self._cerrojo is not None:
+            self._cerrojo.acquire()
+        try:
+            # Menor posición cuya primera línea completa no es menor que la clave
+            bajo, alto = 0, self.tamano
+            while bajo < alto:
+                medio = (bajo + alto) // 2
+                linea = self._linea_desde(medio)
+                if linea is not None and linea < clave:
+                    bajo = medio + 1
+                else:
+                    alto = medio
+            return self._linea_desde(bajo) == clave
+        finally:
+            if self._cerrojo is not None:
+                self._cerrojo.release()
+    
+    def _linea_desde(self, posicion):
+        """Primera línea completa que empieza en posicion o después, o None al final del fichero."""
+        if posicion:
+            # Leer desde el byte anterior descarta la línea a medias (o solo su salto de línea)
+            self.archivo.seek(posicion - 1)
+            self.archivo.readline()
+        else:
+            self.archivo.seek(0)
+        linea = self.archivo.readline()
+        return linea.rstrip(b"\r\n") if linea else None
+
+
+class TokenEstimator:
+    """
+    Estimador local de tokens. Por defecto usa una heurística de palabras y bytes
+    ajustada a cada familia de tokenizador; si se indica una tabla BPE ordenada,
+    la consulta directamente en flash y cuenta los tokens por coincidencia más larga. Las estimaciones de los mensajes del historial se guardan
+    para que estimar antes de cada petición solo procese los mensajes nuevos.
+    """
+    
+    def __init__(self, familia="openai", ruta_tabla=None):
+        """
+        Inicializa el estimador.
+        
+        Args:
+            familia (str): Clave de FAMILIAS ("openai", "claude" o "gemini")
+            ruta_tabla (str): Fichero de texto UTF-8 ordenado con un token por línea (sin el
+                              espacio inicial de las palabras), o None para usar solo la heurística
+        """
+        parametros = FAMILIAS.get(familia, FAMILIAS["openai"])
+        self.familia = familia
+        self.caracteres_por_token = parametros["caracteres_por_token"]
+        self.tokens_por_palabra = parametros["tokens_por_palabra"]
+        self.tokens_por_byte_extra = parametros["tokens_por_byte_extra"]
+        self.coste_mensaje = parametros["coste_mensaje"]
+        self.coste_peticion = parametros["coste_peticion"]
+        self.ruta_tabla = ruta_tabla
+        # Estimaciones por id() de mensaje: (mensaje, tokens)
+        self._estimaciones = {}
+    
+    def estimar_texto(self, texto):
+        """
+        Estima los tokens de un texto.
+        
+        Args:
+            texto (str): Texto a estimar
+        
+        Returns:
+            int: Tokens estimados
+        """
+        if not texto:
+            return 0
+        
+        tabla = self._tabla()
+        if tabla is not None:
+            return self._contar_con_tabla(texto, tabla, tabla.maximo)
+        
+        caracteres = len(texto)
+        extra = len(texto.encode("utf-8")) - caracteres
+        palabras = len(texto.split())
+        tokens = max(palabras * self.tokens_por_palabra, caracteres / self.caracteres_por_token)
+        return int(tokens + extra * self.tokens_por_byte_extra) + 1
+    
+    def estimar_bytes(self, longitud):
+        """
+        Estima los tokens de un JSON ya codificado (p. ej. los esquemas de herramientas)
+        a partir de su longitud, sin decodificarlo.
+        
+        Args:
+            longitud (int): Bytes del JSON
+        
+        Returns:
+            int: Tokens estimados
+        """
+        return int(longitud / self.caracteres_por_token) + 1
+    
+    def estimar_mensaje(self, mensaje):
+        """
+        Estima los tokens de un mensaje del historial: contenido, llamadas y resultados
+        de herramientas y el coste de formato. Los Message ya estimados no se recalculan.
+        
+        Args:
+            mensaje: Message o dict con "role" y "content"
+        
+        Returns:
+            int: Tokens estimados
+        """
+        entrada = self._estimaciones.get(id(mensaje))
+        if entrada is not None and entrada[0] is mensaje:
+            return entrada[1]
+        
+        contenido = mensaje["content"]
+        if not isinstance(contenido, str):
+            contenido = "" if contenido is None else str(contenido)
+        tokens = self.coste_mensaje + self.estimar_texto(contenido)
+        
+        for llamada in mensaje.get("tool_calls") or ():
+            tokens += self.coste_mensaje + self.estimar_texto(llamada["name"]) + self.estimar_texto(llamada["arguments"])
+        for resultado in mensaje.get("tool_results") or ():
+            contenido = resultado["content"]
+            tokens += self.coste_mensaje + self.estimar_texto(contenido if isinstance(contenido, str) else str(contenido))
+        
+        # Solo se guardan los Message del historial; los dict temporales se estiman cada vez
+        if not isinstance(mensaje, dict):
+            self._estimaciones[id(mensaje)] = (mensaje, tokens)
+        return tokens
+    
+    def estimar_historial(self, historial):
+        """
+        Estima los tokens de todos los mensajes de un historial y descarta las
+        estimaciones de los mensajes que ya no forman parte de él.
+        
+        Args:
+            historial (list): Historial de mensajes del adaptador
+        
+        Returns:
+            int: Tokens estimados
+        """
+        total = 0
+        for mensaje in historial:
+            total += self.estimar_mensaje(mensaje)
+        self.podar(historial)
+        return total
+    
+    def podar(self, historial):
+        """
+        Descarta las estimaciones de los mensajes que ya no están en el historial.
+        
+        Args:
+            historial (list): Historial de mensajes del adaptador
+        """
+        if len(self._estimaciones) <= len(historial):
+            return
+        vigentes = {}
+        for mensaje in historial:
+            entrada = self._estimaciones.get(id(mensaje))
+            if entrada is not None and entrada[0] is mensaje:
+                vigentes[id(mensaje)] = entrada
+        self._estimaciones = vigentes
+    
+    def invalidar(self):
+        """Descarta las estimaciones guardadas; necesario si se modifica un mensaje en el lugar."""
+        self._estimaciones = {}
+    
+    def _tabla(self):
+        """
+        Abre la tabla BPE la primera vez que se usa. Si el fichero no se puede leer
+        o no está ordenado, se avisa y se vuelve a la heurística.
+        
+        Returns:
+            _TablaOrdenada: Tabla en flash o None si no hay tabla
+        """
+        if self.ruta_tabla is None:
+            return None
+        
+        tabla = _tablas.get(self.ruta_tabla)
+        if tabla is None:
+            try:
+                tabla = _TablaOrdenada(self.ruta_tabla)
+            except (OSError, ValueError) as e:
+                print(f"No se pudo cargar la tabla de tokens {self.ruta_tabla}: {e}")
+                self.ruta_tabla = None
+                return None
+            _tablas[self.ruta_tabla] = tabla
+        return tabla
+    
+    def _contar_con_tabla(self, texto, tokens, maximo):
+        """
+        Cuenta los tokens de cada palabra tomando siempre el token más largo de la tabla
+        que coincide (tokens admite el operador in). Los caracteres sin token cuentan un token por byte, como en BPE.
+        """
+        total = 0
+        for palabra in texto.split():
+            i = 0
+            n = len(palabra)
+            while i < n:
+                longitud = min(maximo, n - i)
+                while longitud > 1 and palabra[i:i + longitud] not in tokens:
+                    longitud -= 1
+                if longitud == 1 and palabra[i] not in tokens:
+                    total += len(palabra[i].encode("utf-8"))
+                else:
+                    total += 1
+                i += longitud
+        return total
@@ -0,0 +1,254 @@
+# mcp_tools.py
+import json
+
+try:
+    import _thread
+except ImportError:
+    _thread = None
+
+
+def esquema_desde_meta(nombre, meta):
+    """
+    Construye el esquema de una función en el formato común de los adaptadores.
+    
+    Args:
+        nombre (str): Nombre de la función
+        meta (dict): Metadatos con "description", "args" y "required"
+        
+    Returns:
+        dict: Esquema {"name", "description", "parameters"}
+    """
+    return {
+        "name": nombre,
+        "description": meta["description"],
+        "parameters": {
+            "type": "object",
+            "properties": meta["args"],
+            "required": meta.get("required", [])
+        }
+    }
+
+
+def _llamadas(respuesta):
+    """Devuelve la lista de llamadas de una respuesta function_call (también sin clave "calls")."""
+    if respuesta.get("calls"):
+        return respuesta["calls"]
+    return [{"id": "call_0", "name": respuesta["name"], "arguments": respuesta["arguments"]}]
+
+
+class ToolRegistry:
+    """
+    Registro de herramientas que mantiene juntas cada función y sus metadatos.
+    La lista de esquemas se construye una vez y se reutiliza (el mismo objeto,
+    lo que permite a los adaptadores reutilizar su conversión en caché) y la
+    ejecución se resuelve con una búsqueda en diccionario.
+    """
+    
+    def __init__(self):
+        self._funciones = {}
+        self._metadatos = {}
+        self._esquemas = None
+    
+    def registrar(self, nombre, funcion, meta):
+        """
+        Registra una función con sus metadatos, reemplazando la anterior del mismo nombre.
+        
+        Args:
+            nombre (str): Nombre con el que el modelo llamará a la función
+            funcion (callable): Función a ejecutar, recibe los argumentos por nombre
+            meta (dict): Metadatos con "description", "args" y "required"
+        """
+        self._funciones[nombre] = funcion
+        self._metadatos[nombre] = meta
+        self._esquemas = None
+    
+    def registrar_meta(self, funciones, function_meta):
+        """
+        Registra todas las funciones descritas en un diccionario de metadatos.
+        
+        Args:
+            funciones (dict): Funciones por nombre (por ejemplo globals() del módulo)
+            function_meta (dict): Metadatos por nombre de función
+            
+        Raises:
+            ValueError: Si alguna función descrita no existe
+        """
+        for nombre, meta in function_meta.items():
+            if nombre not in funciones:
+                raise ValueError(f"Función '{nombre}' descrita en los metadatos pero no definida")
+            self.registrar(nombre, funciones[nombre], meta)
+    
+    def eliminar(self, nombre):
+        """
+        Elimina una función del registro.
+        
+        Args:
+            nombre (str): Nombre de la función
+        """
+        if nombre in self._funciones:
+            del self._funciones[nombre]
+            del self._metadatos[nombre]
+            self._esquemas = None
+    
+    def esquemas(self):
+        """
+        Devuelve la lista de esquemas para pasar como functions a los adaptadores.
+        Se construye solo tras registrar o eliminar funciones.
+        
+        Returns:
+            list: Esquemas de las funciones registradas
+        """
+        if self._esquemas is None:
+            self._esquemas = [esquema_desde_meta(nombre, meta) for nombre, meta in self._metadatos.items()]
+        return self._esquemas
+    
+    @staticmethod
+    def decodificar_argumentos(argumentos):
+        """
+        Convierte los argumentos de una llamada a función en diccionario.
+        
+        Args:
+            argumentos (str/dict): Argumentos como texto JSON (OpenAI) o diccionario (Claude, Gemini)
+            
+        Returns:
+            dict: Argumentos decodificados (vacío si no son válidos)
+        """
+        if isinstance(argumentos, dict):
+            return argumentos
+        if not argumentos:
+            return {}
+        try:
+            args = json.loads(argumentos)
+        except ValueError:
+            return {}
+        return args if isinstance(args, dict) else {}
+    
+    def ejecutar(self, nombre, argumentos):
+        """
+        Ejecuta una función registrada.
+        
+        Args:
+            nombre (str): Nombre de la función solicitada por el modelo
+            argumentos (str/dict): Argumentos de la llamada
+            
+        Returns:
+            Resultado de la función, o un mensaje de error si no existe o falla
+        """
+        funcion = self._funciones.get(nombre)
+        if funcion is None:
+            return "Función no reconocida."
+        try:
+            return funcion(**self.decodificar_argumentos(argumentos))
+        except Exception as e:
+            return f"Error al ejecutar {nombre}: {e}"
+    
+    async def ejecutar_async(self, nombre, argumentos):
+        """
+        Ejecuta una función registrada, esperando su resultado si es una corrutina.
+        
+        Args:
+            nombre (str): Nombre de la función solicitada por el modelo
+            argumentos (str/dict): Argumentos de la llamada
+            
+        Returns:
+            Resultado de la función, o un mensaje de error si no existe o falla
+        """
+        resultado = self.ejecutar(nombre, argumentos)
+        if hasattr(resultado, "send"):
+            try:
+                resultado = await resultado
+            except Exception as e:
+                resultado = f"Error al ejecutar {nombre}: {e}"
+        return resultado
+    
+    def ejecutar_llamadas(self, llamadas):
+        """
+        Ejecuta varias llamadas independientes a la vez, una por hilo
+        (en secuencia si la plataforma no tiene _thread).
+        
+        Args:
+            llamadas (list): Llamadas {"id", "name", "arguments"} de la respuesta (clave "calls")
+            
+        Returns:
+            list: Resultado de cada llamada, en el mismo orden
+        """
+        resultados = [None] * len(llamadas)
+        if _thread is None or len(llamadas) < 2:
+            for i, llamada in enumerate(llamadas):
+                resultados[i] = self.ejecutar(llamada["name"], llamada["arguments"])
+            return resultados
+        
+        # Cada hilo libera su cerrojo al terminar; esperar es volver a adquirirlos todos
+        def trabajador(i, llamada, cerrojo):
+            try:
+                resultados[i] = self.ejecutar(llamada["name"], llamada["arguments"])
+            finally:
+                cerrojo.release()
+        
+        cerrojos = []
+        for i, llamada in enumerate(llamadas):
+            cerrojo = _thread.allocate_lock()
+            cerrojo.acquire()
+            cerrojos.append(cerrojo)
+            _thread.start_new_thread(trabajador, (i, llamada, cerrojo))
+        for cerrojo in cerrojos:
+            cerrojo.acquire()
+        return resultados
+    
+    async def ejecutar_llamadas_async(self, llamadas):
+        """
+        Ejecuta varias llamadas independientes a la vez en el bucle de eventos.
+        Las funciones asíncronas se solapan; las síncronas se ejecutan directamente.
+        
+        Args:
+            llamadas (list): Llamadas {"id", "name", "arguments"} de la respuesta (clave "calls")
+            
+        Returns:
+            list: Resultado de cada llamada, en el mismo orden
+        """
+        try:
+            import asyncio
+        except ImportError:
+            import uasyncio as asyncio
+        return list(await asyncio.gather(*[
+            self.ejecutar_async(llamada["name"], llamada["arguments"]) for llamada in llamadas
+        ]))
+    
+    def responder(self, adapter, respuesta, function_call="auto"):
+        """
+        Ejecuta todas las llamadas de una respuesta function_call y devuelve
+        los resultados al modelo en una única petición de seguimiento.
+        
+        Args:
+            adapter (MCPAdapter): Adaptador que generó la respuesta
+            respuesta (dict): Respuesta de tipo function_call
+            function_call (str): Modo de llamada a funciones para la petición de seguimiento
+            
+        Returns:
+            dict: Respuesta del modelo a los resultados (puede pedir nuevas llamadas)
+        """
+        llamadas = _llamadas(respuesta)
+        adapter.agregar_llamadas_herramientas(llamadas, self.ejecutar_llamadas(llamadas))
+        return adapter.consultar(functions=self.esquemas(), function_call=function_call)
+    
+    async def responder_async(self, adapter, respuesta, function_call="auto"):
+        """
+        Versión asíncrona de responder().
+        
+        Args:
+            adapter (MCPAdapter): Adaptador que generó la respuesta
+            respuesta (dict): Respuesta de tipo function_call
+            function_call (str): Modo de llamada a funciones para la petición de seguimiento
+            
+        Returns:
+            dict: Respuesta del modelo a los resultados (puede pedir nuevas llamadas)
+        """
+        llamadas = _llamadas(respuesta)
+        adapter.agregar_llamadas_herramientas(llamadas, await self.ejecutar_llamadas_async(llamadas))
+        return await adapter.consultar_async(functions=self.esquemas(), function_call=function_call)
+    
+    def __contains__(self, nombre):
+        return nombre in self._funciones
+    
+    def __len__(self):
+        return len(self._funciones)
@@ -0,0 +1,617 @@
+# mcp_transport.py
+import json
+
+from mcp_metrics import reloj, ms_desde
+
+try:
+    import usocket as socket
+except ImportError:
+    import socket
+
+try:
+    import ussl as ssl
+except ImportError:
+    import ssl
+
+# Tamaño de los bloques leídos del socket
+TAM_BLOQUE = 512
+
+# Tamaño del búfer en el que se agrupan las cabeceras y los fragmentos del cuerpo antes de escribirlos
+TAM_BUFER_ESCRITURA = 1024
+
+
+class EncodedHeaders(dict):
+    """
+    Cabeceras de petición que guardan también su bloque HTTP ya codificado
+    ("Nombre: valor\r\n" por cabecera), para que los transportes keep-alive no lo
+    reconstruyan en cada petición. Se usan como un dict normal con urequests.
+    No deben modificarse tras crearlas.
+    """
+    
+    def __init__(self, cabeceras):
+        """
+        Args:
+            cabeceras (dict): Cabeceras de la petición
+        """
+        super().__init__(cabeceras)
+        self.bloque = "".join([f"{nombre}: {valor}\r\n" for nombre, valor in cabeceras.items()]).encode("utf-8")
+
+
+def bloque_cabeceras(headers):
+    """
+    Devuelve las cabeceras codificadas como bloque HTTP, reutilizando el de EncodedHeaders.
+    
+    Args:
+        headers (dict): Cabeceras de la petición
+        
+    Returns:
+        bytes: Líneas "Nombre: valor\r\n" de todas las cabeceras
+    """
+    bloque = getattr(headers, "bloque", None)
+    if bloque is None:
+        bloque = "".join([f"{nombre}: {valor}\r\n" for nombre, valor in headers.items()]).encode("utf-8")
+    return bloque
+
+
+def piezas_cuerpo(data):
+    """
+    Devuelve los fragmentos del cuerpo de una petición.
+    
+    Args:
+        data: EncodedBody, bytes o None
+        
+    Returns:
+        Secuencia de fragmentos en bytes
+    """
+    fragmentos = getattr(data, "fragmentos", None)
+    if fragmentos is not None:
+        return fragmentos
+    return (data,) if data else ()
+
+
+def bloques_escritura(bufer, cabecera, piezas):
+    """
+    Agrupa la cabecera y los fragmentos del cuerpo en bloques del tamaño del búfer, de
+    modo que se escriben pocos bloques grandes sin construir nunca el cuerpo completo.
+    Los fragmentos mayores que el búfer se entregan directamente, sin copiarlos.
+    
+    Args:
+        bufer (bytearray): Búfer reutilizado entre peticiones
+        cabecera (bytes): Línea de petición y cabeceras HTTP
+        piezas: Fragmentos del cuerpo en bytes
+        
+    Yields:
+        memoryview: Bloque a escribir; solo es válido hasta pedir el siguiente
+    """
+    tam = len(bufer)
+    vista_bufer = memoryview(bufer)
+    n = 0
+    for grupo in ((cabecera,), piezas):
+        for pieza in grupo:
+            vista = memoryview(pieza)
+            total = len(vista)
+            inicio = 0
+            while inicio < total:
+                if n == 0 and total - inicio >= tam:
+                    yield vista[inicio:]
+                    break
+                copia = min(tam - n, total - inicio)
+                bufer[n:n + copia] = vista[inicio:inicio + copia]
+                n += copia
+                inicio += copia
+                if n == tam:
+                    yield vista_bufer
+                    n = 0
+    if n:
+        yield vista_bufer[:n]
+
+
+def _dividir_url(url):
+    """
+    Separa una URL en sus componentes.
+    
+    Args:
+        url (str): URL completa (http:// o https://)
+        
+    Returns:
+        tuple: (esquema, host, puerto, ruta)
+    """
+    esquema, _, resto = url.partition("://")
+    host, barra, ruta = resto.partition("/")
+    ruta = barra + ruta if barra else "/"
+    
+    if ":" in host:
+        host, puerto = host.split(":", 1)
+        puerto = int(puerto)
+    else:
+        puerto = 443 if esquema == "https" else 80
+    
+    return esquema, host, puerto, ruta
+
+
+class HTTPResponse:
+    """
+    Respuesta HTTP leída de forma incremental desde una conexión.
+    Decodifica cuerpos con Content-Length, chunked o delimitados por el cierre.
+    """
+    
+    def __init__(self, conexion, status_code, headers):
+        """
+        Inicializa la respuesta tras leer la línea de estado y las cabeceras.
+        
+        Args:
+            conexion (Conexion): Conexión de la que se lee el cuerpo
+            status_code (int): Código de estado HTTP
+            headers (dict): Cabeceras con nombres en minúsculas
+        """
+        self.conexion = conexion
+        self.status_code = status_code
+        self.headers = headers
+        self._buffer = b""
+        self._fin = False
+        self._contenido = None
+        
+        self._chunked = "chunked" in headers.get("transfer-encoding", "").lower()
+        if "content-length" in headers:
+            self._restante = int(headers["content-length"])
+        else:
+            self._restante = None
+        
+        # En modo chunked, bytes pendientes del bloque actual
+        self._restante_chunk = 0
+        
+        if self._restante == 0 or status_code in (204, 304):
+            self._fin = True
+        
+        # Tiempos de la petición en ms (conexión, primer byte y lectura acumulada del cuerpo)
+        # y bytes del cuerpo recibidos, para las métricas
+        self.tiempos = {"conexion_ms": 0, "primer_byte_ms": 0, "lectura_ms": 0}
+        self.bytes_recibidos = 0
+    
+    @property
+    def raw(self):
+        """Compatibilidad con urequests: la propia respuesta actúa como flujo."""
+        return self
+    
+    def _leer_bloque(self):
+        """
+        Lee el siguiente bloque del cuerpo, contando el tiempo de espera y los bytes.
+        
+        Returns:
+            bytes: Bloque leído o b"" al llegar al final del cuerpo
+        """
+        inicio = reloj()
+        bloque = self._siguiente_bloque()
+        self.tiempos["lectura_ms"] += ms_desde(inicio)
+        self.bytes_recibidos += len(bloque)
+        return bloque
+    
+    def _siguiente_bloque(self):
+        """
+        Lee el siguiente bloque del cuerpo respetando la codificación de transferencia.
+        
+        Returns:
+            bytes: Bloque leído o b"" al llegar al final del cuerpo
+        """
+        if self._fin:
+            return b""
+        
+        flujo = self.conexion.flujo
+        
+        if self._chunked:
+            if self._restante_chunk == 0:
+                linea = flujo.readline()
+                tam = int(linea.split(b";")[0].strip() or b"0", 16)
+                if tam == 0:
+                    # Consumir trailers hasta la línea vacía final
+                    while True:
+                        linea = flujo.readline()
+                        if not linea or linea == b"\r\n":
+                            break
+                    self._fin = True
+                    return b""
+                self._restante_chunk = tam
+            
+            bloque = flujo.read(min(TAM_BLOQUE, self._restante_chunk))
+            if not bloque:
+                raise OSError("Conexión cerrada en mitad de un bloque chunked")
+            self._restante_chunk -= len(bloque)
+            if self._restante_chunk == 0:
+                # CRLF que cierra el bloque
+                flujo.readline()
+            return bloque
+        
+        if self._restante is not None:
+            bloque = flujo.read(min(TAM_BLOQUE, self._restante))
+            if not bloque:
+                raise OSError("Conexión cerrada antes de completar el cuerpo")
+            self._restante -= len(bloque)
+            if self._restante == 0:
+                self._fin = True
+            return bloque
+        
+        # Sin longitud conocida: el cuerpo termina cuando el servidor cierra.
+        # read1() (CPython) entrega lo disponible sin esperar a completar el bloque
+        bloque = getattr(flujo, "read1", flujo.read)(TAM_BLOQUE)
+        if not bloque:
+            self._fin = True
+            self.conexion.reutilizable = False
+        return bloque
+    
+    def read(self, n=-1):
+        """
+        Lee hasta n bytes del cuerpo (todo el cuerpo si n es negativo).
+        
+        Args:
+            n (int): Número máximo de bytes a leer
+            
+        Returns:
+            bytes: Datos leídos, b"" al final del cuerpo
+        """
+        if n is None or n < 0:
+            partes = [self._buffer]
+            self._buffer = b""
+            while True:
+                bloque = self._leer_bloque()
+                if not bloque:
+                    break
+                partes.append(bloque)
+            return b"".join(partes)
+        
+        if not self._buffer:
+            self._buffer = self._leer_bloque()
+        datos = self._buffer[:n]
+        self._buffer = self._buffer[n:]
+        return datos
+    
+    def readline(self):
+        """
+        Lee una línea del cuerpo, incluyendo el salto de línea final.
+        
+        Returns:
+            bytes: Línea leída, b"" al final del cuerpo
+        """
+        while True:
+            pos = self._buffer.find(b"\n")
+            if pos >= 0:
+                linea = self._buffer[:pos + 1]
+                self._buffer = self._buffer[pos + 1:]
+                return linea
+            bloque = self._leer_bloque()
+            if not bloque:
+                linea = self._buffer
+                self._buffer = b""
+                return linea
+            self._buffer += bloque
+    
+    @property
+    def content(self):
+        """Cuerpo completo de la respuesta en bytes."""
+        if self._contenido is None:
+            self._contenido = self.read()
+        return self._contenido
+    
+    @property
+    def text(self):
+        """Cuerpo completo de la respuesta como texto."""
+        return self.content.decode("utf-8")
+    
+    def json(self):
+        """Cuerpo completo de la respuesta decodificado como JSON."""
+        return json.loads(self.content)
+    
+    def close(self):
+        """
+        Libera la conexión. Si el cuerpo se leyó completo y el servidor permite
+        keep-alive, la conexión vuelve al pool; en caso contrario se cierra.
+        """
+        if self.conexion is None:
+            return
+        if self._fin and not self._buffer and self.conexion.reutilizable:
+            self.conexion.liberar()
+        else:
+            self.conexion.cerrar()
+        self.conexion = None
+
+
+class Conexion:
+    """Conexión HTTP/1.1 persistente a un host, con TLS si el esquema es https."""
+    
+    def __init__(self, pool, esquema, host, puerto, timeout):
+        """
+        Inicializa la conexión sin abrirla todavía.
+        
+        Args:
+            pool (KeepAliveTransport): Transporte al que se devuelve la conexión
+            esquema (str): "http" o "https"
+            host (str): Nombre del host
+            puerto (int): Puerto TCP
+            timeout (float): Tiempo máximo de espera del socket en segundos
+        """
+        self.pool = pool
+        self.esquema = esquema
+        self.host = host
+        self.puerto = puerto
+        self.timeout = timeout
+        self.sock = None
+        self.flujo = None
+        self.reutilizable = True
+        # Número de peticiones atendidas, 0 indica una conexión recién abierta
+        self.peticiones = 0
+        # Última línea de petición codificada (metodo, ruta, bytes)
+        self._linea = None
+        # Búfer de escritura de las peticiones
+        self._bufer = bytearray(TAM_BUFER_ESCRITURA)
+    
+    @property
+    def clave(self):
+        """Clave con la que la conexión se guarda en el pool."""
+        return (self.esquema, self.host, self.puerto)
+    
+    def abrir(self):
+        """Resuelve el host, abre el socket TCP y realiza el handshake TLS si corresponde."""
+        direccion = self.pool.resolver(self.host, self.puerto)
+        sock = socket.socket(direccion[0], direccion[1], direccion[2])
+        try:
+            sock.settimeout(self.timeout)
+            sock.connect(direccion[-1])
+            # Los bloques se escriben ya agrupados: esperar al ACK del anterior solo añade latencia
+            if hasattr(socket, "TCP_NODELAY"):
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            if self.esquema == "https":
+                sock = self._envolver_tls(sock)
+        except Exception:
+            sock.close()
+            raise
+        
+        self.sock = sock
+        # CPython necesita un archivo con buffer para readline(); MicroPython lee del socket
+        self.flujo = sock.makefile("rb") if hasattr(sock, "makefile") else sock
+        self.reutilizable = True
+        self.peticiones = 0
+    
+    def _envolver_tls(self, sock):
+        """Aplica TLS al socket usando la API disponible (CPython o MicroPython)."""
+        if hasattr(ssl, "create_default_context"):
+            contexto = ssl.create_default_context()
+            return contexto.wrap_socket(sock, server_hostname=self.host)
+        return ssl.wrap_socket(sock, server_hostname=self.host)
+    
+    def _linea_peticion(self, metodo, ruta):
+        """
+        Línea de petición y cabeceras fijas de la conexión, codificadas una vez por ruta.
+        
+        Returns:
+            bytes: "METODO ruta HTTP/1.1", Host y Connection
+        """
+        if self._linea is None or self._linea[0] != metodo or self._linea[1] != ruta:
+            bloque = f"{metodo} {ruta} HTTP/1.1\r\nHost: {self.host}\r\nConnection: keep-alive\r\n".encode("utf-8")
+            self._linea = (metodo, ruta, bloque)
+        return self._linea[2]
+    
+    def escribir(self, datos):
+        """Envía todos los bytes por el socket."""
+        if hasattr(self.sock, "sendall"):
+            self.sock.sendall(datos)
+        else:
+            self.sock.write(datos)
+    
+    def enviar(self, metodo, ruta, headers, data):
+        """
+        Envía una petición y lee la línea de estado y las cabeceras de la respuesta.
+        
+        Args:
+            metodo (str): Método HTTP
+            ruta (str): Ruta con query string
+            headers (dict): Cabeceras adicionales
+            data: Cuerpo de la petición (EncodedBody o bytes)
+            
+        Returns:
+            HTTPResponse: Respuesta lista para leer el cuerpo
+        """
+        longitud = len(data) if data else 0
+        cabecera = self._linea_peticion(metodo, ruta) + f"Content-Length: {longitud}\r\n".encode() + bloque_cabeceras(headers) + b"\r\n"
+        
+        inicio = reloj()
+        for bloque in bloques_escritura(self._bufer, cabecera, piezas_cuerpo(data)):
+            self.escribir(bloque)
+        self.peticiones += 1
+        
+        # Línea de estado
+        linea = self.flujo.readline()
+        if not linea:
+            raise OSError("El servidor cerró la conexión")
+        partes = linea.split(None, 2)
+        status_code = int(partes[1])
+        primer_byte_ms = ms_desde(inicio)
+        
+        # Un servidor HTTP/1.0 cierra la conexión tras la respuesta
+        if partes[0] == b"HTTP/1.0":
+            self.reutilizable = False
+        
+        # Cabeceras
+        resp_headers = {}
+        while True:
+            linea = self.flujo.readline()
+            if not linea or linea == b"\r\n":
+                break
+            nombre, _, valor = linea.decode("utf-8").partition(":")
+            resp_headers[nombre.strip().lower()] = valor.strip()
+        
+        if resp_headers.get("connection", "").lower() == "close":
+            self.reutilizable = False
+        
+        response = HTTPResponse(self, status_code, resp_headers)
+        response.tiempos["primer_byte_ms"] = primer_byte_ms
+        return response
+    
+    def liberar(self):
+        """Devuelve la conexión al pool para reutilizarla."""
+        self.pool.devolver(self)
+    
+    def cerrar(self):
+        """Cierra el socket de la conexión."""
+        if self.sock is not None:
+            try:
+                self.sock.close()
+            except Exception:
+                pass
+        self.sock = None
+        self.flujo = None
+
+
+class Transport:
+    """
+    Interfaz de transporte HTTP usada por los adaptadores MCP.
+    Permite sustituir la forma en que se envían las peticiones (keep-alive, urequests, pruebas).
+    """
+    
+    def solicitar(self, metodo, url, headers=None, data=None, stream=False):
+        """
+        Envía una petición HTTP.
+        
+        Args:
+            metodo (str): Método HTTP ("GET", "POST", ...)
+            url (str): URL de destino
+            headers (dict): Cabeceras de la petición
+            data: Cuerpo de la petición (EncodedBody o bytes)
+            stream (bool): Si es True el cuerpo no se lee por adelantado
+            
+        Returns:
+            Respuesta con status_code, headers, read(), readline(), text, json() y close()
+        """
+        raise NotImplementedError("Subclases deben implementar solicitar()")
+    
+    def post(self, url, headers=None, data=None, stream=False):
+        """Envía una petición POST (ver solicitar())."""
+        return self.solicitar("POST", url, headers, data, stream)
+    
+    def get(self, url, headers=None, stream=False):
+        """Envía una petición GET (ver solicitar())."""
+        return self.solicitar("GET", url, headers, None, stream)
+    
+    def cerrar(self):
+        """Cierra las conexiones abiertas por el transporte."""
+        pass
+
+
+class KeepAliveTransport(Transport):
+    """
+    Transporte HTTP/1.1 que mantiene abierta una conexión por host y la reutiliza,
+    evitando repetir DNS, TCP y el handshake TLS en cada petición.
+    """
+    
+    def __init__(self, timeout=30):
+        """
+        Inicializa el pool de conexiones.
+        
+        Args:
+            timeout (float): Tiempo máximo de espera del socket en segundos
+        """
+        self.timeout = timeout
+        # Conexión libre por (esquema, host, puerto)
+        self._libres = {}
+        # Direcciones ya resueltas por (host, puerto)
+        self._dns = {}
+    
+    def resolver(self, host, puerto):
+        """
+        Resuelve un host reutilizando el resultado de consultas anteriores.
+        
+        Returns:
+            tuple: Entrada de getaddrinfo (familia, tipo, proto, canonname, dirección)
+        """
+        clave = (host, puerto)
+        if clave not in self._dns:
+            self._dns[clave] = socket.getaddrinfo(host, puerto, 0, socket.SOCK_STREAM)[0]
+        return self._dns[clave]
+    
+    def _obtener(self, esquema, host, puerto):
+        """Toma la conexión libre del host o crea una nueva (sin abrir)."""
+        conexion = self._libres.pop((esquema, host, puerto), None)
+        if conexion is None:
+            conexion = Conexion(self, esquema, host, puerto, self.timeout)
+        return conexion
+    
+    def devolver(self, conexion):
+        """Guarda una conexión libre; si ya hay una para el host, cierra la sobrante."""
+        if conexion.clave in self._libres:
+            conexion.cerrar()
+        else:
+            self._libres[conexion.clave] = conexion
+    
+    def solicitar(self, metodo, url, headers=None, data=None, stream=False):
+        """
+        Envía una petición reutilizando la conexión del host.
+        Si una conexión reutilizada fue cerrada por el servidor, reconecta y reintenta una vez.
+        
+        Args:
+            metodo (str): Método HTTP
+            url (str): URL de destino
+            headers (dict): Cabeceras de la petición
+            data: Cuerpo de la petición (EncodedBody o bytes)
+            stream (bool): Si es True el cuerpo no se lee por adelantado
+            
+        Returns:
+            HTTPResponse: Respuesta del servidor
+        """
+        esquema, host, puerto, ruta = _dividir_url(url)
+        conexion = self._obtener(esquema, host, puerto)
+        conexion_ms = 0
+        
+        while True:
+            reutilizada = conexion.sock is not None
+            try:
+                if not reutilizada:
+                    inicio = reloj()
+                    conexion.abrir()
+                    conexion_ms += ms_desde(inicio)
+                response = conexion.enviar(metodo, ruta, headers or {}, data)
+                response.tiempos["conexion_ms"] = conexion_ms
+                break
+            except Exception:
+                conexion.cerrar()
+                # Solo se reintenta si el fallo pudo deberse a una conexión inactiva caducada
+                if not reutilizada:
+                    raise
+        
+        if not stream:
+            # Leer el cuerpo completo y devolver la conexión al pool cuanto antes
+            response.content
+            response.close()
+        
+        return response
+    
+    def cerrar(self):
+        """Cierra todas las conexiones libres del pool."""
+        for conexion in self._libres.values():
+            conexion.cerrar()
+        self._libres = {}
+
+
+class UrequestsTransport(Transport):
+    """Transporte basado en urequests: una conexión nueva por petición."""
+    
+    def solicitar(self, metodo, url, headers=None, data=None, stream=False):
+        """Envía la petición con urequests.request (el cuerpo se une antes de enviarlo)."""
+        import urequests
+        if hasattr(data, "unir"):
+            data = data.unir()
+        return urequests.request(metodo, url, headers=headers or {}, data=data, stream=stream)
+
+
+# Transporte compartido por todos los adaptadores que no indiquen uno propio
+_transporte_compartido = None
+
+
+def transporte_compartido():
+    """
+    Devuelve el transporte keep-alive compartido, creándolo la primera vez.
+    
+    Returns:
+        KeepAliveTransport: Pool de conexiones común a todos los adaptadores
+    """
+    global _transporte_compartido
+    if _transporte_compartido is None:
+        _transporte_compartido = KeepAliveTransport()
+    return _transporte_compartido
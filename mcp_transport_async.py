@@ -0,0 +1,404 @@
+# mcp_transport_async.py
+import json
+
+try:
+    import asyncio
+except ImportError:
+    import uasyncio as asyncio
+
+from mcp_metrics import reloj, ms_desde
+from mcp_transport import (TAM_BLOQUE, TAM_BUFER_ESCRITURA, _dividir_url, bloque_cabeceras,
+                           bloques_escritura, piezas_cuerpo)
+
+
+class AsyncHTTPResponse:
+    """
+    Respuesta HTTP leída de forma incremental desde una conexión asíncrona.
+    Equivalente no bloqueante de HTTPResponse: read() y readline() son corrutinas.
+    """
+    
+    def __init__(self, conexion, status_code, headers):
+        """
+        Inicializa la respuesta tras leer la línea de estado y las cabeceras.
+        
+        Args:
+            conexion (AsyncConexion): Conexión de la que se lee el cuerpo
+            status_code (int): Código de estado HTTP
+            headers (dict): Cabeceras con nombres en minúsculas
+        """
+        self.conexion = conexion
+        self.status_code = status_code
+        self.headers = headers
+        self._buffer = b""
+        self._fin = False
+        
+        self._chunked = "chunked" in headers.get("transfer-encoding", "").lower()
+        if "content-length" in headers:
+            self._restante = int(headers["content-length"])
+        else:
+            self._restante = None
+        self._restante_chunk = 0
+        
+        if self._restante == 0 or status_code in (204, 304):
+            self._fin = True
+        
+        # Tiempos de la petición en ms (conexión, primer byte y lectura acumulada del cuerpo)
+        # y bytes del cuerpo recibidos, para las métricas
+        self.tiempos = {"conexion_ms": 0, "primer_byte_ms": 0, "lectura_ms": 0}
+        self.bytes_recibidos = 0
+    
+    async def _leer_bloque(self):
+        """
+        Lee el siguiente bloque del cuerpo, contando el tiempo de espera y los bytes.
+        Cada bloque tiene el mismo límite de tiempo que la conexión y las cabeceras, de
+        modo que un servidor que se detiene a mitad del cuerpo no bloquea la tarea.
+        
+        Returns:
+            bytes: Bloque leído o b"" al llegar al final del cuerpo
+        """
+        inicio = reloj()
+        bloque = await asyncio.wait_for(self._siguiente_bloque(), self.conexion.pool.timeout)
+        self.tiempos["lectura_ms"] += ms_desde(inicio)
+        self.bytes_recibidos += len(bloque)
+        return bloque
+    
+    async def _siguiente_bloque(self):
+        """
+        Lee el siguiente bloque del cuerpo respetando la codificación de transferencia.
+        
+        Returns:
+            bytes: Bloque leído o b"" al llegar al final del cuerpo
+        """
+        if self._fin:
+            return b""
+        
+        lector = self.conexion.lector
+        
+        if self._chunked:
+            if self._restante_chunk == 0:
+                linea = await lector.readline()
+                tam = int(linea.split(b";")[0].strip() or b"0", 16)
+                if tam == 0:
+                    # Consumir trailers hasta la línea vacía final
+                    while True:
+                        linea = await lector.readline()
+                        if not linea or linea == b"\r\n":
+                            break
+                    self._fin = True
+                    return b""
+                self._restante_chunk = tam
+            
+            bloque = await lector.read(min(TAM_BLOQUE, self._restante_chunk))
+            if not bloque:
+                raise OSError("Conexión cerrada en mitad de un bloque chunked")
+            self._restante_chunk -= len(bloque)
+            if self._restante_chunk == 0:
+                # CRLF que cierra el bloque
+                await lector.readline()
+            return bloque
+        
+        if self._restante is not None:
+            bloque = await lector.read(min(TAM_BLOQUE, self._restante))
+            if not bloque:
+                raise OSError("Conexión cerrada antes de completar el cuerpo")
+            self._restante -= len(bloque)
+            if self._restante == 0:
+                self._fin = True
+            return bloque
+        
+        # Sin longitud conocida: el cuerpo termina cuando el servidor cierra
+        bloque = await lector.read(TAM_BLOQUE)
+        if not bloque:
+            self._fin = True
+            self.conexion.reutilizable = False
+        return bloque
+    
+    async def read(self, n=-1):
+        """
+        Lee hasta n bytes del cuerpo (todo el cuerpo si n es negativo).
+        
+        Args:
+            n (int): Número máximo de bytes a leer
+            
+        Returns:
+            bytes: Datos leídos, b"" al final del cuerpo
+        """
+        if n is None or n < 0:
+            partes = [self._buffer]
+            self._buffer = b""
+            while True:
+                bloque = await self._leer_bloque()
+                if not bloque:
+                    break
+                partes.append(bloque)
+            return b"".join(partes)
+        
+        if not self._buffer:
+            self._buffer = await self._leer_bloque()
+        datos = self._buffer[:n]
+        self._buffer = self._buffer[n:]
+        return datos
+    
+    async def readline(self):
+        """
+        Lee una línea del cuerpo, incluyendo el salto de línea final.
+        
+        Returns:
+            bytes: Línea leída, b"" al final del cuerpo
+        """
+        while True:
+            pos = self._buffer.find(b"\n")
+            if pos >= 0:
+                linea = self._buffer[:pos + 1]
+                self._buffer = self._buffer[pos + 1:]
+                return linea
+            bloque = await self._leer_bloque()
+            if not bloque:
+                linea = self._buffer
+                self._buffer = b""
+                return linea
+            self._buffer += bloque
+    
+    async def json(self):
+        """Lee el cuerpo completo y lo decodifica como JSON."""
+        return json.loads(await self.read())
+    
+    def close(self):
+        """
+        Libera la conexión: vuelve al pool si el cuerpo se leyó completo y el servidor
+        permite keep-alive; en caso contrario se cierra.
+        """
+        if self.conexion is None:
+            return
+        if self._fin and not self._buffer and self.conexion.reutilizable:
+            self.conexion.liberar()
+        else:
+            self.conexion.cerrar()
+        self.conexion = None
+
+
+class AsyncConexion:
+    """Conexión HTTP/1.1 persistente y no bloqueante a un host."""
+    
+    def __init__(self, pool, esquema, host, puerto):
+        """
+        Inicializa la conexión sin abrirla todavía.
+        
+        Args:
+            pool (AsyncKeepAliveTransport): Transporte al que se devuelve la conexión
+            esquema (str): "http" o "https"
+            host (str): Nombre del host
+            puerto (int): Puerto TCP
+        """
+        self.pool = pool
+        self.esquema = esquema
+        self.host = host
+        self.puerto = puerto
+        self.lector = None
+        self.escritor = None
+        self.reutilizable = True
+        # Bucle de eventos en el que se abrió la conexión
+        self.bucle = None
+        # Última línea de petición codificada (metodo, ruta, bytes)
+        self._linea = None
+        # Búfer de escritura de las peticiones
+        self._bufer = bytearray(TAM_BUFER_ESCRITURA)
+    
+    @property
+    def clave(self):
+        """Clave con la que la conexión se guarda en el pool."""
+        return (self.esquema, self.host, self.puerto)
+    
+    async def abrir(self):
+        """Abre la conexión TCP (y TLS si el esquema es https) sin bloquear el bucle de eventos."""
+        if self.esquema == "https":
+            self.lector, self.escritor = await asyncio.open_connection(self.host, self.puerto, ssl=True)
+        else:
+            self.lector, self.escritor = await asyncio.open_connection(self.host, self.puerto)
+        self.reutilizable = True
+        self.bucle = asyncio.get_event_loop()
+    
+    def _linea_peticion(self, metodo, ruta):
+        """
+        Línea de petición y cabeceras fijas de la conexión, codificadas una vez por ruta.
+        
+        Returns:
+            bytes: "METODO ruta HTTP/1.1", Host y Connection
+        """
+        if self._linea is None or self._linea[0] != metodo or self._linea[1] != ruta:
+            bloque = f"{metodo} {ruta} HTTP/1.1\r\nHost: {self.host}\r\nConnection: keep-alive\r\n".encode("utf-8")
+            self._linea = (metodo, ruta, bloque)
+        return self._linea[2]
+    
+    async def enviar(self, metodo, ruta, headers, data):
+        """
+        Envía una petición y lee la línea de estado y las cabeceras de la respuesta.
+        
+        Args:
+            metodo (str): Método HTTP
+            ruta (str): Ruta con query string
+            headers (dict): Cabeceras adicionales
+            data: Cuerpo de la petición (EncodedBody o bytes)
+            
+        Returns:
+            AsyncHTTPResponse: Respuesta lista para leer el cuerpo
+        """
+        longitud = len(data) if data else 0
+        cabecera = self._linea_peticion(metodo, ruta) + f"Content-Length: {longitud}\r\n".encode() + bloque_cabeceras(headers) + b"\r\n"
+        
+        inicio = reloj()
+        # write() copia el bloque, así que el búfer se puede reutilizar; drain() tras
+        # cada bloque evita acumular el cuerpo completo en el búfer del flujo
+        for bloque in bloques_escritura(self._bufer, cabecera, piezas_cuerpo(data)):
+            self.escritor.write(bloque)
+            await self.escritor.drain()
+        
+        # Línea de estado
+        linea = await self.lector.readline()
+        if not linea:
+            raise OSError("El servidor cerró la conexión")
+        partes = linea.split(None, 2)
+        status_code = int(partes[1])
+        primer_byte_ms = ms_desde(inicio)
+        
+        # Un servidor HTTP/1.0 cierra la conexión tras la respuesta
+        if partes[0] == b"HTTP/1.0":
+            self.reutilizable = False
+        
+        # Cabeceras
+        resp_headers = {}
+        while True:
+            linea = await self.lector.readline()
+            if not linea or linea == b"\r\n":
+                break
+            nombre, _, valor = linea.decode("utf-8").partition(":")
+            resp_headers[nombre.strip().lower()] = valor.strip()
+        
+        if resp_headers.get("connection", "").lower() == "close":
+            self.reutilizable = False
+        
+        response = AsyncHTTPResponse(self, status_code, resp_headers)
+        response.tiempos["primer_byte_ms"] = primer_byte_ms
+        return response
+    
+    def liberar(self):
+        """Devuelve la conexión al pool para reutilizarla."""
+        self.pool.devolver(self)
+    
+    def cerrar(self):
+        """Cierra la conexión."""
+        if self.escritor is not None:
+            try:
+                self.escritor.close()
+            except Exception:
+                pass
+        self.lector = None
+        self.escritor = None
+
+
+class AsyncKeepAliveTransport:
+    """
+    Transporte HTTP/1.1 no bloqueante para uasyncio y asyncio de CPython.
+    Mantiene una conexión libre por host; las peticiones simultáneas al mismo host
+    abren conexiones adicionales que se cierran al terminar.
+    """
+    
+    def __init__(self, timeout=30):
+        """
+        Inicializa el pool de conexiones.
+        
+        Args:
+            timeout (float): Tiempo máximo para recibir las cabeceras de la respuesta, en segundos
+        """
+        self.timeout = timeout
+        self._libres = {}
+    
+    def devolver(self, conexion):
+        """Guarda una conexión libre; si ya hay una para el host, cierra la sobrante."""
+        if conexion.clave in self._libres:
+            conexion.cerrar()
+        else:
+            self._libres[conexion.clave] = conexion
+    
+    async def post(self, url, headers=None, data=None, stream=False):
+        """
+        Envía una petición POST reutilizando la conexión del host.
+        Si una conexión reutilizada fue cerrada por el servidor, reconecta y reintenta una vez.
+        
+        Args:
+            url (str): URL de destino
+            headers (dict): Cabeceras de la petición
+            data: Cuerpo de la petición (EncodedBody o bytes)
+            stream (bool): Si es True el cuerpo no se lee por adelantado
+            
+        Returns:
+            AsyncHTTPResponse: Respuesta del servidor
+        """
+        esquema, host, puerto, ruta = _dividir_url(url)
+        conexion = self._libres.pop((esquema, host, puerto), None)
+        
+        # Una conexión abierta en otro bucle de eventos (p. ej. un asyncio.run() anterior) no sirve
+        if conexion is not None and conexion.bucle is not asyncio.get_event_loop():
+            conexion.cerrar()
+            conexion = None
+        
+        if conexion is None:
+            conexion = AsyncConexion(self, esquema, host, puerto)
+        
+        conexion_ms = 0
+        while True:
+            reutilizada = conexion.escritor is not None
+            try:
+                if not reutilizada:
+                    inicio = reloj()
+                    await asyncio.wait_for(conexion.abrir(), self.timeout)
+                    conexion_ms += ms_desde(inicio)
+                response = await asyncio.wait_for(conexion.enviar("POST", ruta, headers or {}, data), self.timeout)
+                response.tiempos["conexion_ms"] = conexion_ms
+                break
+            except asyncio.CancelledError:
+                conexion.cerrar()
+                raise
+            except Exception:
+                conexion.cerrar()
+                # Solo se reintenta si el fallo pudo deberse a una conexión inactiva caducada
+                if not reutilizada:
+                    raise
+        
+        if not stream:
+            # Leer el cuerpo completo y devolver la conexión al pool cuanto antes;
+            # read() seguirá entregando el cuerpo guardado
+            contenido = await response.read()
+            response.close()
+            response._buffer = contenido
+        
+        return response
+    
+    def cerrar(self, bucle=None):
+        """
+        Cierra las conexiones libres del pool.
+        
+        Args:
+            bucle: Cerrar solo las abiertas en este bucle de eventos (None cierra todas)
+        """
+        for clave, conexion in list(self._libres.items()):
+            if bucle is None or conexion.bucle is bucle:
+                conexion.cerrar()
+                del self._libres[clave]
+
+
+# Transporte asíncrono compartido por todos los adaptadores
+_transporte_async_compartido = None
+
+
+def transporte_async_compartido():
+    """
+    Devuelve el transporte asíncrono compartido, creándolo la primera vez.
+    
+    Returns:
+        AsyncKeepAliveTransport: Pool de conexiones no bloqueantes común a todos los adaptadores
+    """
+    global _transporte_async_compartido
+    if _transporte_async_compartido is None:
+        _transporte_async_compartido = AsyncKeepAliveTransport()
+    return _transporte_async_compartido
@@ -1,12 +1,24 @@
 # openai_mcp_adapter.py
-import urequests
 import json
 from mcp_base import MCPAdapter
+from mcp_codec import codificar, EncodedBody, fragmentos_lista, fragmentos_objeto, TEXTO_ESTANDAR, ToolSchemaCache
+from mcp_json import compilar_rutas
+from mcp_transport import EncodedHeaders
 
 class OpenAIMCPAdapter(MCPAdapter):
     """Adaptador MCP para la API de OpenAI"""
     
-    def __init__(self, api_key, modelo="gpt-3.5-turbo", max_tokens=50, temperatura=0.7):
+    nombre_proveedor = "OpenAI"
+    familia_tokens = "openai"
+    _cache_herramientas = ToolSchemaCache()
+    
+    # Partes de la respuesta que se extraen del JSON recibido; el resto se descarta al leer
+    _arbol_respuesta = compilar_rutas([
+        ("choices", 0, "message"),
+        ("usage",),
+    ])
+    
+    def __init__(self, api_key, modelo="gpt-3.5-turbo", max_tokens=50, temperatura=0.7, transporte=None):
         """
         Inicializa el adaptador para OpenAI.
         
@@ -15,63 +27,140 @@ class OpenAIMCPAdapter(MCPAdapter):
             modelo (str): Modelo a utilizar (por defecto 'gpt-3.5-turbo')
             max_tokens (int): Número máximo de tokens en la respuesta
             temperatura (float): Nivel de aleatoriedad (0.0-1.0)
+            transporte (Transport): Transporte HTTP (por defecto el pool keep-alive compartido)
         """
-        super().__init__(api_key, modelo, max_tokens, temperatura)
+        super().__init__(api_key, modelo, max_tokens, temperatura, transporte)
         self.url = "https://api.openai.com/v1/chat/completions"
     
-    def _realizar_peticion(self, functions, function_call):
+    def _preparar_peticion(self, functions, function_call, stream=False):
         """
-        Realiza la petición a la API de OpenAI.
+        Construye la petición a la API de OpenAI.
         
         Args:
             functions (list): Funciones disponibles en formato OpenAI
             function_call (str): Modo de llamada a funciones
+            stream (bool): Si se solicita la respuesta en streaming
             
         Returns:
-            dict: Respuesta cruda de OpenAI o None si hay error
+            tuple: (url, headers, cuerpo) de la petición
         """
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {self.api_key}"
-        }
+        plantilla = self._plantilla_peticion()
         
-        # Preparar mensajes para OpenAI
-        messages = []
+        # Mensajes ya codificados: solo se serializan los añadidos desde la última petición
+        messages = self._mensajes_codificados()
         
         # Agregar mensaje de sistema si existe
         if self.system:
-            messages.append({"role": "system", "content": self.system})
+            messages = [self._system_codificado()] + messages
         
-        # Agregar el resto de mensajes
-        messages.extend(self.historial)
+        campos = plantilla["inicio"] + [("messages", fragmentos_lista(messages))] + plantilla["fin"]
+        
+        # Agregar funciones como tools, que permite varias llamadas en una misma respuesta
+        if functions is not None:
+            campos.append(("tools", self._herramientas_codificadas(functions)))
+            campos.append(("tool_choice", codificar(self._convertir_function_call(function_call))))
+        
+        # Solicitar la respuesta como eventos SSE
+        if stream:
+            campos.append(("stream", b"true"))
+        
+        return self.url, plantilla["headers"], EncodedBody(fragmentos_objeto(campos))
+    
+    def _compilar_plantilla(self):
+        """
+        Codifica las cabeceras y los campos fijos de la petición a OpenAI.
         
-        data = {
-            "model": self.modelo,
-            "messages": messages,
-            "temperature": self.temperatura,
-            "max_tokens": self.max_tokens,
+        Returns:
+            dict: headers, e "inicio"/"fin" con los campos antes y después de messages
+        """
+        return {
+            "headers": EncodedHeaders({
+                "Content-Type": "application/json",
+                "Authorization": f"Bearer {self.api_key}"
+            }),
+            "inicio": [("model", codificar(self.modelo))],
+            "fin": [
+                ("temperature", codificar(self.temperatura)),
+                ("max_tokens", codificar(self.max_tokens)),
+            ]
         }
+    
+    def _convertir_function_call(self, function_call):
+        """
+        Convierte el modo de llamada a funciones al campo tool_choice.
         
-        # Agregar funciones si existen
-        if functions is not None:
-            data["functions"] = functions
-            data["function_call"] = function_call
+        Args:
+            function_call (str/dict): "auto", "none", "required", nombre de función o {"name": ...}
+            
+        Returns:
+            str/dict: Valor de tool_choice
+        """
+        if function_call in ("auto", "none", "required"):
+            return function_call
+        if isinstance(function_call, dict):
+            function_call = function_call["name"]
+        return {"type": "function", "function": {"name": function_call}}
+    
+    def _codificar_mensaje(self, mensaje):
+        """
+        Codifica un mensaje del historial, incluidas las llamadas a herramientas y sus resultados.
         
-        try:
-            print("Enviando consulta a OpenAI...")
-            response = urequests.post(self.url, headers=headers, data=json.dumps(data).encode("utf-8"))
+        Args:
+            mensaje (Message): Mensaje del historial
             
-            if response.status_code == 200:
-                result = response.json()
-                response.close()
-                return result
-            else:
-                print(f"Error: {response.status_code} - {response.text}")
-                response.close()
-                return None
-        except Exception as e:
-            print(f"Excepción: {e}")
-            return None
+        Returns:
+            bytes: Mensaje o mensajes (separados por comas) en formato OpenAI
+        """
+        if "tool_calls" in mensaje:
+            return codificar({
+                "role": "assistant",
+                "content": None,
+                "tool_calls": [{
+                    "id": llamada["id"],
+                    "type": "function",
+                    "function": {"name": llamada["name"], "arguments": llamada["arguments"]}
+                } for llamada in mensaje["tool_calls"]]
+            })
+        
+        # OpenAI espera un mensaje "tool" por resultado
+        if "tool_results" in mensaje:
+            return b", ".join([
+                codificar({"role": "tool", "tool_call_id": resultado["id"], "content": resultado["content"]})
+                for resultado in mensaje["tool_results"]
+            ])
+        
+        return TEXTO_ESTANDAR.codificar(mensaje)
+    
+    def _codificar_system(self, system):
+        """
+        Codifica el mensaje de sistema como primer mensaje de la conversación.
+        
+        Args:
+            system (str): Mensaje de sistema
+            
+        Returns:
+            bytes: Mensaje {"role": "system"} codificado
+        """
+        return codificar({"role": "system", "content": system})
+    
+    def consultar_lote(self, conversaciones, functions=None, function_call="auto", concurrencia=4, intervalo=10):
+        """
+        Procesa muchas conversaciones independientes con la Batch API de OpenAI
+        (mitad de precio, resultados en minutos u horas).
+        
+        Args:
+            conversaciones (dict/list): {custom_id: mensajes} o lista de listas de mensajes
+            functions (list): Lista opcional de funciones disponibles para el modelo
+            function_call (str): Modo de llamada a funciones
+            concurrencia (int): No se usa, el proveedor procesa el lote
+            intervalo (float): Espera inicial entre consultas del estado del lote, en segundos
+            
+        Yields:
+            tuple: (custom_id, respuesta) con la respuesta en formato estandarizado o un error
+                   estructurado si esa conversación falló
+        """
+        from mcp_batch import lote_openai
+        return lote_openai(self, conversaciones, functions, function_call, intervalo)
     
     def _procesar_respuesta(self, response):
         """
@@ -85,13 +174,21 @@ class OpenAIMCPAdapter(MCPAdapter):
         """
         mensaje_obj = response["choices"][0]["message"]
         
-        # Verificar si es una llamada a función
-        if "function_call" in mensaje_obj:
-            return {
-                "type": "function_call",
+        # Verificar si son llamadas a herramientas (una o varias en paralelo)
+        if mensaje_obj.get("tool_calls"):
+            return self._respuesta_llamadas([{
+                "id": tool_call["id"],
+                "name": tool_call["function"]["name"],
+                "arguments": tool_call["function"]["arguments"]
+            } for tool_call in mensaje_obj["tool_calls"]])
+        
+        # Formato antiguo de functions
+        if mensaje_obj.get("function_call"):
+            return self._respuesta_llamadas([{
+                "id": "call_0",
                 "name": mensaje_obj["function_call"]["name"],
                 "arguments": mensaje_obj["function_call"]["arguments"]
-            }
+            }])
         else:
             # Es una respuesta de texto normal
             respuesta_assistant = mensaje_obj["content"]
@@ -104,15 +201,86 @@ class OpenAIMCPAdapter(MCPAdapter):
                 "content": respuesta_assistant
             }
     
+    def _extraer_uso(self, response):
+        """
+        Extrae el consumo de tokens del campo usage de la respuesta de OpenAI.
+        
+        Args:
+            response (dict): Respuesta cruda de OpenAI
+            
+        Returns:
+            dict: {"input_tokens": int, "output_tokens": int} o None si no se informa
+        """
+        uso = response.get("usage")
+        if not uso:
+            return None
+        return {
+            "input_tokens": uso.get("prompt_tokens", 0),
+            "output_tokens": uso.get("completion_tokens", 0)
+        }
+    
+    def _procesar_evento_stream(self, evento, datos, estado):
+        """
+        Procesa un fragmento del stream de OpenAI (chat.completion.chunk).
+        
+        Args:
+            evento (str): Nombre del evento SSE (OpenAI no lo utiliza)
+            datos (str): JSON del fragmento o "[DONE]" al terminar
+            estado (dict): Estado acumulado del stream
+            
+        Returns:
+            list: Fragmentos estandarizados
+        """
+        if datos == "[DONE]":
+            return []
+        
+        chunk = json.loads(datos)
+        if not chunk.get("choices"):
+            return []
+        
+        delta = chunk["choices"][0].get("delta", {})
+        fragmentos = []
+        
+        # Fragmentos de llamadas a herramientas: cada una se identifica por su índice,
+        # el id y el nombre llegan primero y los argumentos por partes
+        if delta.get("tool_calls"):
+            llamadas = estado["llamadas"]
+            for tool_call in delta["tool_calls"]:
+                indice = tool_call.get("index", len(llamadas) - 1)
+                if indice >= len(llamadas):
+                    llamadas.append({"id": tool_call.get("id"), "name": None, "arguments": ""})
+                function = tool_call.get("function", {})
+                nombre = function.get("name")
+                argumentos = function.get("arguments") or ""
+                if nombre:
+                    llamadas[indice]["name"] = nombre
+                llamadas[indice]["arguments"] += argumentos
+                fragmentos.append({
+                    "type": "function_call_delta",
+                    "index": indice,
+                    "name": nombre,
+                    "arguments": argumentos
+                })
+        
+        # Fragmento de texto
+        elif delta.get("content"):
+            estado["texto"] += delta["content"]
+            fragmentos.append({
+                "type": "text_delta",
+                "content": delta["content"]
+            })
+        
+        return fragmentos
+    
     def _convertir_funciones(self, functions):
         """
-        Convierte las funciones al formato de OpenAI (que es el formato estándar).
-        En este caso, no se requiere conversión ya que OpenAI es la referencia.
+        Convierte las funciones al formato tools de OpenAI.
+        El esquema de cada función ya es el estándar, solo se envuelve.
         
         Args:
             functions (list): Funciones en formato OpenAI
             
         Returns:
-            list: Las mismas funciones sin modificar
+            list: Herramientas {"type": "function", "function": ...}
         """
-        return functions
\ No newline at end of file
+        return [{"type": "function", "function": func} for func in functions]
\ No newline at end of file
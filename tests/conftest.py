@@ -0,0 +1,76 @@
+# conftest.py
+import os
+import sys
+
+import pytest
+
+# Los módulos del proyecto están en la raíz del repositorio, sin paquete
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import mcp_resilience
+from mcp_factory import MCPFactory
+from mcp_mock_server import MockProviderServer
+from mcp_tools import ToolRegistry
+
+PROVEEDORES = ("openai", "claude", "gemini")
+
+
+def detener(servidor):
+    """Detiene un servidor simulado y comprueba que no falló al atender ninguna petición."""
+    servidor.cerrar()
+    assert not servidor.errores_internos
+
+
+@pytest.fixture(scope="session")
+def servidor():
+    """Servidor simulado compartido por todas las pruebas, en su propio hilo."""
+    servidor = MockProviderServer(palabras=4)
+    servidor.iniciar_en_hilo()
+    yield servidor
+    detener(servidor)
+
+
+@pytest.fixture
+def crear_servidor():
+    """Arranca servidores simulados adicionales (latencia, errores...) y los detiene al terminar la prueba."""
+    servidores = []
+    def crear(**opciones):
+        servidor = MockProviderServer(**opciones)
+        servidor.iniciar_en_hilo()
+        servidores.append(servidor)
+        return servidor
+    yield crear
+    for servidor in servidores:
+        detener(servidor)
+
+
+@pytest.fixture(autouse=True)
+def interruptores_limpios():
+    """Los interruptores de circuito son globales por proveedor: cada prueba empieza con ellos cerrados."""
+    mcp_resilience._interruptores.clear()
+    yield
+    mcp_resilience._interruptores.clear()
+
+
+@pytest.fixture
+def crear_adapter(servidor):
+    """Crea adaptadores dirigidos al servidor simulado."""
+    def crear(proveedor, destino=None):
+        adapter = MCPFactory.create_adapter(proveedor, "clave-de-prueba", max_tokens=50)
+        return (destino or servidor).configurar(adapter)
+    return crear
+
+
+@pytest.fixture
+def registry():
+    """Registro con una única herramienta numérica (el servidor la llama con a=1 y b=1)."""
+    registro = ToolRegistry()
+    registro.registrar("suma", lambda a, b: a + b, {
+        "description": "Suma a y b.",
+        "args": {
+            "a": {"type": "number", "description": "Primer sumando"},
+            "b": {"type": "number", "description": "Segundo sumando"}
+        },
+        "required": ["a", "b"]
+    })
+    return registro
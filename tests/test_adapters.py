@@ -0,0 +1,211 @@
+# test_adapters.py
+import asyncio
+import json
+
+import pytest
+
+from conftest import PROVEEDORES
+
+
+@pytest.mark.parametrize("proveedor", PROVEEDORES)
+def test_consultar(crear_adapter, proveedor):
+    adapter = crear_adapter(proveedor)
+    respuesta = adapter.consultar([{"role": "user", "content": "Estado del sensor"}])
+    
+    assert respuesta["type"] == "text"
+    assert respuesta["content"].startswith("sensor lectura")
+    assert respuesta["usage"]["output_tokens"] == 4
+    # La respuesta queda en el historial como mensaje del asistente
+    assert [m["role"] for m in adapter.historial] == ["user", "assistant"]
+
+
+@pytest.mark.parametrize("proveedor", PROVEEDORES)
+def test_consultar_con_herramientas(crear_adapter, registry, proveedor):
+    adapter = crear_adapter(proveedor)
+    respuesta = adapter.consultar([{"role": "user", "content": "Suma 1 y 1"}], functions=registry.esquemas())
+    
+    assert respuesta["type"] == "function_call"
+    assert respuesta["name"] == "suma"
+    assert [llamada["name"] for llamada in respuesta["calls"]] == ["suma"]
+    assert registry.ejecutar(respuesta["name"], respuesta["arguments"]) == 2
+
+
+@pytest.mark.parametrize("proveedor", PROVEEDORES)
+def test_consultar_stream(crear_adapter, proveedor):
+    adapter = crear_adapter(proveedor)
+    fragmentos = list(adapter.consultar_stream([{"role": "user", "content": "Estado del sensor"}]))
+    
+    final = fragmentos[-1]
+    texto = "".join(f["content"] for f in fragmentos[:-1] if f["type"] == "text_delta")
+    assert final["type"] == "text"
+    assert final["content"] == texto
+    assert adapter.historial[-1]["content"] == texto
+
+
+@pytest.mark.parametrize("proveedor", PROVEEDORES)
+def test_consultar_stream_con_herramientas(crear_adapter, registry, proveedor):
+    adapter = crear_adapter(proveedor)
+    fragmentos = list(adapter.consultar_stream([{"role": "user", "content": "Suma 1 y 1"}],
+                                               functions=registry.esquemas()))
+    
+    final = fragmentos[-1]
+    assert final["type"] == "function_call"
+    assert registry.ejecutar(final["name"], final["arguments"]) == 2
+
+
+@pytest.mark.parametrize("proveedor", PROVEEDORES)
+def test_consultar_async(crear_adapter, proveedor):
+    adapters = [crear_adapter(proveedor) for _ in range(3)]
+    
+    async def consultar_todos():
+        return await asyncio.gather(*[
+            adapter.consultar_async([{"role": "user", "content": f"Sensor {i}"}])
+            for i, adapter in enumerate(adapters)
+        ])
+    
+    respuestas = asyncio.run(consultar_todos())
+    assert [r["type"] for r in respuestas] == ["text"] * 3
+    assert all(len(adapter.historial) == 2 for adapter in adapters)
+
+
+@pytest.mark.parametrize("proveedor", PROVEEDORES)
+def test_run_agent(crear_adapter, registry, proveedor):
+    adapter = crear_adapter(proveedor)
+    respuesta = adapter.run_agent(registry, "Suma 1 y 1", max_iteraciones=3)
+    
+    assert respuesta["type"] == "text"
+    assert respuesta["agente"]["motivo"] == "completado"
+    assert respuesta["agente"]["iteraciones"] == 2
+    # Petición con la llamada, resultado nativo de herramienta y respuesta final
+    assert adapter.historial[-1]["role"] == "assistant"
+    assert any("tool_results" in mensaje for mensaje in adapter.historial)
+
+
+@pytest.mark.parametrize("proveedor", PROVEEDORES)
+def test_run_agent_async(crear_adapter, registry, proveedor):
+    adapter = crear_adapter(proveedor)
+    respuesta = asyncio.run(adapter.run_agent_async(registry, "Suma 1 y 1", max_iteraciones=3))
+    
+    assert respuesta["type"] == "text"
+    assert respuesta["agente"]["motivo"] == "completado"
+
+
+@pytest.mark.parametrize("proveedor", PROVEEDORES)
+def test_historial_codificado_incrementalmente(crear_adapter, registry, proveedor):
+    # El cuerpo de un adaptador que ha ido codificando el historial turno a turno
+    # debe coincidir con el de uno nuevo que lo codifica de una vez
+    adapter = crear_adapter(proveedor)
+    adapter.run_agent(registry, "Suma 1 y 1", max_iteraciones=3)
+    adapter.consultar([{"role": "user", "content": "¿Y ahora?"}])
+    
+    nuevo = crear_adapter(proveedor)
+    nuevo.historial = list(adapter.historial)
+    assert adapter._preparar_peticion(None, "auto")[2].unir() == nuevo._preparar_peticion(None, "auto")[2].unir()
+
+
+def test_error_http_estructurado(crear_adapter, crear_servidor):
+    caido = crear_servidor(tasa_error=1.0, estado_error=503)
+    adapter = crear_adapter("openai", caido)
+    adapter.reintentos = None
+    
+    respuesta = adapter.consultar([{"role": "user", "content": "Hola"}])
+    assert respuesta["type"] == "error"
+    assert respuesta["status"] == 503
+    assert respuesta["retryable"]
+
+
+def test_error_en_stream_de_claude(crear_adapter):
+    adapter = crear_adapter("claude")
+    adapter.agregar_mensaje("user", "Hola")
+    estado = {"texto": "", "llamadas": []}
+    adapter._procesar_evento_stream("content_block_delta", json.dumps(
+        {"type": "content_block_delta", "delta": {"type": "text_delta", "text": "Ho"}}), estado)
+    adapter._procesar_evento_stream("error", json.dumps(
+        {"type": "error", "error": {"type": "overloaded_error", "message": "Overloaded"}}), estado)
+    
+    respuesta = adapter._finalizar_stream(estado)
+    assert respuesta["type"] == "error"
+    assert respuesta["status"] == 529
+    assert respuesta["retryable"]
+    # El stream interrumpido no deja un mensaje del asistente en el historial
+    assert len(adapter.historial) == 1
+
+
+def test_candidato_bloqueado_de_gemini(crear_adapter):
+    adapter = crear_adapter("gemini")
+    adapter.agregar_mensaje("user", "Hola")
+    
+    respuesta = adapter._procesar_respuesta({"candidates": [{"finishReason": "SAFETY"}]})
+    assert respuesta["type"] == "error"
+    assert respuesta["finish_reason"] == "SAFETY"
+    assert not respuesta["retryable"]
+    assert len(adapter.historial) == 1
+
+
+def test_lectura_async_con_limite_de_tiempo(crear_servidor):
+    from mcp_transport_async import AsyncKeepAliveTransport
+    
+    # El servidor envía las cabeceras y se detiene entre eventos más que el límite
+    lento = crear_servidor(retardo_fragmento_ms=500)
+    transporte = AsyncKeepAliveTransport(timeout=0.2)
+    cuerpo = json.dumps({"model": "m", "stream": True, "messages": [{"role": "user", "content": "Hola"}]})
+    
+    async def leer():
+        response = await transporte.post(lento.url_base + "/v1/chat/completions", data=cuerpo.encode(), stream=True)
+        try:
+            await response.read()
+        finally:
+            response.close()
+    
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(leer())
+
+
+def test_lote_concurrente(crear_adapter):
+    from mcp_transport_async import AsyncKeepAliveTransport
+    
+    adapter = crear_adapter("gemini")
+    adapter.transporte_async = AsyncKeepAliveTransport()
+    conversaciones = {f"c{i}": [{"role": "user", "content": f"Sensor {i}"}] for i in range(5)}
+    
+    resultados = dict(adapter.consultar_lote(conversaciones, concurrencia=2))
+    assert sorted(resultados) == sorted(conversaciones)
+    assert all(r["type"] == "text" for r in resultados.values())
+    # El bucle propio del lote se cierra junto con sus conexiones
+    assert not adapter.transporte_async._libres
+    
+    # Abandonar el generador a medias cancela las consultas pendientes sin fugas
+    lote = adapter.consultar_lote(conversaciones, concurrencia=2)
+    next(lote)
+    lote.close()
+    assert not adapter.transporte_async._libres
+
+
+def test_lote_concurrente_con_errores(crear_adapter, crear_servidor):
+    caido = crear_servidor(tasa_error=1.0, estado_error=400)
+    adapter = crear_adapter("gemini", caido)
+    
+    resultados = list(adapter.consultar_lote([[{"role": "user", "content": "Hola"}]] * 2))
+    assert len(resultados) == 2
+    assert all(r["type"] == "error" and r["status"] == 400 for _, r in resultados)
+
+
+def test_servidor_registra_sus_fallos_y_se_detiene(crear_adapter):
+    from mcp_mock_server import MockProviderServer
+    
+    servidor = MockProviderServer()
+    servidor.iniciar_en_hilo()
+    
+    async def fallar(escritor, ruta, cuerpo):
+        raise RuntimeError("Fallo interno")
+    servidor._responder = fallar
+    
+    adapter = crear_adapter("openai", servidor)
+    adapter.reintentos = None
+    assert adapter.consultar([{"role": "user", "content": "Hola"}])["type"] == "error"
+    assert [str(e) for e in servidor.errores_internos] == ["Fallo interno"]
+    
+    # cerrar() detiene el bucle del hilo y el puerto deja de aceptar conexiones
+    servidor.cerrar()
+    assert servidor._bucle is None and servidor.servidor is None
+    assert adapter.consultar([{"role": "user", "content": "Hola"}])["type"] == "error"
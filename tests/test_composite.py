@@ -0,0 +1,195 @@
+# test_composite.py
+import asyncio
+import threading
+
+import pytest
+
+from conftest import detener
+from mcp_factory import MCPFactory
+from mcp_journal import ConversationJournal
+from mcp_mock_server import MockProviderServer
+from mcp_singleflight import RequestCoalescer
+
+
+@pytest.fixture(scope="module")
+def caido():
+    """Servidor que responde 503 a todas las peticiones."""
+    servidor = MockProviderServer(tasa_error=1.0, estado_error=503)
+    servidor.iniciar_en_hilo()
+    yield servidor
+    detener(servidor)
+
+
+def crear_router(servidor, caido=None):
+    router = MCPFactory.create_router_adapter([("openai", "clave"), ("claude", "clave"), ("gemini", "clave")])
+    servidor.configurar(router)
+    if caido is not None:
+        caido.configurar(router.adapters[0])
+    return router
+
+
+def test_router_cambia_de_proveedor_si_falla(servidor, caido):
+    router = crear_router(servidor, caido)
+    
+    respuesta = router.consultar([{"role": "user", "content": "Estado del sensor"}])
+    assert respuesta["type"] == "text"
+    assert router.ultimo_elegido is not router.adapters[0]
+    assert router.estadisticas[0]["errores"] == 1
+    # El proveedor que falló pasa al final mientras su tasa de errores no baje
+    assert router.orden()[-1] == 0
+    
+    # El contexto sigue en el historial común (Gemini lo codifica con el rol "model")
+    router.consultar([{"role": "user", "content": "¿Y ahora?"}])
+    assert [m["role"] for m in router.historial] == ["user", "assistant", "user", "assistant"]
+
+
+def test_router_stream_y_async(servidor, caido):
+    router = crear_router(servidor, caido)
+    
+    fragmentos = list(router.consultar_stream([{"role": "user", "content": "Hola"}]))
+    assert fragmentos[-1]["type"] == "text"
+    
+    respuesta = asyncio.run(router.consultar_async([{"role": "user", "content": "Otra vez"}]))
+    assert respuesta["type"] == "text"
+    assert router.estadisticas[0]["peticiones"] >= 1
+
+
+def test_router_usa_cache_y_agrupador(servidor):
+    from mcp_cache import ResponseCache
+    
+    router = crear_router(servidor)
+    router.cache = ResponseCache()
+    router.coalescer = RequestCoalescer()
+    registros = []
+    router.hooks_metricas.append(registros.append)
+    
+    primera = router.consultar([{"role": "user", "content": "Estado"}])
+    assert all(adapter.coalescer is router.coalescer for adapter in router.adapters)
+    peticiones = servidor.peticiones
+    router.historial = router.historial[:1]
+    segunda = asyncio.run(router.consultar_async())
+    
+    assert segunda["content"] == primera["content"]
+    assert servidor.peticiones == peticiones
+    assert registros[-1]["cache"] and registros[-1]["proveedor"] == "Router"
+
+
+def test_router_devuelve_error_si_todos_fallan(caido):
+    router = crear_router(caido)
+    respuesta = router.consultar([{"role": "user", "content": "Hola"}])
+    assert respuesta["type"] == "error"
+    assert all(e["errores"] == 1 for e in router.estadisticas)
+
+
+@pytest.mark.parametrize("crear", [MCPFactory.create_router_adapter, MCPFactory.create_hedged_adapter])
+def test_compuestos_estiman_tokens(servidor, registry, crear):
+    adapter = servidor.configurar(crear([("openai", "clave"), ("claude", "clave")]))
+    adapter.agregar_mensaje("user", "Estado del sensor")
+    
+    sin_herramientas = adapter.estimar_tokens()
+    assert adapter.estimar_tokens(registry.esquemas()) > sin_herramientas > 0
+
+
+def test_router_conserva_los_fijados_al_compactar(servidor, tmp_path):
+    # Con un diario pequeño se compacta a menudo, también tras la respuesta del adaptador interno
+    for max_bytes in range(200, 900, 50):
+        ruta = str(tmp_path / f"diario_{max_bytes}")
+        router = crear_router(servidor)
+        router.journal = ConversationJournal(ruta, max_bytes=max_bytes)
+        router.agregar_mensaje("user", "Regla fija", fijar=True)
+        for i in range(10):
+            router.consultar([{"role": "user", "content": f"Pregunta {i}"}])
+        router.journal.cerrar()
+        
+        with open(ruta) as f:
+            assert '"pin": true' in f.read()
+
+
+def test_hedged_devuelve_la_primera_respuesta(servidor, caido):
+    hedged = servidor.configurar(MCPFactory.create_hedged_adapter([("openai", "clave"), ("claude", "clave")]))
+    caido.configurar(hedged.adapters[0])
+    
+    respuesta = hedged.consultar([{"role": "user", "content": "Hola"}])
+    assert respuesta["type"] == "text"
+    assert hedged.ultimo_ganador is hedged.adapters[1]
+
+
+def test_coalescer_agrupa_peticiones_identicas(crear_servidor):
+    lento = crear_servidor(latencia_ms=150)
+    coalescer = RequestCoalescer()
+    
+    def crear(texto):
+        adapter = lento.configurar(MCPFactory.create_adapter("openai", "clave"))
+        adapter.coalescer = coalescer
+        adapter.agregar_mensaje("user", texto)
+        return adapter
+    
+    adapters = [crear("Alerta") for _ in range(4)] + [crear("Otra alerta")]
+    respuestas = []
+    hilos = [threading.Thread(target=lambda a=a: respuestas.append(a.consultar())) for a in adapters]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    
+    assert [r["type"] for r in respuestas] == ["text"] * 5
+    assert lento.peticiones == 2
+    assert coalescer.agrupadas == 3
+    # Cada adaptador guarda la respuesta en su propio historial
+    assert all(len(adapter.historial) == 2 for adapter in adapters)
+
+
+def test_coalescer_async(crear_servidor):
+    lento = crear_servidor(latencia_ms=100)
+    coalescer = RequestCoalescer()
+    adapters = []
+    for _ in range(3):
+        adapter = lento.configurar(MCPFactory.create_adapter("gemini", "clave"))
+        adapter.coalescer = coalescer
+        adapters.append(adapter)
+    
+    async def consultar_todos():
+        return await asyncio.gather(*[a.consultar_async([{"role": "user", "content": "Alerta"}]) for a in adapters])
+    
+    respuestas = asyncio.run(consultar_todos())
+    assert [r["type"] for r in respuestas] == ["text"] * 3
+    assert lento.peticiones == 1
+
+
+def test_hedged_comparte_diario_y_fijados(servidor, tmp_path):
+    ruta = str(tmp_path / "diario")
+    hedged = servidor.configurar(MCPFactory.create_hedged_adapter([("openai", "clave"), ("claude", "clave")]))
+    hedged.journal = ConversationJournal(ruta, max_bytes=300)
+    hedged.agregar_mensaje("user", "Regla fija", fijar=True)
+    for i in range(6):
+        hedged.consultar([{"role": "user", "content": f"Pregunta {i}"}])
+    hedged.journal.cerrar()
+    
+    # La respuesta del ganador queda en el diario y la compactación conserva el fijado
+    system, mensajes = ConversationJournal(ruta).cargar()
+    assert mensajes[-1][0].role == "assistant"
+    assert mensajes[0][0].content == "Regla fija" and mensajes[0][1]
+
+
+def test_hedged_usa_cache_y_metricas(servidor):
+    from mcp_cache import ResponseCache
+    
+    hedged = servidor.configurar(MCPFactory.create_hedged_adapter([("openai", "clave"), ("claude", "clave")]))
+    hedged.cache = ResponseCache()
+    registros = []
+    hedged.hooks_metricas.append(registros.append)
+    
+    primera = hedged.consultar([{"role": "user", "content": "Estado"}])
+    peticiones = servidor.peticiones
+    hedged.historial = hedged.historial[:1]
+    segunda = hedged.consultar()
+    
+    assert segunda["content"] == primera["content"]
+    assert servidor.peticiones == peticiones
+    assert registros[-1]["cache"] and registros[-1]["proveedor"] == "Hedged"
+    assert registros[0]["estado"] == "ok" and registros[0]["proveedor"] in ("OpenAI", "Claude")
+    # El bucle de eventos se conserva entre consultas síncronas
+    bucle = hedged._bucle
+    hedged.consultar([{"role": "user", "content": "Otra"}])
+    assert hedged._bucle is bucle
+    hedged.cerrar()
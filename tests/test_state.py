@@ -0,0 +1,178 @@
+# test_state.py
+import time
+
+import pytest
+
+from mcp_factory import MCPFactory
+from mcp_history import HistoryPolicy
+from mcp_journal import ConversationJournal
+from mcp_resilience import CircuitBreaker
+
+
+def test_diario_reanuda_tras_reinicio(servidor, tmp_path):
+    ruta = str(tmp_path / "diario")
+    adapter = servidor.configurar(MCPFactory.create_adapter("claude", "clave"))
+    adapter.journal = ConversationJournal(ruta, max_bytes=600, intervalo=4)
+    adapter.system = "Eres un asistente de sensores"
+    adapter.agregar_mensaje("user", "Regla fija", fijar=True)
+    for i in range(12):
+        adapter.consultar([{"role": "user", "content": f"Pregunta {i}"}])
+    adapter.journal.cerrar()
+    
+    # Un adaptador nuevo, como tras un reinicio, recupera sistema, fijados y la cola
+    reanudado = servidor.configurar(MCPFactory.create_adapter("claude", "clave"))
+    reanudado.journal = ConversationJournal(ruta, max_bytes=600, intervalo=4)
+    reanudado.reanudar(max_mensajes=6)
+    
+    assert reanudado.system == "Eres un asistente de sensores"
+    assert reanudado.historial[0]["content"] == "Regla fija"
+    assert [m["content"] for m in reanudado.historial[-2:]] == [m["content"] for m in adapter.historial[-2:]]
+    assert reanudado.historial[1]["role"] == "user"
+    assert reanudado.consultar([{"role": "user", "content": "Sigo aquí"}])["type"] == "text"
+
+
+def test_diario_ignora_linea_cortada(tmp_path):
+    ruta = str(tmp_path / "diario")
+    diario = ConversationJournal(ruta)
+    adapter = MCPFactory.create_adapter("openai", "clave")
+    adapter.journal = diario
+    adapter.agregar_mensaje("user", "Hola")
+    adapter.agregar_mensaje("assistant", "Buenas")
+    diario.cerrar()
+    # Apagado a mitad de escritura
+    with open(ruta, "ab") as f:
+        f.write(b'{"role": "user", "cont')
+    
+    system, mensajes = ConversationJournal(ruta).cargar()
+    assert [m.content for m, fijado in mensajes] == ["Hola", "Buenas"]
+
+
+def test_diario_cuenta_solo_mensajes(tmp_path):
+    ruta = str(tmp_path / "diario")
+    adapter = MCPFactory.create_adapter("openai", "clave")
+    adapter.journal = ConversationJournal(ruta, intervalo=2)
+    for i in range(4):
+        adapter.agregar_mensaje("system", f"Sistema {i}")
+        adapter.agregar_mensaje("user", f"Pregunta {i}")
+        adapter.agregar_mensaje("assistant", f"Respuesta {i}")
+    
+    # Los cambios de sistema no ocupan sitio en la cola, con el índice en memoria o leído de flash
+    for diario in (adapter.journal, ConversationJournal(ruta, intervalo=2)):
+        system, mensajes = diario.cargar(max_mensajes=4)
+        assert system == "Sistema 3"
+        assert [m.content for m, fijado in mensajes] == ["Pregunta 2", "Respuesta 2", "Pregunta 3", "Respuesta 3"]
+    
+    sin_diario = MCPFactory.create_adapter("openai", "clave")
+    with pytest.raises(ValueError):
+        sin_diario.reanudar()
+
+
+def test_politica_de_historial_conserva_fijados(servidor):
+    adapter = servidor.configurar(MCPFactory.create_adapter("openai", "clave"))
+    adapter.politica_historial = HistoryPolicy(max_mensajes=4)
+    adapter.agregar_mensaje("user", "Regla fija", fijar=True)
+    adapter.agregar_mensaje("assistant", "Entendido")
+    for i in range(5):
+        adapter.consultar([{"role": "user", "content": f"Pregunta {i}"}])
+    
+    contenidos = [m["content"] for m in adapter.historial]
+    assert contenidos[0] == "Regla fija"
+    assert "Pregunta 4" in contenidos
+    assert "Pregunta 0" not in contenidos
+    assert adapter.historial[0]["role"] == "user"
+
+
+def test_interruptor_deja_pasar_una_sola_prueba():
+    interruptor = CircuitBreaker(umbral_fallos=2, tiempo_apertura=0.1)
+    interruptor.registrar_fallo()
+    assert interruptor.permitir() == 0
+    interruptor.registrar_fallo()
+    assert interruptor.estado == "abierto"
+    assert interruptor.permitir() > 0
+    
+    time.sleep(0.15)
+    assert interruptor.permitir() == 0
+    assert interruptor.estado == "semiabierto"
+    # Mientras la prueba está en curso el resto sigue fallando al instante
+    assert interruptor.permitir() > 0
+    
+    interruptor.registrar_fallo()
+    assert interruptor.estado == "abierto"
+    time.sleep(0.15)
+    assert interruptor.permitir() == 0
+    interruptor.registrar_exito()
+    assert interruptor.estado == "cerrado"
+    assert interruptor.permitir() == 0
+
+
+def test_interruptor_libera_una_prueba_perdida():
+    interruptor = CircuitBreaker(umbral_fallos=1, tiempo_apertura=0.1)
+    interruptor.registrar_fallo()
+    time.sleep(0.15)
+    assert interruptor.permitir() == 0
+    # La prueba no informa nunca (tarea cancelada): pasado el tiempo se permite otra
+    time.sleep(0.15)
+    assert interruptor.permitir() == 0
+
+
+def test_pausa_por_limite_no_la_borra_un_exito():
+    interruptor = CircuitBreaker()
+    interruptor.pausar(5)
+    interruptor.registrar_exito()
+    assert interruptor.permitir() > 0
+
+
+def test_estimacion_de_tokens(servidor, registry):
+    adapter = servidor.configurar(MCPFactory.create_adapter("openai", "clave"))
+    adapter.agregar_mensaje("user", "Resume el estado de los sensores de la planta")
+    base = adapter.estimar_tokens()
+    assert base > 0
+    assert adapter.estimar_tokens(registry.esquemas()) > base
+    adapter.agregar_mensaje("assistant", "Todo estable")
+    assert adapter.estimar_tokens() > base
+
+
+def test_cache_caduca_en_ram_y_sin_uso(servidor, registry, tmp_path):
+    from mcp_cache import ResponseCache
+    
+    cache = ResponseCache(directorio=str(tmp_path / "cache"), ttl=0.2)
+    cache.guardar("k", {"type": "text", "content": "Hola", "usage": {"input_tokens": 5, "output_tokens": 2}})
+    # Una entrada recargada desde flash conserva su marca de tiempo en RAM
+    cache._entradas.clear()
+    cache._bytes = 0
+    respuesta = cache.obtener("k")
+    assert respuesta == {"type": "text", "content": "Hola"}
+    
+    time.sleep(0.3)
+    assert cache.obtener("k") is None
+    assert not cache._entradas and cache._bytes == 0
+    
+    # Las respuestas de la caché no cuentan para el presupuesto de tokens del agente
+    adapter = servidor.configurar(MCPFactory.create_adapter("openai", "clave"))
+    adapter.cache = ResponseCache()
+    assert adapter.run_agent(registry, "Suma 1 y 1")["agente"]["tokens"] > 0
+    adapter.historial = []
+    respuesta = adapter.run_agent(registry, "Suma 1 y 1")
+    assert respuesta["type"] == "text"
+    assert respuesta["agente"]["tokens"] == 0
+
+
+def test_tabla_bpe_ordenada_en_flash(tmp_path):
+    from mcp_tokens import TokenEstimator
+    
+    vocabulario = sorted(["sen", "sensor", "es", "tá", "ta", "ble", "esta", "ñ", "lectura", "lec"])
+    ruta = tmp_path / "tokens.txt"
+    ruta.write_text("\n".join(vocabulario) + "\n", encoding="utf-8")
+    estimador = TokenEstimator("openai", ruta_tabla=str(ruta))
+    
+    tabla = estimador._tabla()
+    assert all(token in tabla for token in vocabulario)
+    assert not any(token in tabla for token in ("a", "sens", "lecturas", "zzz", ""))
+    # sensor, es + tá, ble, lectura + ñ; "x" no está y cuenta un token por byte
+    assert estimador.estimar_texto("sensor está ble lecturañ x") == 1 + 2 + 1 + 2 + 1
+    
+    # Una tabla sin ordenar no se usa: se vuelve a la heurística
+    desordenada = tmp_path / "desordenada.txt"
+    desordenada.write_text("zeta\nalfa\n", encoding="utf-8")
+    estimador = TokenEstimator("openai", ruta_tabla=str(desordenada))
+    assert estimador._tabla() is None and estimador.estimar_texto("hola") > 0
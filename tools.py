@@ -1,4 +1,6 @@
 # my_functions.py
+from mcp_tools import ToolRegistry, esquema_desde_meta
+
 def suma(a, b):
     """
     hola mundo
@@ -41,24 +43,16 @@ FUNCTION_META = {
 
 
 def build_schema_from_metadata(func_name, meta):
-    return {
-        "name": func_name,
-        "description": meta["description"],
-        "parameters": {
-            "type": "object",
-            "properties": meta["args"],
-            "required": meta["required"]
-        }
-    }
+    return esquema_desde_meta(func_name, meta)
 
 def build_functions_list():
-    functions_list = []
-    for fname, meta in FUNCTION_META.items():
-        schema = build_schema_from_metadata(fname, meta)
-        functions_list.append(schema)
-    return functions_list
+    return registry.esquemas()
+
+# Registro con las funciones y sus esquemas; la lista se construye una sola vez
+registry = ToolRegistry()
+registry.registrar_meta(globals(), FUNCTION_META)
 
-functions_list_data = build_functions_list()
+functions_list_data = registry.esquemas()
 # Ahora functions_list se ve como
 # [
 #   {